@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ConcertConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'concert'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (registers the signal handlers)
@@ -2,14 +2,57 @@ from collections import defaultdict, namedtuple
 from collections.abc import Sequence, Mapping
 import itertools
 import re
-import time
 from typing import Any, Callable
 
-from core.banking import generate_bank_id
+from django.db import transaction
+
+from core.banking import allocate_bank_id
+from core.cache import LRUCache
 #from core.templatetags.currency_filter import plural
 
 from core.models import Civility
-from .models import Event, Reservation, ReservationChoiceCount
+from .models import Choice, Event, Reservation, ReservationChoiceCount
+
+
+CatalogChoice = namedtuple("CatalogChoice", ("key", "choice"))
+CapacitySnapshot = namedtuple("CapacitySnapshot", ("event", "max_seats", "reserved_seats"))
+
+_choice_catalogs: LRUCache[tuple[CatalogChoice, ...]] = LRUCache()
+# Short lived: the seats are reserved by all worker processes.  The
+# reservation itself checks the capacity in the database anyway.
+_capacity_snapshots: LRUCache[CapacitySnapshot] = LRUCache(ttl=10.0)
+
+
+def get_choice_catalog(event_id: int) -> tuple[CatalogChoice, ...]:
+    """Choices of an event, with their form input keys
+
+    Shared between requests: the model instances in it must not be modified."""
+    return _choice_catalogs.get_or_build(event_id, lambda: tuple(
+        CatalogChoice(key=f"counter0_ch_{choice.id}", choice=choice)
+        for choice in Choice.objects.filter(available_in_id=event_id).order_by("id")))
+
+
+def get_capacity_snapshot(event_id: int) -> CapacitySnapshot:
+    """Event with its seat counters as they were recently
+
+    Raises Event.DoesNotExist.  Shared between requests: the event in it must
+    not be modified."""
+    def build() -> CapacitySnapshot:
+        event = Event.objects.get(pk=event_id)
+        return CapacitySnapshot(event=event, max_seats=event.max_seats, reserved_seats=event.reserved_seats)
+    return _capacity_snapshots.get_or_build(event_id, build)
+
+
+def invalidate_choice_catalog(event_id: int) -> None:
+    _choice_catalogs.invalidate(event_id)
+
+
+def invalidate_capacity_snapshot(event_id: int | None = None) -> None:
+    "Forget the capacity snapshot of an event (or of all events)"
+    if event_id is None:
+        _capacity_snapshots.clear()
+    else:
+        _capacity_snapshots.invalidate(event_id)
 
 
 class ReservationForm:
@@ -79,10 +122,8 @@ class ReservationForm:
         MAX_ALLOWED = 25
         total_due_in_cents = 0
         total_choices = 0
-        idx = 0
-        for choice in self.event.choice_set.all():
+        for key, choice in get_choice_catalog(self.event.id):
             errors: list[str] = []
-            key = f"counter{idx}_ch_{choice.id}"
             try:
                 val = int(self.data[key])
             except ValueError:
@@ -104,8 +145,13 @@ class ReservationForm:
         self.total_due_in_cents = total_due_in_cents
 
     def save(self) -> Reservation | None:
-        if self.is_valid():
-            if sum(chc.value for chc in self.choices) + self.event.occupied_seats() > self.event.max_seats:
+        if not self.is_valid():
+            return None
+        # Outside of the transaction: see BankIdAllocator
+        bank_id = allocate_bank_id()
+        with transaction.atomic():
+            places = sum(chc.value for chc in self.choices)
+            if not self.event.reserve_seats(places):
                 self.errors.append(f"Il n'y a plus assez de places.  Contactez nous: {self.event.contact_email}")
                 return None
             reservation = Reservation(
@@ -116,14 +162,12 @@ class ReservationForm:
                 email=self.email.value.strip(),
                 accepts_rgpd_reuse=self.accepts_rgpd_reuse.value,
                 total_due_in_cents=self.total_due_in_cents,
-                bank_id=generate_bank_id(time.time(), Reservation.objects.count()),
+                places=places,
+                bank_id=bank_id,
             )
-            reservation.save()
-            for inpt in self.choices:
-                if inpt.value < 1:
-                    continue
-                reservation_item_count = ReservationChoiceCount(
-                    reservation=reservation, choice=inpt.choice, count=inpt.value)
-                reservation_item_count.save()
-                reservation.reservationchoicecount_set.add(reservation_item_count)
+            reservation.save(seats_reserved=True)
+            ReservationChoiceCount.objects.bulk_create(
+                ReservationChoiceCount(reservation=reservation, choice=inpt.choice, count=inpt.value)
+                for inpt in self.choices
+                if inpt.value > 0)
             return reservation
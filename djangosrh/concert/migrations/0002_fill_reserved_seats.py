@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+def fill_reserved_seats(apps, schema_editor):
+    BaseEvent = apps.get_model("core", "BaseEvent")
+    ReservationChoiceCount = apps.get_model("concert", "ReservationChoiceCount")
+    for event_id, places in (ReservationChoiceCount.objects
+                             .values_list("reservation__event_id")
+                             .annotate(places=models.Sum("count"))):
+        BaseEvent.objects.filter(pk=event_id).update(reserved_seats=places)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_baseevent_reserved_seats'),
+        ('concert', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_reserved_seats, migrations.RunPython.noop),
+    ]
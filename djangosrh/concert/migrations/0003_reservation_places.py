@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:59
+
+from django.db import migrations, models
+
+
+def fill_places(apps, schema_editor):
+    Reservation = apps.get_model("concert", "Reservation")
+    ReservationChoiceCount = apps.get_model("concert", "ReservationChoiceCount")
+    Reservation.objects.update(places=models.functions.Coalesce(
+        models.Subquery(ReservationChoiceCount.objects
+                        .filter(reservation=models.OuterRef("pk"))
+                        .values("reservation")
+                        .annotate(total=models.Sum("count"))
+                        .values("total")),
+        0))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('concert', '0002_fill_reserved_seats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='places',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_places, migrations.RunPython.noop),
+    ]
@@ -5,7 +5,7 @@ import uuid
 
 from django.db import models
 
-from core.models import BaseReservation, BaseEvent
+from core.models import BaseReservation, BaseEvent, register_seated_reservation
 
 
 class Event(BaseEvent):
@@ -20,11 +20,7 @@ class Event(BaseEvent):
                                           related_query_name="%(app_label)s_%(class)ss")
 
     def occupied_seats(self) -> int:
-        return (
-            ReservationChoiceCount.objects
-            .filter(reservation__event=self)
-            .aggregate(total=models.Sum("count"))["total"] or 0
-        )
+        return self.reservation_set.aggregate(models.Sum("places", default=0))["places__sum"]
 
     ChoiceSummary = namedtuple("ChoiceSummary", "id,display_text,display_text_plural,column_header,total_count")
     def reservation_choices(self) -> list[ChoiceSummary]:
@@ -74,6 +70,7 @@ class ReservationChoiceCount(models.Model):
         return f"<ReservationChoiceCount {self.id}, {self.count}* from {self.choice}>"
 
 
+@register_seated_reservation
 class Reservation(BaseReservation):
     base_reservation_ptr = models.OneToOneField(BaseReservation,
                                                 on_delete=models.CASCADE,
@@ -85,17 +82,36 @@ class Reservation(BaseReservation):
                               on_delete=models.CASCADE,
                               related_name="%(class)s_set",
                               related_query_name="%(app_label)s_%(class)ss")
+    # Sum of the counts of the ReservationChoiceCounts, see places_subquery
+    places = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = BaseReservation.COUNTER_FIELDS + ("places",)
+    SEATS_FIELD = "places"
 
     class Meta:
         # Specify a unique related name for reverse access
         verbose_name = "Réservation concert"
         verbose_name_plural = "Réservations concert"
 
-    def save(self, **kwargs):
+    def save(self, *, seats_reserved: bool = False, **kwargs):
+        """Save the reservation, taking its places from the event when it is created
+
+        `seats_reserved' tells that they were already taken with
+        BaseEvent.reserve_seats (see ReservationForm.save)."""
+        adding = self._state.adding
         if not hasattr(self, 'base_event') or self.base_event is None:
             self.base_event = self.event.base_event_ptr
         super().save(**kwargs)
-
-    @property
-    def places(self) -> int:
-        return self.reservationchoicecount_set.aggregate(models.Sum('count')).get('count__sum', 0)
+        if adding and not seats_reserved:
+            self.event.take_seats(self.places)
+
+    @classmethod
+    def places_subquery(cls) -> models.Func:
+        "Actual sum of the counts of the ReservationChoiceCounts of the reservation of the outer query"
+        return models.functions.Coalesce(
+            models.Subquery(ReservationChoiceCount.objects
+                            .filter(reservation=models.OuterRef("pk"))
+                            .values("reservation")
+                            .annotate(total=models.Sum("count"))
+                            .values("total")),
+            0)
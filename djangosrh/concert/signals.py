@@ -0,0 +1,70 @@
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.models import BaseEvent
+from .forms import invalidate_capacity_snapshot, invalidate_choice_catalog
+from .models import Choice, Event, Reservation, ReservationChoiceCount
+
+
+def _set_places(reservation_id: int, places: int | models.Expression) -> int | None:
+    """Update the places of a reservation and take or give back the
+    difference from its event, return them (None if it does not exist)"""
+    with transaction.atomic():
+        if (previous := (Reservation.objects.select_for_update()
+                         .filter(pk=reservation_id).values_list("places", "event_id").first())) is None:
+            return None
+        previous_places, event_id = previous
+        Reservation.objects.filter(pk=reservation_id).update(places=places)
+        if isinstance(places, models.Expression):
+            places = Reservation.objects.filter(pk=reservation_id).values_list("places", flat=True).get()
+        if places != previous_places:
+            BaseEvent(pk=event_id).take_seats(places - previous_places)
+        return places
+
+
+@receiver(pre_delete, sender=Reservation)
+def reservation_deleted(sender, instance: Reservation, **kwargs):
+    # Its ReservationChoiceCounts are deleted next, with their places
+    # already given back (see reservation_choice_count_changed)
+    _set_places(instance.pk, 0)
+
+
+def _on_change_and_commit(invalidate, *args) -> None:
+    invalidate(*args)
+    # again once committed: a concurrent request might have cached the
+    # data as it was before this transaction in the meantime
+    transaction.on_commit(lambda: invalidate(*args))
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance: Choice, **kwargs):
+    _on_change_and_commit(invalidate_choice_catalog, instance.available_in_id)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed(sender, instance: Event, **kwargs):
+    _on_change_and_commit(invalidate_capacity_snapshot, instance.pk)
+
+
+# The ReservationChoiceCounts of a new reservation are bulk created (no
+# signal): the reservation itself signals the change of the seat count.
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def reservation_changed(sender, instance: Reservation, **kwargs):
+    _on_change_and_commit(invalidate_capacity_snapshot, instance.event_id)
+
+
+@receiver(post_save, sender=ReservationChoiceCount)
+@receiver(post_delete, sender=ReservationChoiceCount)
+def reservation_choice_count_changed(sender, instance: ReservationChoiceCount, raw: bool = False, **kwargs):
+    if not raw:
+        # The new reservations' places are written by ReservationForm.save
+        # (their ReservationChoiceCounts are bulk created)
+        places = _set_places(instance.reservation_id, Reservation.places_subquery())
+        if places is not None and ReservationChoiceCount.reservation.is_cached(instance):
+            instance.reservation.places = places
+    # Looking up the event of the reservation would cost a query
+    _on_change_and_commit(invalidate_capacity_snapshot)
@@ -1,7 +1,12 @@
 from datetime import datetime, timezone
 from typing import Mapping
+from unittest import mock
 
+from django.db import connection, models
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.banking import BankIdAllocator
 
 from core.models import (
     Civility,
@@ -9,7 +14,6 @@ from core.models import (
 from ..models import (
     Choice,
     Event,
-    Choice,
     Reservation,
     ReservationChoiceCount,
 )
@@ -144,6 +148,52 @@ class IntegrationTestCases(TestCase):
         self.assertEqual(data.places, 6)
         self.assertEqual(data.remaining_amount_due_in_cents(), data.total_due_in_cents)
 
+    def test_ReservationForm__takes_seats_until_the_event_is_full(self):
+        blank_reservation = ReservationForm(self.event)
+        adultes = self.get_input(blank_reservation, "<>Adulte<>")
+        def make_form(count: int) -> ReservationForm:
+            return ReservationForm(self.event, {
+                adultes.name: str(count),
+                "last_name": f"Last ({count})",
+                "accepts_rgpd_reuse": "yes",
+                "email": "full@ev.ent"})
+        Event.objects.filter(pk=self.event.pk).update(max_seats=models.F("reserved_seats") + 10)
+        self.event.refresh_from_db()
+
+        first = make_form(6).save()
+        self.assertIsNotNone(first)
+        self.assertEqual(Event.objects.get(pk=self.event.pk).max_seats - Event.objects.get(pk=self.event.pk).reserved_seats, 4)
+        too_many = make_form(5)
+        self.assertIsNone(too_many.save())
+        self.assertIn("Il n'y a plus assez de places", too_many.errors[0])
+        self.assertIsNotNone(make_form(4).save())
+
+        first.delete()
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertEqual(event.max_seats - event.reserved_seats, 6)
+
+    def test_ReservationForm__save_inserts_all_choices_at_once(self):
+        blank_reservation = ReservationForm(self.event)
+        reservation = ReservationForm(self.event, {
+            **{inpt.name: "1" for inpt in blank_reservation.choices},
+            "last_name": "Last Name (everything)",
+            "accepts_rgpd_reuse": "yes",
+            "email": "every@thi.ng",
+        })
+        self.assertTrue(reservation.is_valid())
+        allocate_bank_id = BankIdAllocator(block_size=2)
+        allocate_bank_id()  # lease outside of the measurement
+        with mock.patch("concert.forms.allocate_bank_id", allocate_bank_id), \
+             CaptureQueriesContext(connection) as ctx:
+            saved = reservation.save()
+        self.assertIsNotNone(saved)
+        self.assertEqual(ReservationChoiceCount.objects.filter(reservation=saved).count(), len(self.choices))
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        # BaseReservation, Reservation and one for all the ReservationChoiceCounts
+        self.assertEqual(len(inserts), 3)
+        # SAVEPOINT, reserve seats (UPDATE + SELECT), 3 INSERTs, RELEASE SAVEPOINT
+        self.assertEqual(len(ctx.captured_queries), 7)
+
 # Local Variables:
 # compile-command: "uv run python ../../manage.py test concert"
 # End:
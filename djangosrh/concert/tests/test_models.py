@@ -1,5 +1,8 @@
 from datetime import date, datetime, timezone
+import io
 
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
 
 from core.models import Civility, Payment, ReservationPayment
@@ -175,6 +178,127 @@ class IntegrationTestCases(TestCase):
         self.assertEqual(self.reservations[2].remaining_amount_due_in_cents(), 2200)
 
 
+class ReceivedInCents(TestCase):
+    def setUp(self):
+        self.event, self.choices, self.reservations = fill_db()
+
+    def test_follows_reservation_payments(self):
+        reservation = Reservation.objects.get(pk=self.reservations[0].pk)
+        self.assertEqual((reservation.received_in_cents, reservation.remaining_due_in_cents), (100, 7800))
+        reservation_payment = ReservationPayment(reservation=reservation, payment=Payment.objects.get(src_id="2025-09124"))
+        reservation_payment.save()
+        self.assertEqual((reservation.received_in_cents, reservation.remaining_due_in_cents), (5555, 2345))
+        reservation_payment.save()  # e.g. to store the confirmation_sent_timestamp
+        reservation_payment.delete()
+        reservation.refresh_from_db()
+        self.assertEqual((reservation.received_in_cents, reservation.remaining_due_in_cents), (100, 7800))
+
+    def test_follows_edited_reservation_payments(self):
+        reservation_payment = ReservationPayment(reservation=self.reservations[0],
+                                                 payment=Payment.objects.get(src_id="2025-09124"))
+        reservation_payment.save()
+        # e.g. in the admin: linked to the wrong reservation, then to the wrong payment
+        reservation_payment.reservation = Reservation.objects.get(pk=self.reservations[1].pk)
+        reservation_payment.save()
+        self.assertEqual(Reservation.objects.get(pk=self.reservations[0].pk).received_in_cents, 100)
+        self.assertEqual((reservation_payment.reservation.received_in_cents,
+                          reservation_payment.reservation.remaining_due_in_cents), (5455, -2655))
+        reservation_payment.payment = Payment.objects.get(src_id="2025-0901")
+        reservation_payment.save()
+        self.assertEqual(Reservation.objects.get(pk=self.reservations[1].pk).received_in_cents, 2200)
+        call_command("recompute_reservation_balances", "--check", stdout=io.StringIO())
+
+    def test_follows_edited_payment_amounts(self):
+        payment = ReservationPayment.objects.get(reservation_id=self.reservations[0].pk).payment
+        stale = Payment.objects.get(pk=payment.pk)
+        payment.amount_in_cents = 300
+        payment.save()
+        self.assertEqual(Reservation.objects.get(pk=self.reservations[0].pk).received_in_cents, 300)
+        stale.amount_in_cents = 250
+        stale.save()
+        reservation = Reservation.objects.get(pk=self.reservations[0].pk)
+        self.assertEqual((reservation.received_in_cents, reservation.remaining_due_in_cents), (250, 7650))
+        call_command("recompute_reservation_balances", "--check", stdout=io.StringIO())
+
+    def test_save_does_not_overwrite_it(self):
+        stale = Reservation.objects.get(pk=self.reservations[2].pk)
+        ReservationPayment(reservation_id=stale.pk, payment=Payment.objects.get(src_id="2025-0901")).save()
+        stale.extra_comment = "Changed"
+        stale.save()
+        reservation = Reservation.objects.get(pk=stale.pk)
+        self.assertEqual((reservation.extra_comment, reservation.received_in_cents, reservation.remaining_due_in_cents),
+                         ("Changed", 2200, 0))
+
+    def test_recompute_reservation_balances(self):
+        Reservation.objects.filter(pk=self.reservations[1].pk).update(received_in_cents=1234)
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command("recompute_reservation_balances", "--check", stdout=out)
+        self.assertIn("092000200002 Mme Lara Croft (tomb-raider@yopmail.fr): 1234 stored, 0 received", out.getvalue())
+
+        call_command("recompute_reservation_balances", stdout=io.StringIO())
+        self.assertEqual(Reservation.objects.get(pk=self.reservations[1].pk).received_in_cents, 0)
+        self.assertEqual(Reservation.objects.get(pk=self.reservations[0].pk).received_in_cents, 100)
+        call_command("recompute_reservation_balances", "--check", stdout=io.StringIO())
+
+    def test_recompute_reserved_seats(self):
+        Event.objects.filter(pk=self.event.pk).update(reserved_seats=-6)
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command("recompute_reservation_balances", "--check", stdout=out)
+        self.assertIn("Gala (Samedi)@2025-11-08: -6 seats stored, 7 places reserved", out.getvalue())
+
+        call_command("recompute_reservation_balances", stdout=io.StringIO())
+        self.assertEqual(Event.objects.get(pk=self.event.pk).reserved_seats, 7)
+        call_command("recompute_reservation_balances", "--check", stdout=io.StringIO())
+
+
+
+class Places(TestCase):
+    def setUp(self):
+        self.event, self.choices, self.reservations = fill_db()
+
+    def test_follows_reservation_choice_counts(self):
+        reservation = Reservation.objects.get(pk=self.reservations[0].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(reservation.places, 5)
+        reservation_choice_count = reservation.reservationchoicecount_set.get(choice=self.choices[0])
+        reservation_choice_count.count = 4
+        reservation_choice_count.save()
+        self.assertEqual(reservation_choice_count.reservation.places, 7)
+        reservation_choice_count.delete()
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.places, 3)
+        self.assertEqual(self.event.occupied_seats(), 3 + 1 + 1)
+
+    def test_save_does_not_overwrite_it(self):
+        stale = Reservation.objects.get(pk=self.reservations[1].pk)
+        ReservationChoiceCount(reservation_id=stale.pk, choice=self.choices[1], count=3).save()
+        stale.extra_comment = "Changed"
+        stale.save()
+        self.assertEqual(Reservation.objects.get(pk=stale.pk).places, 1 + 3)
+
+    def test_reserved_seats_follow_the_places(self):
+        def reserved_seats() -> int:
+            return Event.objects.get(pk=self.event.pk).reserved_seats
+        self.assertEqual(reserved_seats(), 7)
+        reservation_choice_count = ReservationChoiceCount.objects.filter(reservation=self.reservations[0]).first()
+        reservation_choice_count.count += 5
+        reservation_choice_count.save()
+        self.assertEqual((reserved_seats(), self.event.occupied_seats()), (12, 12))
+        reservation_choice_count.delete()
+        self.assertEqual(reserved_seats(), self.event.occupied_seats())
+        Reservation.objects.get(pk=self.reservations[2].pk).delete()
+        self.assertEqual(reserved_seats(), self.event.occupied_seats())
+        call_command("recompute_reservation_balances", "--check", stdout=io.StringIO())
+
+    def test_deleting_reservation_releases_its_places(self):
+        event = Event.objects.get(pk=self.event.pk)
+        reserved_seats = event.reserved_seats
+        Reservation.objects.get(pk=self.reservations[1].pk).delete()
+        event.refresh_from_db()
+        self.assertEqual(event.reserved_seats, reserved_seats - 1)
+
 # Local Variables:
 # compile-command: "uv run python ../../manage.py test concert"
 # End:
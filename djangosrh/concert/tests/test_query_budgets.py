@@ -0,0 +1,118 @@
+from datetime import date, datetime, timezone
+import itertools
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from core.banking import add_check_digits
+from core.models import Civility, ReservationPayment
+from core.tests.query_budget import QueryBudgetTestCase, fill_payments
+from ..forms import ReservationForm, invalidate_capacity_snapshot, invalidate_choice_catalog
+from ..models import (
+    Choice,
+    Event,
+    Reservation,
+    ReservationChoiceCount,
+)
+
+
+def fill_large_db(reservations: int = 300, choices: int = 12) -> tuple[Event, list[Choice], list[Reservation]]:
+    """An event with `choices' choices and `reservations' reservations of 2
+    choices each, most of them paid."""
+    event = Event(
+        name="Grand gala",
+        date=datetime(2026, 11, 14, 20, 0, 0, tzinfo=timezone.utc),
+        contact_email="dont-spam@me.com",
+        max_seats=10 * reservations)
+    event.save()
+    chcs = Choice.objects.bulk_create(
+        Choice(display_text=f"Place {idx}", display_text_plural=f"Places {idx}", column_header=f"P{idx}",
+               price_in_cents=500 * (idx % 4), available_in=event)
+        for idx in range(choices))
+    # bulk_create sends no signals
+    invalidate_choice_catalog(event.id)
+    invalidate_capacity_snapshot(event.id)
+
+    counts = [((idx % choices, 1 + idx % 3), ((idx + 1) % choices, idx % 2)) for idx in range(reservations)]
+    rsrvtns = []
+    for idx, choice_counts in enumerate(counts):
+        rsrvtns.append(rsrvtn := Reservation(
+            civility=(Civility.man, Civility.woman, Civility.__empty__)[idx % 3],
+            first_name=f"Prénom {idx}",
+            last_name=f"Nom {idx % 97:02}",
+            email=f"client{idx}@yopmail.fr",
+            accepts_rgpd_reuse=idx % 2 == 0,
+            total_due_in_cents=sum(chcs[choice_idx].price_in_cents * count for choice_idx, count in choice_counts),
+            places=sum(count for _, count in choice_counts),
+            event=event,
+            bank_id=add_check_digits(4_300_000_000 + idx),
+            extra_comment="" if idx % 10 else f"Commentaire {idx}"))
+        rsrvtn.save()
+    ReservationChoiceCount.objects.bulk_create(
+        ReservationChoiceCount(reservation=rsrvtn, choice=chcs[choice_idx], count=count)
+        for rsrvtn, choice_counts in zip(rsrvtns, counts)
+        for choice_idx, count in choice_counts)
+    # Everybody paid, half of the payments are already linked
+    payments = fill_payments([rsrvtn.bank_id for rsrvtn in rsrvtns], 1500, date(2026, 9, 10))
+    for rsrvtn, payment in itertools.islice(zip(rsrvtns, payments), 0, None, 2):
+        ReservationPayment(reservation=rsrvtn, payment=payment, confirmation_sent_timestamp=None).save()
+    return event, chcs, rsrvtns
+
+
+class ViewQueryBudgets(QueryBudgetTestCase):
+    event: Event
+    choices: list[Choice]
+    reservations: list[Reservation]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("john", "lennon@thebeatles.com", "johnpassword")
+        cls.event, cls.choices, cls.reservations = fill_large_db()
+
+    def test_index(self):
+        self.assertQueryBudget(1, lambda: self.client.get(reverse("concert:index")))
+
+    def test_show_reservation(self):
+        uuid = self.reservations[-1].uuid
+        self.assertQueryBudget(3, lambda: self.client.get(reverse("concert:show_reservation", args=[uuid])))
+        for view in ("concert:payment_qrcode", "concert:page_qrcode"):
+            with self.subTest(view=view):
+                self.assertQueryBudget(1, lambda: self.client.get(reverse(view, args=[uuid, "svg"])))
+
+    def test_reservations(self):
+        self.client.force_login(self.user)
+        url = reverse("concert:reservations")
+        for page in (1, 15):
+            with self.subTest(page=page):
+                self.assertQueryBudget(8, lambda: self.client.get(url, {"event_id": self.event.id, "page": page}))
+
+    def test_reservation_form(self):
+        url = reverse("concert:reservation_form", args=[self.event.id])
+        self.assertQueryBudget(2, lambda: self.client.get(url))
+        form = ReservationForm(self.event)
+        self.assertQueryBudget(19, lambda: self.client.post(url, {
+            "civility": "Mr",
+            "last_name": "Doe",
+            "email": "john.doe@example.com",
+            form.choices[0].id: "2",
+        }), status_code=302)
+
+    def test_send_payment_reception_confirmation(self):
+        self.client.force_login(self.user)
+        reservation = self.reservations[1]
+        payment = fill_payments([reservation.bank_id], 1000, date(2026, 10, 1))[0]
+        self.assertQueryBudget(14, lambda: self.client.post(
+            reverse("concert:send_payment_reception_confirmation"),
+            {"payment_id": payment.id, "reservation_id": reservation.id, "event_id": self.event.id}),
+            status_code=302)
+
+    def test_export(self):
+        self.client.force_login(self.user)
+        url = reverse("concert:export_csv", args=[self.event.id])
+        for fmt in ("csv", "xlsx", "jsonl"):
+            with self.subTest(format=fmt):
+                self.assertQueryBudget(5, lambda: self.client.get(url, {"format": fmt}))
+
+# Local Variables:
+# compile-command: "uv run python ../../manage.py test concert"
+# End:
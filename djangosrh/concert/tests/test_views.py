@@ -1,18 +1,25 @@
+import csv
 from datetime import date, datetime, timezone
+import io
 from uuid import uuid4
 
 from django.contrib.auth.models import User
 from django.core import mail
-from django.test import Client, TestCase
+from django.db import connection, models
+from django.test import Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from core.banking import cents_to_euros
 from core.models import Payment, ReservationPayment
 from core.models import get_reservations_with_likely_payments
-from ..forms import ReservationForm
+from ..forms import ReservationForm, invalidate_capacity_snapshot
+from ..views import ReservationListView
 from ..models import (
     Choice,
     Event,
     Reservation,
+    ReservationChoiceCount,
 )
 
 from .test_models import fill_db
@@ -68,6 +75,8 @@ class ReservationFormViewTests(TestCase):
 
     def setUp(self):
         self.client = Client()
+        # The rollback at the end of each test sends no signal
+        invalidate_capacity_snapshot()
 
     def test_get_reservation_form_ok(self):
         """GET should render the reservation form."""
@@ -77,6 +86,24 @@ class ReservationFormViewTests(TestCase):
         self.assertTemplateUsed(response, "concert/reservation_form.html")
         self.assertContains(response, "Gala (Samedi)")
 
+    def test_get_reservation_form_is_cached(self):
+        url = reverse("concert:reservation_form", args=[self.event.id])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Gala (Samedi)")
+
+    def test_get_reservation_form_sees_new_reservations(self):
+        url = reverse("concert:reservation_form", args=[self.event.id])
+        self.client.get(url)
+        Event.objects.filter(pk=self.event.pk).update(max_seats=models.F("reserved_seats") + 2)
+        blank_reservation = ReservationForm(self.event)
+        response = Client().post(url, data={
+            "last_name": "Last", "email": "last@seats.com", blank_reservation.choices[0].id: "2"})
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, "concert/event_disabled.html")
+
     def test_get_reservation_form_disabled_event(self):
         """If event is disabled, should render event_disabled template."""
         self.event.disabled = True
@@ -226,12 +253,46 @@ class ShowReservationViewTests(TestCase):
             self.assertNotContains(response, fragment)
 
     def test_show_reservation_contains_qrcodes(self):
-        """It should embed QR codes in the page (payment and page)."""
-        url = reverse("concert:show_reservation", args=[self.reservations[0].uuid])
+        """It should link to the QR codes (payment and page)."""
+        uuid = self.reservations[0].uuid
+        response = self.client.get(reverse("concert:show_reservation", args=[uuid]))
+        self.assertContains(response, f'<img src="{reverse("concert:payment_qrcode", args=[uuid, "svg"])}"')
+        self.assertContains(response, f'<img src="{reverse("concert:page_qrcode", args=[uuid, "svg"])}"')
+        self.assertNotContains(response, "<svg ")
+
+    def test_payment_qrcode(self):
+        url = reverse("concert:payment_qrcode", args=[self.reservations[1].uuid, "svg"])
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertIn(b"<path ", response.content)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertTrue(response.has_header("Last-Modified"))
+        unchanged = self.client.get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual((unchanged.status_code, unchanged["ETag"]), (304, response["ETag"]))
+        ReservationPayment(reservation=self.reservations[1], payment=Payment.objects.get(src_id="2025-0901")).save()
+        changed = self.client.get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+
+    def test_page_qrcode(self):
+        uuid = self.reservations[0].uuid
+        response = self.client.get(reverse("concert:page_qrcode", args=[uuid, "png"]))
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertTrue(response.content.startswith(b"\x89PNG"))
+        self.assertIn("max-age=", response["Cache-Control"])
+        for url in (reverse("concert:page_qrcode", args=[uuid, "gif"]),
+                    reverse("concert:page_qrcode", args=["00000000-0000-0000-0000-000000000000", "svg"]),
+                    reverse("concert:payment_qrcode", args=["00000000-0000-0000-0000-000000000000", "svg"])):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_show_reservation_is_not_sent_again_if_unchanged(self):
+        url = reverse("concert:show_reservation", args=[self.reservations[1].uuid])
         response = self.client.get(url)
-        # The view produces SVG-based QR codes
-        self.assertIn("<svg ", response.content.decode())
-        self.assertIn("<path ", response.content.decode())
+        self.assertTrue(response.has_header("ETag"))
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": response["ETag"]}).status_code, 304)
+        ReservationPayment(reservation=self.reservations[1], payment=Payment.objects.get(src_id="2025-0901")).save()
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": response["ETag"]}).status_code, 200)
 
 
 class AdminTestCase(TestCase):
@@ -274,12 +335,53 @@ class GetExportCsvWithExampleList(AdminTestCase):
     def test_after_login__lists_reservations(self):
         self.client.force_login(self.user)
         response = self.client.get(self.test_url, follow=False)
-        self.assertEqual(response.content.decode('utf8'),
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.getvalue().decode('utf8'),
                          'Nom,Places,Valeur,Déjà payé,Restant dû,Adulte,Enfant,Étudiant,Commentaire\r\n'
                          'Priv Ate,1,22.00€,0.00€,22.00€,0,0,1,\r\n'
                          'Mme Lara Croft,1,28.00€,0.00€,28.00€,1,0,0,\r\n'
                          'Mr Dupont,5,79.00€,1.00€,78.00€,2,2,1,"Places offertes, donc ""gratuites"""\r\n')
 
+    def test_after_login__same_csv_as_before_the_export_engine(self):
+        Reservation.objects.filter(pk=self.reservations[1].pk).update(extra_comment="  Au balcon \n")
+        # The export_csv view as it was before core.exports
+        reservation_choices = self.event.reservation_choices()
+        expected = io.StringIO()
+        writer = csv.writer(expected)
+        writer.writerow(["Nom", "Places", "Valeur", "Déjà payé", "Restant dû", *(
+            chc.column_header for chc in reservation_choices), "Commentaire"])
+        for res in self.event.reservation_set.order_by('last_name', 'first_name'):
+            total_due = res.total_due_in_cents
+            remaining = res.remaining_amount_due_in_cents()
+            choice_counts = {res_chc_count.choice.id: res_chc_count.count for res_chc_count in res.reservationchoicecount_set.all()}
+            writer.writerow([
+                res.full_name,
+                str(res.places),
+                cents_to_euros(total_due),
+                cents_to_euros(total_due - remaining),
+                cents_to_euros(remaining),
+                *(choice_counts.get(chc.id, 0) for chc in reservation_choices),
+                res.extra_comment])
+
+        self.client.force_login(self.user)
+        content = self.client.get(self.test_url, follow=False).getvalue()
+        self.assertEqual(content, expected.getvalue().encode("utf-8"))
+        self.assertIn('"  Au balcon \n"', content.decode("utf-8"))
+
+    def test_after_login__query_count_does_not_depend_on_reservation_count(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(self.test_url, follow=False).getvalue()
+        for idx in range(10):
+            reservation = Reservation(last_name=f"Doe {idx}", email="doe@yopmail.fr", accepts_rgpd_reuse=False,
+                                      total_due_in_cents=1500, event=self.event, bank_id=f"0990{idx:08}")
+            reservation.save()
+            ReservationChoiceCount(reservation=reservation, choice=self.choices[idx % 3], count=1).save()
+        with CaptureQueriesContext(connection) as after:
+            content = self.client.get(self.test_url, follow=False).getvalue()
+        self.assertIn('Doe 9,1,15.00€,0.00€,15.00€,1,0,0,\r\n', content.decode('utf8'))
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+
 
 class ReservationList(AdminTestCase):
     test_url: str
@@ -303,6 +405,45 @@ class ReservationList(AdminTestCase):
              None,
              Payment.objects.get(src_id="2025-0901").id])
 
+    def test_after_login__likely_payments_are_fetched_in_one_query(self):
+        self.client.force_login(self.user)
+        for idx in range(15):
+            rsrvtn = Reservation(last_name=f"Doe {idx}", email="doe@yopmail.fr", accepts_rgpd_reuse=False,
+                                 total_due_in_cents=1500, event=self.event, bank_id=f"0990{idx:08}")
+            rsrvtn.save()
+            Payment(date_received=date(2025, 10, 1), amount_in_cents=1500, src_id=f"2025-1{idx:04}",
+                    bank_ref=f"20251001{idx:04}", status="Accepté", srh_bank_id=rsrvtn.bank_id).save()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.test_url, follow=False)
+        self.assertEqual(len(response.context["object_list"]), 18)
+        # No correlated subquery per reservation, one lookup for the whole page
+        self.assertEqual(len([q for q in ctx.captured_queries if '"core_payment"."srh_bank_id"' in q["sql"]]), 1)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'FROM "core_payment"' in q["sql"]]), 1)
+        last = list(response.context["reservations"])[-1]
+        self.assertEqual((last.likely_payment.src_id, last.likely_payment_src_id), ("2025-10014", "2025-10014"))
+
+    def test_after_login__query_count_does_not_depend_on_reservation_count(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(self.test_url, follow=False)
+        for idx in range(10):
+            Reservation(last_name=f"Doe {idx}", email="doe@yopmail.fr", accepts_rgpd_reuse=False,
+                        total_due_in_cents=1500, places=1, event=self.event, bank_id=f"0990{idx:08}").save()
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(self.test_url, follow=False)
+        self.assertEqual(len(response.context["object_list"]), 13)
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+
+    def test_after_login__without_enabled_event(self):
+        Event.objects.update(disabled=True)
+        request = RequestFactory().get(self.test_url)
+        request.user = self.user
+        # Not rendered: the template needs an event for its links
+        response = ReservationListView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context_data["object_list"]), [])
+        self.assertNotIn("event", response.context_data)
+
     def test_after_login__404_if_no_such_event(self):
         self.client.force_login(self.user)
         response = self.client.get(reverse("concert:reservations") + "?event_id=Does-NOT-exist", follow=False)
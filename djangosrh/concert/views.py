@@ -1,5 +1,4 @@
-import csv
-from datetime import timedelta
+from datetime import date, timedelta
 import time
 
 from django.conf import settings
@@ -7,20 +6,20 @@ from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import login_required
 from django.core.mail import EmailMultiAlternatives
-from django.db.models import Exists, OuterRef, Prefetch, QuerySet, Subquery, Sum, IntegerField, CharField
-from django.http import Http404, HttpRequest, HttpResponse, HttpResponseRedirect
+from django.db.models import Exists, OuterRef, Prefetch, QuerySet, Subquery, IntegerField, CharField
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.utils import html
+from django.views.decorators.http import conditional_page
 from django.views.generic import ListView
-import qrcode
-from qrcode.image.svg import SvgPathFillImage
 
-from .forms import ReservationForm
+from .forms import ReservationForm, get_capacity_snapshot
 from .models import Event, Reservation
-from core.banking import cents_to_euros, format_bank_id, generate_payment_QR_code_content
-from core.models import get_reservations_with_likely_payments
-from core.views import aux_send_payment_reception_confirmation
+from core.banking import format_bank_id
+from core.exports import EXPORT_FORMATS, reservation_table, streaming_export_response
+from core.models import attach_likely_payments
+from core.views import aux_page_qrcode, aux_payment_qrcode, aux_send_payment_reception_confirmation
 
 def index(request):
     events = [(str(evt), reverse("concert:reservations", query={"event_id": evt.id}))
@@ -50,14 +49,16 @@ class ReservationListView(LoginRequiredMixin, ListView):
         self.event_id = None if self.event is None else self.event.id
 
     def get_queryset(self):
-        return get_reservations_with_likely_payments(
-            date(2025, 2, 12)
-            if self.event is None else
-            (self.event.date - timedelta(days=90)),
-            Reservation.objects.filter(event_id=self.event_id).order_by("id"))
+        return Reservation.objects.filter(event_id=self.event_id).order_by("id")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # One lookup of the likely payments of the whole page
+        attach_likely_payments(
+            context["object_list"],
+            date(2025, 2, 12)
+            if self.event is None else
+            (self.event.date - timedelta(days=90)))
         if self.event is not None:
             context["event"] = self.event
             context["total_count"] = self.event.occupied_seats()
@@ -85,11 +86,16 @@ def reservation_form(request, event_id: int) -> HttpResponse:
     except Exception:
         pass
 
-    event = get_object_or_404(Event, pk=event_id)
-    if event.disabled or event.occupied_seats() >= event.max_seats:
-        return render(request, "concert/event_disabled.html", context={"event": event})
+    try:
+        snapshot = get_capacity_snapshot(event_id)
+    except Event.DoesNotExist:
+        raise Http404("No Event matches the given query.")
+    if snapshot.event.disabled or snapshot.reserved_seats >= snapshot.max_seats:
+        return render(request, "concert/event_disabled.html", context={"event": snapshot.event})
 
     if request.method == "POST":
+        # Not the shared snapshot: reserving seats refreshes the event
+        event = get_object_or_404(Event, pk=event_id)
         form = ReservationForm(event, data=request.POST)
         if reservation := form.save():
             # Store reservation info in the session
@@ -101,9 +107,10 @@ def reservation_form(request, event_id: int) -> HttpResponse:
                 "concert/reservation_form.html",
                 {"form": form}, status=422)
     return render(request, "concert/reservation_form.html", {
-        "form": ReservationForm(event)})
+        "form": ReservationForm(snapshot.event)})
 
 
+@conditional_page
 def show_reservation(request: HttpRequest, uuid: str) -> HttpResponse:
     reservation = get_object_or_404(Reservation, uuid=uuid)
     choices: list[dict[str, str|int]] = [
@@ -113,27 +120,19 @@ def show_reservation(request: HttpRequest, uuid: str) -> HttpResponse:
         .order_by('choice__display_text')
         .values("choice__display_text", "choice__display_text_plural", "count")
     ]
-    remaining_due = (
-        reservation.total_due_in_cents -
-        reservation.reservationpayment_set.aggregate(
-            Sum("payment__amount_in_cents", default=0))['payment__amount_in_cents__sum'])
+    remaining_due = reservation.remaining_due_in_cents
     return render(request, "concert/show_reservation.html", {
         "reservation": reservation,
         "remaining_amount_due_in_cents": remaining_due,
-        "choices": choices,
-        "payment_qrcode": qrcode.make(
-            generate_payment_QR_code_content(
-                remaining_due,
-                bank_id=reservation.bank_id,
-                bank_account=reservation.event.bank_account,
-                organizer_bic=reservation.event.organizer_bic,
-                organizer_name=reservation.event.organizer_name),
-            image_factory=SvgPathFillImage
-        ).to_string().decode('utf8'),
-        "page_qrcode": qrcode.make(
-            request.build_absolute_uri(), image_factory=SvgPathFillImage
-        ).to_string().decode('utf8')})
-   
+        "choices": choices})
+
+
+def payment_qrcode(request, uuid: str, fmt: str) -> HttpResponse:
+    return aux_payment_qrcode(request, uuid, fmt)
+
+
+def page_qrcode(request, uuid: str, fmt: str) -> HttpResponse:
+    return aux_page_qrcode(request, uuid, fmt, "concert:show_reservation")
 
 
 @login_required
@@ -142,29 +141,15 @@ def send_payment_reception_confirmation(request) -> HttpResponseRedirect:
 
 
 @login_required
-def export_csv(request, event_id: int) -> HttpResponse:
+def export_csv(request, event_id: int) -> HttpResponse | StreamingHttpResponse:
+    "Export the reservations, as CSV unless another of the EXPORT_FORMATS is requested with ?format="
+    if (fmt := EXPORT_FORMATS.get(request.GET.get("format", "csv"))) is None:
+        raise Http404(f"Unknown export format {request.GET['format']!r}.")
     event = get_object_or_404(Event, pk=event_id)
     if event.disabled:
         return render(request, "ital/event_disabled.html", context={"event": event})
-    reservation_choices = event.reservation_choices()
-    response = HttpResponse(
-        content_type="text/csv",
-        headers={"Content-Disposition": 'attachment; filename="reservations.csv"'},
-    )
-    writer = csv.writer(response)
-    writer.writerow(["Nom", "Places", "Valeur", "Déjà payé", "Restant dû", *(
-        chc.column_header for chc in reservation_choices), "Commentaire"])
-    # N+1 queries, so what... I won't have that many reservations anyway.
-    for res in event.reservation_set.order_by('last_name', 'first_name'):
-        total_due = res.total_due_in_cents
-        remaining = res.remaining_amount_due_in_cents()
-        choice_counts = {res_chc_count.choice.id: res_chc_count.count for res_chc_count in res.reservationchoicecount_set.all()}
-        writer.writerow([
-            res.full_name,
-            str(res.places),
-            cents_to_euros(total_due),
-            cents_to_euros(total_due - remaining),
-            cents_to_euros(remaining),
-            *(choice_counts.get(chc.id, 0) for chc in reservation_choices),
-            res.extra_comment])
-    return response
+    return streaming_export_response(
+        reservation_table(event.reservation_set.order_by('last_name', 'first_name'),
+                          "reservationchoicecount", "choice", event.reservation_choices()),
+        fmt,
+        "reservations")
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Payment, ReservationPayment
+from .models import BankStatementImport, Payment, ReservationPayment
 
 admin.site.register(Payment)
 admin.site.register(ReservationPayment)
+admin.site.register(BankStatementImport)
@@ -1,12 +1,19 @@
 import csv
-from datetime import date
+from datetime import date, datetime
+import functools
 import io
+import itertools
+import operator
+import re
+import threading
 import time
-from typing import Callable, Iterable
+from typing import Callable, Iterable, Iterator, Mapping, NamedTuple
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
 
-from core.models import Payment
+from core.models import BankIdSequence, BankStatementImport, ImportAction, ImportStatus, Payment
 
 
 def cents_to_euros(display_value: str|int, unit: str="€") -> str:
@@ -27,6 +34,12 @@ def generate_payment_QR_code_content(remaining_due: int, bank_id: str, bank_acco
     return ("BCD\n001\n1\nSCT\n" + organizer_bic + "\n" + organizer_name + "\n" + iban + "\n" + "EUR" + amount + "\n\n" + bank_id)
 
 
+def add_check_digits(n: int) -> str:
+    "12 digits structured communication: `n' on 10 digits followed by its mod-97 check digits"
+    check = n % 97
+    return f'{n:010}{check or 97:02}'
+
+
 def generate_bank_id(time_time: float, number_of_previous_calls: int) -> str:
     data = [(x & ((1 << b) - 1), b)
             for (x, b)
@@ -35,13 +48,58 @@ def generate_bank_id(time_time: float, number_of_previous_calls: int) -> str:
     n = 0
     for (x, b) in data:
         n = (n << b) + x
-    s = f'{n:010}'
-    n = 0
-    for c in s:
-        n = (n * 10 + int(c)) % 97
-    if n == 0:
-        n = 97
-    return f'{s}{n:02}'
+    return add_check_digits(n)
+
+
+# generate_bank_id produces numbers below 2**33: start above to never
+# collide with the bank_ids it handed out
+BANK_ID_SEQUENCE_START = 8_600_000_000
+BANK_ID_SEQUENCE_END = 10_000_000_000
+BANK_ID_BLOCK_SIZE = 20
+
+
+def _lease_bank_id_block(block_size: int) -> range:
+    with transaction.atomic():
+        # The UPDATE locks the row until the end of the transaction, so
+        # reading it back is safe.
+        if not BankIdSequence.objects.filter(pk=1).update(next_value=F("next_value") + block_size):
+            try:
+                with transaction.atomic():
+                    BankIdSequence.objects.create(pk=1, next_value=BANK_ID_SEQUENCE_START + block_size)
+            except IntegrityError:
+                # Created concurrently
+                BankIdSequence.objects.filter(pk=1).update(next_value=F("next_value") + block_size)
+        end = BankIdSequence.objects.values_list("next_value", flat=True).get(pk=1)
+    if end > BANK_ID_SEQUENCE_END:
+        raise RuntimeError("No more structured communication numbers available")
+    return range(end - block_size, end)
+
+
+class BankIdAllocator:
+    """Hand out unique bank_ids (structured communications)
+
+    Numbers are leased from the BankIdSequence row `block_size' at a time,
+    so that most reservations need no query at all to get their bank_id.
+    Numbers of a block that are not used before the process exits are
+    lost, which is fine: there are more than enough of them.
+
+    Do not call it in a transaction that may be rolled back: the lease
+    would be rolled back too and the same block leased again by another
+    process."""
+    def __init__(self, block_size: int = BANK_ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._block: Iterator[int] = iter(())
+
+    def __call__(self) -> str:
+        with self._lock:
+            if (n := next(self._block, None)) is None:
+                self._block = iter(_lease_bank_id_block(self.block_size))
+                n = next(self._block)
+        return add_check_digits(n)
+
+
+allocate_bank_id = BankIdAllocator()
 
 
 def format_bank_id(x: str) -> str:
@@ -51,12 +109,19 @@ def format_bank_id(x: str) -> str:
     return f'+++{bank_id[0:3]}/{bank_id[3:7]}/{bank_id[7:12]}+++'
 
 
+_BANK_ID_RE = re.compile(r"(\d{12})|\+\+\+(\d{3}).(\d{4}).(\d{5})\+\+\+", re.DOTALL)
+
+
 def normalize_bank_id(x: str) -> str:
-    if len(x) == 12 and all(c.isdigit() for c in x):
-        return x
-    if x.startswith('+++') and x.endswith('+++') and len(x) == 20:
-        return normalize_bank_id(x[3:6] + x[7:11] + x[12:17])
-    return ''
+    if (m := _BANK_ID_RE.fullmatch(x)) is None:
+        return ''
+    return m[1] or m[2] + m[3] + m[4]
+
+
+def normalize_bank_ids(xs: Iterable[str]) -> list[str]:
+    """Like `normalize_bank_id' for a whole column of communications"""
+    fullmatch = _BANK_ID_RE.fullmatch
+    return [(m[1] or m[2] + m[3] + m[4]) if (m := fullmatch(x)) else '' for x in xs]
 
 
 def extract_bank_ref(details: str) -> str:
@@ -72,6 +137,24 @@ def extract_bank_ref(details: str) -> str:
     return details[left_idx:right_idx].strip()
 
 
+def extract_bank_refs(details: Iterable[str]) -> list[str]:
+    """Like `extract_bank_ref' for a whole column of details
+
+    The searches are inlined instead of calling `extract_bank_ref' for each
+    row (two str.find scans are faster than a regex search here).  A row
+    without bank reference raises the same ValueError as `extract_bank_ref'."""
+    left_marker = "REFERENCE BANQUE :"
+    right_marker = "DATE VALEUR"
+    bank_refs = []
+    for d in details:
+        left_idx = d.find(left_marker)
+        right_idx = d.find(right_marker, left_idx + len(left_marker))
+        if left_idx < 0 or right_idx < 0:
+            extract_bank_ref(d)  # raises the ValueError
+        bank_refs.append(d[left_idx + len(left_marker):right_idx].strip())
+    return bank_refs
+
+
 def parse_date_received(date_rcv: str) -> date:
     try:
         return date.fromisoformat(date_rcv)
@@ -83,50 +166,226 @@ def parse_date_received(date_rcv: str) -> date:
             raise ValueError(f"Unable to parse {date_rcv!r} as a date")
 
 
-def make_payment_builder(header_row: list[str]) -> Callable[[list[str]], Payment]:
-    BANK_STATEMENT_HEADERS = {
-        "fr": {'N\xba de s\xe9quence': "src_id",
-               'Date d\'ex\xe9cution': "timestamp",
-               'Montant': "amount_in_cents",
-               'Contrepartie': "other_account",
-               'Nom de la contrepartie': "other_name",
-               'Statut': "status",
-               'Détails': "details",
-               'Communication': "comment"}}
-
-    def _normalize_header(s: str) -> str:
-        s = s.strip()
-        return s[1:] if s.startswith('\ufeff') else s
-
-
-    col_name_to_idx = {_normalize_header(col_name): col_idx for col_idx, col_name in enumerate(header_row)}
-    columns = {}
-    for mapping in BANK_STATEMENT_HEADERS.values():
+_AMOUNT_IN_EUROS_RE = re.compile(r"\s*(?P<sign>[+-]?)(?P<euros>\d*)(?:[.,](?P<decimals>\d*))?\s*")
+
+
+def parse_amount_in_cents(amount: str) -> int:
+    """Parse an amount in euros (e.g. '-50.34' or '18,5') into cents
+
+    Only integer arithmetic is used to avoid the rounding errors of float.
+    Amounts with more than 2 decimals (e.g. '12.505') are rounded to the
+    nearest cent, ties to even like `round'."""
+    if not (m := _AMOUNT_IN_EUROS_RE.fullmatch(amount)) or not (m["euros"] or m["decimals"]):
+        raise ValueError(f"Unable to parse {amount!r} as an amount")
+    decimals = m["decimals"] or ""
+    cents = int(m["euros"] or "0") * 100 + int(decimals[:2].ljust(2, "0"))
+    if fraction := decimals[2:]:
+        # compare the fraction of a cent with one half
+        twice = 2 * int(fraction)
+        one = 10 ** len(fraction)
+        if twice > one or (twice == one and cents % 2 == 1):
+            cents += 1
+    return -cents if m["sign"] == "-" else cents
+
+
+# Order in which the compiled payment builders extract the columns of a row
+_PAYMENT_BUILDER_COLUMNS = (
+    "src_id", "timestamp", "amount_in_cents", "other_account", "other_name", "status", "details", "comment")
+
+
+class BankStatementFormat(NamedTuple):
+    """How to read the CSV export of one bank
+
+    `headers' maps the CSV column names to the attributes of
+    _PAYMENT_BUILDER_COLUMNS, `columns' is the complete header row of the
+    export as the bank produces it (optional, enables the exact match of the
+    header signature)."""
+    name: str
+    headers: Mapping[str, str]
+    columns: tuple[str, ...] = ()
+    delimiter: str = ";"
+    encoding: str = "utf-8"
+    date_format: str = "%d/%m/%Y"
+    extract_bank_ref: Callable[[str], str] = extract_bank_ref
+
+
+STATEMENT_FORMATS: dict[str, BankStatementFormat] = {}
+_STATEMENT_FORMATS_BY_SIGNATURE: dict[frozenset[str], BankStatementFormat] = {}
+
+
+def register_statement_format(fmt: BankStatementFormat) -> BankStatementFormat:
+    if missing := set(_PAYMENT_BUILDER_COLUMNS).difference(fmt.headers.values()):
+        raise ValueError(f"{fmt.name!r} does not map any column to {', '.join(sorted(missing))}")
+    unregister_statement_format(fmt.name)
+    STATEMENT_FORMATS[fmt.name] = fmt
+    _STATEMENT_FORMATS_BY_SIGNATURE[frozenset(fmt.headers)] = fmt
+    if fmt.columns:
+        _STATEMENT_FORMATS_BY_SIGNATURE[frozenset(fmt.columns)] = fmt
+    _compile_payment_builder.cache_clear()
+    _compile_payments_builder.cache_clear()
+    return fmt
+
+
+def unregister_statement_format(name: str) -> None:
+    if (fmt := STATEMENT_FORMATS.pop(name, None)) is None:
+        return
+    for signature in [sig for sig, sig_fmt in _STATEMENT_FORMATS_BY_SIGNATURE.items() if sig_fmt is fmt]:
+        del _STATEMENT_FORMATS_BY_SIGNATURE[signature]
+    _compile_payment_builder.cache_clear()
+    _compile_payments_builder.cache_clear()
+
+
+def find_statement_format(header: Iterable[str]) -> BankStatementFormat | None:
+    """Return the format whose columns are in `header' (already normalized)
+
+    Exports in a known format are found with a single dict lookup on the
+    header signature, other headers are only compared against the (few)
+    registered formats if that lookup fails."""
+    signature = frozenset(header)
+    if (fmt := _STATEMENT_FORMATS_BY_SIGNATURE.get(signature)) is not None:
+        return fmt
+    return next((fmt for fmt in STATEMENT_FORMATS.values() if signature.issuperset(fmt.headers)), None)
+
+
+def _normalize_header(s: str) -> str:
+    s = s.strip()
+    return s[1:] if s.startswith('\ufeff') else s
+
+
+def detect_statement_format(header_line: str) -> tuple[BankStatementFormat, list[str]]:
+    "Find the format of a CSV export from its first line and return it with the parsed header row"
+    for delimiter in dict.fromkeys(fmt.delimiter for fmt in STATEMENT_FORMATS.values()):
+        header_row = next(csv.reader([header_line], delimiter=delimiter), [])
+        if (fmt := find_statement_format(_normalize_header(col_name) for col_name in header_row)) is not None:
+            return fmt, header_row
+    raise RuntimeError("Unable to map header row to Payment class definition")
+
+
+def decode_bank_statement(content: bytes) -> str:
+    "Decode an uploaded CSV export with the encoding of its format"
+    header_line = content.split(b"\n", 1)[0]
+    for encoding in dict.fromkeys(fmt.encoding for fmt in STATEMENT_FORMATS.values()):
+        try:
+            fmt, _ = detect_statement_format(header_line.decode(encoding))
+        except (UnicodeDecodeError, RuntimeError):
+            continue
+        return content.decode(fmt.encoding, errors="replace")
+    return content.decode("utf-8", errors="replace")
+
+
+def _make_date_parser(date_format: str) -> Callable[[str], date]:
+    def parse_date(date_rcv: str) -> date:
         try:
-            columns = {attr_name: col_name_to_idx[col_name] for col_name, attr_name in mapping.items()}
-        except KeyError:
-            pass
-    if not columns:
+            return datetime.strptime(date_rcv, date_format).date()
+        except ValueError:
+            return parse_date_received(date_rcv)
+    return parse_date
+
+
+def _resolve_columns(header: tuple[str, ...]) -> tuple[BankStatementFormat, Callable[[list[str]], tuple[str, ...]]]:
+    if (fmt := find_statement_format(header)) is None:
         raise RuntimeError("Unable to map header row to Payment class definition")
+    col_name_to_idx = {col_name: col_idx for col_idx, col_name in enumerate(header)}
+    columns = {attr_name: col_name_to_idx[col_name] for col_name, attr_name in fmt.headers.items()}
+    return fmt, operator.itemgetter(*(columns[attr_name] for attr_name in _PAYMENT_BUILDER_COLUMNS))
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_payment_builder(header: tuple[str, ...]) -> Callable[[list[str]], Payment]:
+    fmt, extract_columns = _resolve_columns(header)
+    parse_date = _make_date_parser(fmt.date_format)
+    extract_bank_ref = fmt.extract_bank_ref
 
     def payment_builder(row: list[str]) -> Payment:
-        amount_in_cents = round(float(row[columns["amount_in_cents"]].replace(",", ".")) * 100)
-        comment = row[columns['comment']]
+        src_id, timestamp, amount, other_account, other_name, status, details, comment = extract_columns(row)
         return Payment(
-            date_received=parse_date_received(row[columns['timestamp']]),
-            amount_in_cents=amount_in_cents,
+            date_received=parse_date(timestamp),
+            amount_in_cents=parse_amount_in_cents(amount),
             comment=comment,
-            src_id=row[columns['src_id']],
-            bank_ref=extract_bank_ref(row[columns['details']]),
-            other_account=row[columns['other_account']],
-            other_name=row[columns['other_name']],
+            src_id=src_id,
+            bank_ref=extract_bank_ref(details),
+            other_account=other_account,
+            other_name=other_name,
             srh_bank_id=normalize_bank_id(comment),
-            status=row[columns['status']],
+            status=status,
             active=True,
         )
 
     return payment_builder
-        
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_payments_builder(header: tuple[str, ...]) -> Callable[[Iterable[list[str]]], list[Payment]]:
+    fmt, extract_columns = _resolve_columns(header)
+    parse_date = _make_date_parser(fmt.date_format)
+    if fmt.extract_bank_ref is extract_bank_ref:
+        extract_bank_ref_column = extract_bank_refs
+    else:
+        def extract_bank_ref_column(details: Iterable[str]) -> list[str]:
+            return [fmt.extract_bank_ref(d) for d in details]
+
+    def payments_builder(rows: Iterable[list[str]]) -> list[Payment]:
+        if not (columns := list(zip(*map(extract_columns, rows)))):
+            return []
+        src_ids, timestamps, amounts, other_accounts, other_names, statuses, details, comments = columns
+        # A statement spans few distinct days
+        dates = {timestamp: parse_date(timestamp) for timestamp in set(timestamps)}
+        return [
+            Payment(
+                date_received=dates[timestamp],
+                amount_in_cents=parse_amount_in_cents(amount),
+                comment=comment,
+                src_id=src_id,
+                bank_ref=bank_ref,
+                other_account=other_account,
+                other_name=other_name,
+                srh_bank_id=srh_bank_id,
+                status=status,
+                active=True,
+            )
+            for src_id, timestamp, amount, other_account, other_name, status, comment, bank_ref, srh_bank_id
+            in zip(src_ids, timestamps, amounts, other_accounts, other_names, statuses, comments,
+                   extract_bank_ref_column(details), normalize_bank_ids(comments))
+        ]
+
+    return payments_builder
+
+
+def _normalize_header_row(header_row: list[str]) -> tuple[str, ...]:
+    return tuple(_normalize_header(col_name) for col_name in header_row)
+
+
+def make_payment_builder(header_row: list[str]) -> Callable[[list[str]], Payment]:
+    """Return a function building a Payment from a CSV row of a file with this `header_row'
+
+    The column resolution is done once per distinct header: later imports of
+    files in the same format reuse the already compiled builder."""
+    return _compile_payment_builder(_normalize_header_row(header_row))
+
+
+def make_payments_builder(header_row: list[str]) -> Callable[[Iterable[list[str]]], list[Payment]]:
+    """Like `make_payment_builder' but the function builds the Payments of many rows at once
+
+    The rows are split in columns first so that the bank references and bank
+    ids are extracted with `extract_bank_refs' and `normalize_bank_ids'."""
+    return _compile_payments_builder(_normalize_header_row(header_row))
+
+
+register_statement_format(BankStatementFormat(
+    name="fr",
+    headers={'N\xba de s\xe9quence': "src_id",
+             'Date d\'ex\xe9cution': "timestamp",
+             'Montant': "amount_in_cents",
+             'Contrepartie': "other_account",
+             'Nom de la contrepartie': "other_name",
+             'Statut': "status",
+             'Détails': "details",
+             'Communication': "comment"},
+    columns=('N\xba de s\xe9quence', 'Date d\'ex\xe9cution', 'Date valeur', 'Montant', 'Devise du compte',
+             'Numéro de compte', 'Type de transaction', 'Contrepartie', 'Nom de la contrepartie', 'Communication',
+             'Détails', 'Statut', 'Motif du refus'),
+))
+
 
 def is_blank_src_id(src_id: str | None) -> bool:
     """True if src_id is blank or <<incomplete as observed in our bank statements>>
@@ -136,10 +395,127 @@ def is_blank_src_id(src_id: str | None) -> bool:
     return not src_id or not src_id.strip() or (src_id.endswith('-') and all(ch.isdigit() for ch in src_id[:-1]))
 
 
-def import_bank_statements(bank_statements_csv: Iterable[str]) -> list[tuple[Exception | None, Payment]]:
+COLUMNS_IDENTIFYING_A_STATEMENT = ("amount_in_cents", "comment", "bank_ref", "other_account", "other_name")
+
+
+def _is_same_statement(pre_existing: Payment, pmnt: Payment) -> bool:
+    return all(getattr(pre_existing, key) == getattr(pmnt, key) for key in COLUMNS_IDENTIFYING_A_STATEMENT)
+
+
+IMPORT_CHUNK_SIZE = 500
+
+
+class ClassifiedPayment(NamedTuple):
+    action: ImportAction
+    error: Exception | None
+    payment: Payment
+    pre_existing: Payment | None  # for corrections: the Payment getting the new src_id
+
+
+def _classify_payments(payments: list[Payment], src_id_limit: str) -> list[ClassifiedPayment]:
+    """Decide what importing each payment would do without writing to the DB
+
+    There is one lookup of all pre-existing bank_refs, whatever the number of
+    payments.  Rows identical to an already imported one (same row_digest)
+    are skipped without error."""
+    # bank_ref -> Payment, either already in the DB or about to be inserted by
+    # this import so that later rows see the earlier ones.
+    known = Payment.objects.in_bulk({pmnt.bank_ref for pmnt in payments}, field_name="bank_ref")
+    # bank_ref -> row correcting the src_id of the Payment in `known'
+    corrections: dict[str, Payment] = {}
+    result: list[ClassifiedPayment] = []
+    for pmnt in payments:
+        pmnt.row_digest = pmnt.compute_row_digest()
+        pre_existing = known.get(pmnt.bank_ref)
+        latest = corrections.get(pmnt.bank_ref, pre_existing)
+        if latest is not None and latest.row_digest == pmnt.row_digest:
+            result.append(ClassifiedPayment(ImportAction.UNCHANGED, None, pmnt, None))
+        elif not is_blank_src_id(pmnt.src_id) and pmnt.src_id < src_id_limit:
+            result.append(ClassifiedPayment(
+                ImportAction.TOO_OLD, RuntimeError(f"Bank statement {pmnt.src_id!r} is too old"), pmnt, None))
+        elif pre_existing is None:
+            known[pmnt.bank_ref] = pmnt
+            result.append(ClassifiedPayment(ImportAction.NEW, None, pmnt, None))
+        elif not is_blank_src_id(latest.src_id):
+            result.append(ClassifiedPayment(
+                ImportAction.DUPLICATE, IntegrityError(f"Duplicate bank_ref {pmnt.bank_ref!r}"), pmnt, None))
+        elif _is_same_statement(pre_existing, pmnt):
+            # update src_id if it did not exist yet
+            corrections[pmnt.bank_ref] = pmnt
+            result.append(ClassifiedPayment(ImportAction.CORRECTION, None, pmnt, pre_existing))
+        else:
+            result.append(ClassifiedPayment(
+                ImportAction.CONFLICT, Exception("Duplicate bank_ref for different statements"), pmnt, None))
+    return result
+
+
+def _apply_classified_payments(classified: list[ClassifiedPayment]) -> list[tuple[Exception | None, Payment]]:
+    """Insert the new payments and correct the src_ids in one transaction
+
+    Only one bulk_create is needed for the new payments.  Each correction of
+    a Payment of the DB is a conditional UPDATE: if that Payment changed
+    since it was classified (e.g. between a preview and its confirmation),
+    the correction is reported as a conflict instead of overwriting it."""
+    to_create: list[Payment] = []
+    # index in `classified' -> (Payment as classified, row correcting it)
+    to_update: dict[int, tuple[Payment, Payment]] = {}
+    now = timezone.now()
+    for idx, (action, _, pmnt, pre_existing) in enumerate(classified):
+        if action == ImportAction.NEW:
+            to_create.append(pmnt)
+        elif action == ImportAction.CORRECTION:
+            if pre_existing.pk is None:
+                # Row of the same file, about to be inserted
+                pre_existing.src_id = pmnt.src_id
+                pre_existing.row_digest = pmnt.row_digest
+            else:
+                to_update[idx] = (pre_existing, pmnt)
+    result = [(exc, pmnt) for _, exc, pmnt, _ in classified]
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Payment.objects.bulk_create(to_create)
+        except IntegrityError:
+            # A concurrent import inserted some of the same bank_refs in the
+            # meantime: insert row by row to find out which ones.
+            failures: dict[int, Exception] = {}
+            for pmnt in to_create:
+                try:
+                    with transaction.atomic():
+                        pmnt.save()
+                except Exception as exc:
+                    failures[id(pmnt)] = exc
+            result = [(failures.get(id(pmnt), exc), pmnt) for exc, pmnt in result]
+        for idx, (pre_existing, pmnt) in to_update.items():
+            # The fingerprint of the row follows the src_id correction, so
+            # that uploading this statement again is recognized
+            if not _classified_state(pre_existing).update(
+                    src_id=pmnt.src_id, row_digest=pmnt.row_digest, last_modified=now):
+                result[idx] = (Exception(f"Conflict: payment {pmnt.bank_ref!r} changed since the bank"
+                                         " statement was classified"), pmnt)
+    return result
+
+
+def _classified_state(pre_existing: Payment) -> QuerySet[Payment]:
+    "The Payment `pre_existing' as long as it is still in the state it had when it was classified"
+    qs = Payment.objects.filter(pk=pre_existing.pk, src_id=pre_existing.src_id)
+    # Previews stored before the row_digest was recorded only know the src_id
+    return qs if pre_existing.row_digest is None else qs.filter(row_digest=pre_existing.row_digest)
+
+
+def _import_payments(payments: list[Payment], src_id_limit: str) -> list[tuple[Exception | None, Payment]]:
+    return _apply_classified_payments(_classify_payments(payments, src_id_limit))
+
+
+def iter_import_bank_statements(
+        bank_statements_csv: Iterable[str],
+        chunk_size: int = IMPORT_CHUNK_SIZE,
+        skip_imported_chunks: bool = False,
+) -> Iterator[tuple[Exception | None, Payment]]:
     """Parse bank statements CSV and insert/update the rows in the database
 
-    For each row, a tuple is returned: the second element is the record parsed
+    For each row, a tuple is yielded: the second element is the record parsed
     from the CSV, the first element is None if the row caused a change in the
     DB or the exception that prevented the DB update otherwise.
 
@@ -147,38 +523,162 @@ def import_bank_statements(bank_statements_csv: Iterable[str]) -> list[tuple[Exc
     sometimes exports rows in the CSV without a valid src_id (valid would be
     e.g. 2024-00123) and later imports will contain the same row except with a
     `corrected' src_id.  In this case, the row is updated in the DB to reflect the
-    valid src_id issued by the bank."""
-    csv_reader = csv.reader(bank_statements_csv, delimiter=';')
-    builder = make_payment_builder(next(csv_reader))
-    exceptions: list[tuple[Exception | None, Payment]] = []
+    valid src_id issued by the bank.
+
+    The CSV is consumed lazily, `chunk_size' rows at a time.  Each chunk is
+    written in its own transaction: one lookup of all pre-existing bank_refs,
+    one bulk_create for the new rows and one conditional update per src_id
+    correction.
+
+    With `skip_imported_chunks' (e.g. when the same file was uploaded before),
+    a chunk whose rows are all unchanged in the DB already is recognized with
+    one query on their row_digest and skipped."""
+    lines = iter(bank_statements_csv)
+    fmt, header_row = detect_statement_format(next(lines))
+    builder = make_payments_builder(header_row)
+    csv_reader = csv.reader(lines, delimiter=fmt.delimiter)
     src_id_limit = time.strftime("%Y-")
-    for row in csv_reader:
-        pmnt = builder(row)
-        if not is_blank_src_id(pmnt.src_id) and pmnt.src_id < src_id_limit:
-            exceptions.append((RuntimeError(f"Bank statement {pmnt.src_id!r} is too old"), pmnt))
+    for rows in itertools.batched(csv_reader, chunk_size):
+        payments = builder(rows)
+        if skip_imported_chunks and _was_already_imported(payments):
+            yield from ((None, pmnt) for pmnt in payments)
+        else:
+            yield from _import_payments(payments, src_id_limit)
+
+
+def import_bank_statements(bank_statements_csv: Iterable[str]) -> list[tuple[Exception | None, Payment]]:
+    """Like `iter_import_bank_statements' but return all results at once"""
+    return list(iter_import_bank_statements(bank_statements_csv))
+
+
+def preview_bank_statements(bank_statements_csv: Iterable[str]) -> list[ClassifiedPayment]:
+    """Classify all rows of the bank statements CSV without writing to the DB
+
+    Unlike `iter_import_bank_statements', the whole file is classified at
+    once, against one lookup of the pre-existing bank_refs."""
+    lines = iter(bank_statements_csv)
+    fmt, header_row = detect_statement_format(next(lines))
+    payments = make_payments_builder(header_row)(csv.reader(lines, delimiter=fmt.delimiter))
+    return _classify_payments(payments, time.strftime("%Y-"))
+
+
+def _classified_payment_as_json(classified: ClassifiedPayment) -> dict:
+    action, exc, pmnt, pre_existing = classified
+    return {
+        "action": action.value,
+        "error": None if exc is None else str(exc),
+        "pk": None if pre_existing is None else pre_existing.pk,
+        "previous_src_id": None if pre_existing is None else pre_existing.src_id,
+        "previous_row_digest": None if pre_existing is None else pre_existing.row_digest,
+        "date_received": pmnt.date_received.isoformat(),
+        "amount_in_cents": pmnt.amount_in_cents,
+        "comment": pmnt.comment,
+        "src_id": pmnt.src_id,
+        "bank_ref": pmnt.bank_ref,
+        "other_account": pmnt.other_account,
+        "other_name": pmnt.other_name,
+        "srh_bank_id": pmnt.srh_bank_id,
+        "status": pmnt.status,
+    }
+
+
+def _classified_payments_from_json(rows: list[dict]) -> list[ClassifiedPayment]:
+    # Corrections of a row of the same file update the src_id of that
+    # (about to be inserted) Payment, not of a row of the DB.
+    new_payments: dict[str, Payment] = {}
+    result = []
+    for row in rows:
+        pmnt = Payment(date_received=date.fromisoformat(row["date_received"]),
+                       amount_in_cents=row["amount_in_cents"],
+                       comment=row["comment"],
+                       src_id=row["src_id"],
+                       bank_ref=row["bank_ref"],
+                       other_account=row["other_account"],
+                       other_name=row["other_name"],
+                       srh_bank_id=row["srh_bank_id"],
+                       status=row["status"],
+                       active=True)
+        pmnt.row_digest = pmnt.compute_row_digest()
+        action = ImportAction(row["action"])
+        pre_existing = None
+        if action == ImportAction.NEW:
+            new_payments[pmnt.bank_ref] = pmnt
+        elif action == ImportAction.CORRECTION:
+            pre_existing = (new_payments[pmnt.bank_ref] if row["pk"] is None
+                            else Payment(pk=row["pk"], src_id=row["previous_src_id"],
+                                    row_digest=row.get("previous_row_digest")))
+        result.append(ClassifiedPayment(action, None if row["error"] is None else Exception(row["error"]), pmnt, pre_existing))
+    return result
+
+
+def _was_uploaded_before(job: BankStatementImport) -> bool:
+    "True if a file with the same content as `job' was already imported"
+    return BankStatementImport.objects.filter(
+        content_digest=job.content_digest, status=ImportStatus.DONE).exclude(pk=job.pk).exists()
+
+
+def _was_already_imported(payments: list[Payment]) -> bool:
+    """True if all `payments' are already in the DB, unchanged
+
+    They are looked up with one query on their row_digest."""
+    row_digests = {pmnt.compute_row_digest() for pmnt in payments}
+    return Payment.objects.filter(row_digest__in=row_digests).count() == len(row_digests)
+
+
+def _record_import_results(job: BankStatementImport, results: list[tuple[Exception | None, Payment]]) -> None:
+    job.rows_processed += len(results)
+    for exc, pmnt in results:
+        if exc is None:
             continue
-        try:
-            # update src_id if it did not exist yet
-            if (pre_existing := Payment.find_by_bank_ref(pmnt.bank_ref)
-                ) and is_blank_src_id(pre_existing.src_id) :
-                columns_to_compare = ("amount_in_cents", "comment", "bank_ref", "other_account", "other_name")
-                pre_dict = {key: getattr(pre_existing, key) for key in columns_to_compare}
-                new_dict = {key: getattr(pmnt, key) for key in columns_to_compare}
-                if pre_dict == new_dict:
-                    try:
-                        pre_existing.src_id = pmnt.src_id
-                        pre_existing.save()
-                    except Exception as fyd:
-                        exceptions.append((fyd, pmnt))
-                    else:
-                        exceptions.append((None, pmnt))
-                else:
-                    exceptions.append((Exception("Duplicate bank_ref for different statements"), pmnt))
-                continue
-            else:
-                pmnt.save()
-        except Exception as exc:
-            exceptions.append((exc, pmnt))
+        job.rows_failed += 1
+        job.errors.append({
+            "error": str(exc),
+            "bank_ref": pmnt.bank_ref,
+            "date_received": pmnt.date_received.isoformat(),
+            "other_name": pmnt.other_name,
+            "other_account": pmnt.other_account,
+            "amount_in_cents": pmnt.amount_in_cents,
+        })
+    job.save(update_fields=["rows_processed", "rows_failed", "errors"])
+
+
+def run_bank_statement_import(job: BankStatementImport) -> None:
+    """Import the CSV held by `job', updating its progress after every chunk
+
+    A dry run only stores the classification of the rows in `job.preview'.
+    Once confirmed, that stored classification is applied instead of parsing
+    the CSV again.  Otherwise the CSV is parsed and imported chunk by chunk.
+    When the same file was imported before, the chunks whose rows are all
+    unchanged in the DB already are skipped."""
+    try:
+        if job.dry_run:
+            lines = decode_bank_statement(bytes(job.content)).splitlines()
+            classified = preview_bank_statements(lines)
+            job.preview = [_classified_payment_as_json(row) for row in classified]
+            job.rows_total = job.rows_processed = len(classified)
+            job.rows_failed = sum(1 for row in classified if row.error is not None)
+            job.save(update_fields=["preview", "rows_total", "rows_processed", "rows_failed"])
+        elif job.preview:
+            classified = _classified_payments_from_json(job.preview)
+            job.rows_total = len(classified)
+            job.rows_processed = job.rows_failed = 0
+            job.errors = []
+            job.save(update_fields=["rows_total", "rows_processed", "rows_failed", "errors"])
+            # All rows in one go: corrections may refer to new rows anywhere in the file
+            _record_import_results(job, _apply_classified_payments(classified))
         else:
-            exceptions.append((None, pmnt))
-    return exceptions
+            lines = decode_bank_statement(bytes(job.content)).splitlines()
+            fmt, _ = detect_statement_format(lines[0] if lines else "")
+            job.rows_total = max(sum(1 for _ in csv.reader(lines, delimiter=fmt.delimiter)) - 1, 0)
+            job.save(update_fields=["rows_total"])
+            for chunk in itertools.batched(
+                    iter_import_bank_statements(lines, skip_imported_chunks=_was_uploaded_before(job)),
+                    IMPORT_CHUNK_SIZE):
+                _record_import_results(job, chunk)
+    except Exception as exc:
+        job.status = ImportStatus.FAILED
+        job.failure = str(exc)[:job._meta.get_field("failure").max_length]
+    else:
+        job.status = ImportStatus.PREVIEWED if job.dry_run else ImportStatus.DONE
+    job.finished = timezone.now()
+    job.save(update_fields=["status", "failure", "finished"])
@@ -0,0 +1,53 @@
+import collections
+import threading
+import time
+from typing import Callable, Hashable
+
+
+class LRUCache[T]:
+    """Process-local least recently used cache
+
+    Entries are dropped after `ttl' seconds so that several worker processes
+    do not serve stale values for long when only one of them saw the change
+    (and invalidated its own copy)."""
+    def __init__(self, maxsize: int = 32, ttl: float | None = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: collections.OrderedDict[Hashable, tuple[float, T]] = collections.OrderedDict()
+        # Bumped by each invalidation so that a value built from data read
+        # before the invalidation is not stored
+        self._generation = 0
+
+    def get_or_build(self, key: Hashable, build: Callable[[], T]) -> T:
+        now = self.clock()
+        with self._lock:
+            if (entry := self._entries.get(key)) is not None and (self.ttl is None or now - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                return entry[1]
+            generation = self._generation
+        # Build outside of the lock: concurrent misses build twice, which is
+        # harmless, rather than waiting for each other's queries.
+        value = build()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
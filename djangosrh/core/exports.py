@@ -0,0 +1,260 @@
+import csv
+import io
+import itertools
+import json
+import re
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Sequence
+from xml.sax.saxutils import escape
+import zipfile
+
+from django.db import models
+from django.http import StreamingHttpResponse
+
+from core.banking import cents_to_euros
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional: the Arrow and Parquet exports are only offered when it is installed
+    pyarrow = None
+
+# Rows fetched from the database (and serialized) at a time by the exports
+EXPORT_CHUNK_SIZE = 500
+
+
+class ExportColumn(NamedTuple):
+    header: str
+    kind: str  # "text", "int" or "cents"
+
+
+class TabularExport(NamedTuple):
+    """Columns of an export and their values
+
+    `batches' yields lists of column arrays (one list of values per column)
+    of at most EXPORT_CHUNK_SIZE rows each."""
+    columns: list[ExportColumn]
+    batches: Iterable[list[list[Any]]]
+
+
+def reservation_table(reservations: models.QuerySet, counts: str, key: str, summaries: Sequence[Any],
+                      format_comment: Callable[[str], str] | None = None) -> TabularExport:
+    """Reservations with their amounts and one column per item (or choice)
+
+    `counts' is the name of the relation from the reservations to their
+    counts and `key' the name of the foreign key of the counts to the items
+    (or choices), e.g. "reservationitemcount" and "item".  `summaries' are
+    the items (or choices) with their `id' and `column_header'.  All counts
+    are summed in the query of the reservations.  The comments are exported
+    as they are unless `format_comment' is given (e.g. str.strip)."""
+    count_columns = {f"count_{smmry.id}": models.Sum(f"{counts}__count",
+                                                     filter=models.Q(**{f"{counts}__{key}_id": smmry.id}),
+                                                     default=0)
+                     for smmry in summaries}
+
+    def batches() -> Iterator[list[list[Any]]]:
+        rows = reservations.annotate(**count_columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        while chunk := list(itertools.islice(rows, EXPORT_CHUNK_SIZE)):
+            yield [[res.full_name for res in chunk],
+                   [res.places for res in chunk],
+                   [res.total_due_in_cents for res in chunk],
+                   [res.received_in_cents for res in chunk],
+                   [res.remaining_due_in_cents for res in chunk],
+                   *([getattr(res, column) for res in chunk] for column in count_columns),
+                   [res.extra_comment if format_comment is None else format_comment(res.extra_comment)
+                    for res in chunk]]
+
+    return TabularExport(
+        columns=[ExportColumn("Nom", "text"),
+                 ExportColumn("Places", "int"),
+                 ExportColumn("Valeur", "cents"),
+                 ExportColumn("Déjà payé", "cents"),
+                 ExportColumn("Restant dû", "cents"),
+                 *(ExportColumn(smmry.column_header, "int") for smmry in summaries),
+                 ExportColumn("Commentaire", "text")],
+        batches=batches())
+
+
+class _Chunks:
+    "Write-only file keeping what is written until it is taken"
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def closed(self) -> bool:
+        return False
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _euros(cents: int) -> float:
+    return cents / 100
+
+
+def write_csv(table: TabularExport) -> Iterator[str]:
+    "Amounts formatted like on the web pages, e.g. 12.50€"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.header for column in table.columns])
+    formats = [cents_to_euros if column.kind == "cents" else None for column in table.columns]
+    for batch in table.batches:
+        writer.writerows(zip(*(values if fmt is None else map(fmt, values)
+                               for fmt, values in zip(formats, batch))))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_jsonl(table: TabularExport) -> Iterator[str]:
+    "One JSON object per reservation, amounts in euros"
+    headers = [column.header for column in table.columns]
+    formats = [_euros if column.kind == "cents" else None for column in table.columns]
+    for batch in table.batches:
+        yield "".join(
+            json.dumps(dict(zip(headers, row)), ensure_ascii=False) + "\n"
+            for row in zip(*(values if fmt is None else map(fmt, values) for fmt, values in zip(formats, batch))))
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml":
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml"'
+    ' ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml"'
+    ' ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml"'
+    ' ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>',
+    "_rels/.rels":
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml"'
+    ' Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>',
+    "xl/workbook.xml":
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    ' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Réservations" sheetId="1" r:id="rId1"/></sheets></workbook>',
+    "xl/_rels/workbook.xml.rels":
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml"'
+    ' Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '<Relationship Id="rId2" Target="styles.xml"'
+    ' Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+    '</Relationships>',
+    # Style 1 shows the amounts in euros
+    "xl/styles.xml":
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="#,##0.00&quot;€&quot;"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '</styleSheet>',
+}
+# Characters that XML 1.0 does not allow, even escaped
+_XML_INVALID_CHARS_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_text_cell(value: Any) -> str:
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_INVALID_CHARS_RE.sub("", str(value)))}</t></is></c>'
+
+
+def write_xlsx(table: TabularExport) -> Iterator[bytes]:
+    "A single sheet, amounts in euros.  The zip file is produced while the rows are read."
+    cell_formats: list[Callable[[Any], str]] = [
+        _xlsx_text_cell if column.kind == "text"
+        else (lambda value: f'<c s="1"><v>{_euros(value)}</v></c>') if column.kind == "cents"
+        else (lambda value: f'<c><v>{value}</v></c>')
+        for column in table.columns]
+    sink = _Chunks()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield sink.take()
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(f'<row>{"".join(_xlsx_text_cell(column.header) for column in table.columns)}</row>'.encode())
+            for batch in table.batches:
+                sheet.write("".join(
+                    f'<row>{"".join(fmt(value) for fmt, value in zip(cell_formats, row))}</row>'
+                    for row in zip(*batch)).encode())
+                yield sink.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.take()
+
+
+def _write_arrow_batches(table: TabularExport, open_writer: Callable[[_Chunks, Any], Any]) -> Iterator[bytes]:
+    arrow_types = {"text": pyarrow.string(), "int": pyarrow.int64(), "cents": pyarrow.float64()}
+    schema = pyarrow.schema([(column.header, arrow_types[column.kind]) for column in table.columns])
+    sink = _Chunks()
+    with open_writer(sink, schema) as writer:
+        for batch in table.batches:
+            writer.write_batch(pyarrow.record_batch(
+                [list(map(_euros, values)) if column.kind == "cents" else values
+                 for column, values in zip(table.columns, batch)],
+                schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def write_arrow(table: TabularExport) -> Iterator[bytes]:
+    "Arrow IPC stream, amounts in euros"
+    return _write_arrow_batches(table, pyarrow.ipc.new_stream)
+
+
+def write_parquet(table: TabularExport) -> Iterator[bytes]:
+    "Amounts in euros"
+    return _write_arrow_batches(table, pyarrow.parquet.ParquetWriter)
+
+
+class ExportFormat(NamedTuple):
+    name: str
+    extension: str
+    content_type: str
+    write: Callable[[TabularExport], Iterator[str | bytes]]
+
+
+EXPORT_FORMATS: dict[str, ExportFormat] = {fmt.name: fmt for fmt in (
+    ExportFormat("csv", "csv", "text/csv", write_csv),
+    ExportFormat("xlsx", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx),
+    ExportFormat("jsonl", "jsonl", "application/jsonl", write_jsonl),
+    *((ExportFormat("arrow", "arrows", "application/vnd.apache.arrow.stream", write_arrow),
+       ExportFormat("parquet", "parquet", "application/vnd.apache.parquet", write_parquet))
+      if pyarrow is not None else ()),
+)}
+
+
+def streaming_export_response(table: TabularExport, fmt: ExportFormat, basename: str) -> StreamingHttpResponse:
+    """Send `table' in format `fmt' while it is produced
+
+    The rows are read from the database after the view returned."""
+    return StreamingHttpResponse(
+        fmt.write(table),
+        content_type=fmt.content_type,
+        headers={"Content-Disposition": f'attachment; filename="{basename}.{fmt.extension}"'})
@@ -0,0 +1,72 @@
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from core.banking import (
+    STATEMENT_FORMATS,
+    extract_bank_ref,
+    extract_bank_refs,
+    format_bank_id,
+    generate_bank_id,
+    make_payment_builder,
+    make_payments_builder,
+    normalize_bank_id,
+    normalize_bank_ids,
+)
+
+
+def synthetic_statement(rows: int, seed: int = 0) -> tuple[list[str], list[list[str]]]:
+    """Header and rows of a bank statement in the "fr" format
+
+    About a third of the communications are structured (i.e. bank ids)."""
+    rnd = random.Random(seed)
+    header = list(STATEMENT_FORMATS["fr"].columns)
+    data = []
+    for idx in range(rows):
+        bank_ref = f"{rnd.randrange(10**10, 10**11)}"
+        amount = f"{rnd.randrange(500, 20000) / 100:.2f}".replace(".", ",")
+        comment = (format_bank_id(generate_bank_id(1_700_000_000 + idx, idx % 512)) if idx % 3 == 0
+                   else f"Souper italien {idx}")
+        data.append([
+            f"2024-{idx:05}", "28/03/2024", "28/03/2024", amount, "EUR", "BE00010001000101",
+            "Virement en euros", "BE00020002000202", f"Client {idx}", comment,
+            f"VIREMENT EN EUROS DU COMPTE BE00020002000202 BIC GABBBEBB CLIENT {idx} COMMUNICATION : {comment}"
+            f" REFERENCE BANQUE : {bank_ref} DATE VALEUR : 28/03/2024",
+            "Accepté", ""])
+    return header, data
+
+
+class Command(BaseCommand):
+    help = "Compare the row by row and the column by column parsing of bank statements"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50_000,
+                            help="Number of rows of the synthetic statement (default: %(default)s)")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="Number of timings, the best one is reported (default: %(default)s)")
+
+    def handle(self, *args, **options):
+        header, rows = synthetic_statement(options["rows"])
+        details = [row[header.index("Détails")] for row in rows]
+        comments = [row[header.index("Communication")] for row in rows]
+        payment_builder = make_payment_builder(header)
+        payments_builder = make_payments_builder(header)
+        benchmarks = [
+            ("bank_ref",
+             lambda: [extract_bank_ref(d) for d in details],
+             lambda: extract_bank_refs(details)),
+            ("srh_bank_id",
+             lambda: [normalize_bank_id(c) for c in comments],
+             lambda: normalize_bank_ids(comments)),
+            ("Payment",
+             lambda: [payment_builder(row) for row in rows],
+             lambda: payments_builder(rows)),
+        ]
+        self.stdout.write(f"{len(rows)} rows, best of {options['repeat']}")
+        for name, per_row, per_column in benchmarks:
+            t_row = min(timeit.repeat(per_row, number=1, repeat=options["repeat"]))
+            t_column = min(timeit.repeat(per_column, number=1, repeat=options["repeat"]))
+            self.stdout.write(
+                f"{name:12}  per row {t_row * 1000:9.1f}ms  per column {t_column * 1000:9.1f}ms"
+                f"  speedup {t_row / t_column if t_column else float('inf'):5.2f}x")
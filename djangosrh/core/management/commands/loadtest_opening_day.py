@@ -0,0 +1,306 @@
+import collections
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+import http.client
+from http.cookies import SimpleCookie
+from pathlib import Path
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Iterator
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.core.signals import got_request_exception
+from django.db import connection, connections, models
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from core.models import BaseEvent, BaseReservation
+from core.performance import percentiles
+import concert.forms
+import concert.models
+import ital.forms
+import ital.models
+
+
+def seed_events(seats: int) -> dict[str, tuple[BaseEvent, dict[str, str]]]:
+    """An ital and a concert event of `seats' seats each
+
+    Maps the app names to their event and to a template of the POST data of
+    their reservation form (with a "{places}" placeholder)."""
+    date = datetime(2026, 3, 28, 18, 0, 0, tzinfo=timezone.utc)
+    ital_event = ital.models.Event(name="Souper italien (test de charge)", date=date,
+                                   contact_email="dont-spam@me.com", max_seats=seats)
+    ital_event.save()
+    for name, dish, price_in_cents in (("Bruschetta", ital.models.DishType.DT0STARTER, 800),
+                                       ("Lasagne", ital.models.DishType.DT1MAIN, 1500),
+                                       ("Tiramisu", ital.models.DishType.DT2DESSERT, 600)):
+        choice = ital.models.Choice(display_text=name, price_in_cents=price_in_cents, available_in=ital_event)
+        choice.save()
+        item = ital.models.Item(display_text=name, display_text_plural=f"{name}s", column_header=name,
+                                short_text=name, dish=dish)
+        item.save()
+        item.choices.add(choice)
+    ital_form = ital.forms.ReservationForm(ital_event)
+
+    concert_event = concert.models.Event(name="Gala (test de charge)", date=date,
+                                         contact_email="dont-spam@me.com", max_seats=seats)
+    concert_event.save()
+    for name, price_in_cents in (("Adulte", 1500), ("Enfant", 0)):
+        concert.models.Choice(display_text=name, display_text_plural=f"{name}s", column_header=name,
+                              price_in_cents=price_in_cents, available_in=concert_event).save()
+    concert_form = concert.forms.ReservationForm(concert_event)
+
+    contact = {"civility": "Mme", "first_name": "Charge", "last_name": "Client {client}-{iteration}",
+               "email": "client{client}@example.com"}
+    return {
+        "ital": (ital_event, contact | {
+            "places": "{places}", ital_form.single_items[ital.models.DishType.DT1MAIN][0].name: "{places}"}),
+        "concert": (concert_event, contact | {str(concert_form.choices[0].id): "{places}"}),
+    }
+
+
+class _TestClientTransport:
+    "Requests through django.test.Client (the views run in the calling thread)"
+    def __init__(self, session_key: str | None = None):
+        self.client = Client(raise_request_exception=False)
+        if session_key is not None:
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+
+    def request(self, method: str, path: str, data: dict[str, str]) -> tuple[int, bytes]:
+        response = self.client.get(path, data) if method == "GET" else self.client.post(path, data)
+        return response.status_code, response.content
+
+
+class _HttpTransport:
+    """Requests over HTTP to a WSGI server, one connection per request
+
+    Keeps its cookies and sends the CSRF token back like a browser."""
+    def __init__(self, host: str, port: int, session_key: str | None = None):
+        self.host, self.port = host, port
+        self.cookies = SimpleCookie()
+        if session_key is not None:
+            self.cookies[settings.SESSION_COOKIE_NAME] = session_key
+
+    def request(self, method: str, path: str, data: dict[str, str]) -> tuple[int, bytes]:
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {"Cookie": "; ".join(f"{key}={morsel.value}" for key, morsel in self.cookies.items())}
+        try:
+            if method == "GET":
+                conn.request("GET", f"{path}?{urlencode(data)}" if data else path, headers=headers)
+            else:
+                if (csrf_token := self.cookies.get(settings.CSRF_COOKIE_NAME)) is not None:
+                    data = data | {"csrfmiddlewaretoken": csrf_token.value}
+                conn.request("POST", path, body=urlencode(data),
+                             headers=headers | {"Content-Type": "application/x-www-form-urlencoded"})
+            response = conn.getresponse()
+            content = response.read()
+            for cookie in response.headers.get_all("Set-Cookie") or ():
+                self.cookies.load(cookie)
+            return response.status, content
+        finally:
+            conn.close()
+
+
+@contextmanager
+def _wsgi_server() -> Iterator[tuple[str, int]]:
+    "Threaded WSGI server of the project on a free port of localhost"
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "127.0.0.1"]):
+            yield server.server_address[:2]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@contextmanager
+def _test_database(keepdb: bool) -> Iterator[None]:
+    """Run against a throwaway database of the configured backend, like the tests
+
+    SQLite test databases are in memory by default: use a file instead so
+    that concurrent writers wait for each other like in production."""
+    setup_test_environment()
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    with ExitStack() as stack:
+        if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+            test_settings["NAME"] = str(Path(stack.enter_context(tempfile.TemporaryDirectory())) / "loadtest.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+        try:
+            yield
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+            teardown_test_environment()
+
+
+class Command(BaseCommand):
+    help = ("Simulate the opening of the reservations of an ital and a concert event: concurrent clients"
+            " load and post the reservation forms while a staff member follows the reservations and payments")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=20,
+                            help="Number of concurrent clients (default: %(default)s)")
+        parser.add_argument("--iterations", type=int, default=5,
+                            help="Reservations attempted by each client (default: %(default)s)")
+        parser.add_argument("--seats", type=int, default=100,
+                            help="Seats of each event, less than the clients ask for to test the overbooking"
+                            " protection (default: %(default)s)")
+        parser.add_argument("--seed", type=int, default=0,
+                            help="Seed of the random number of places of each reservation (default: %(default)s)")
+        parser.add_argument("--server", action="store_true",
+                            help="Send the requests over HTTP to a threaded WSGI server instead of the test client")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the test database between runs")
+        parser.add_argument("--no-test-database", dest="test_database", action="store_false",
+                            help="Run against the configured database instead of a test database:"
+                            " the events and reservations are not deleted afterwards")
+
+    def handle(self, *args, **options):
+        with _test_database(options["keepdb"]) if options["test_database"] else ExitStack():
+            self.run(options)
+
+    def run(self, options):
+        events = seed_events(options["seats"])
+        staff, _ = User.objects.get_or_create(username="loadtest-staff", defaults={"is_staff": True})
+        staff_client = Client()
+        staff_client.force_login(staff)
+        staff_session = staff_client.cookies[settings.SESSION_COOKIE_NAME].value
+        # The views must see the seeded data from their own connections
+        connections.close_all()
+
+        durations: dict[str, list[float]] = collections.defaultdict(list)
+        statuses: dict[str, collections.Counter[int]] = collections.defaultdict(collections.Counter)
+        exceptions: collections.Counter[str] = collections.Counter()
+        not_posted: collections.Counter[str] = collections.Counter()
+        lock = threading.Lock()
+
+        def on_exception(sender, request=None, **kwargs):
+            with lock:
+                exceptions[type(sys.exc_info()[1]).__name__] += 1
+
+        with ExitStack() as stack:
+            if options["server"]:
+                host, port = stack.enter_context(_wsgi_server())
+                make_transport = lambda session_key=None: _HttpTransport(host, port, session_key)
+            else:
+                make_transport = _TestClientTransport
+            got_request_exception.connect(on_exception, weak=False)
+            stack.callback(got_request_exception.disconnect, on_exception)
+
+            def timed(transport, label: str, method: str, path: str, data: dict[str, str]) -> tuple[int, bytes]:
+                start = time.perf_counter()
+                try:
+                    status, content = transport.request(method, path, data)
+                except Exception as e:  # e.g. the server dropped the connection
+                    status, content = 0, b""
+                    with lock:
+                        exceptions[type(e).__name__] += 1
+                elapsed = time.perf_counter() - start
+                with lock:
+                    durations[label].append(elapsed)
+                    statuses[label][status] += 1
+                return status, content
+
+            start_line = threading.Barrier(options["clients"] + 1)
+            clients_done = threading.Event()
+
+            def client(idx: int):
+                rnd = random.Random(options["seed"] * 1_000_003 + idx)
+                transport = make_transport()
+                start_line.wait()
+                try:
+                    for iteration in range(options["iterations"]):
+                        app = "ital" if (idx + iteration) % 2 == 0 else "concert"
+                        event, post_data = events[app]
+                        path = reverse(f"{app}:reservation_form", args=[event.id])
+                        _, content = timed(transport, f"{app} GET reservation_form", "GET", path, {"force": "True"})
+                        if b"<form" not in content:
+                            # Sold out (or an error): there is nothing to post
+                            with lock:
+                                not_posted[app] += 1
+                            continue
+                        places = str(rnd.randint(1, 4))
+                        timed(transport, f"{app} POST reservation_form", "POST", path,
+                              {key.format(places=places): value.format(client=idx, iteration=iteration, places=places)
+                               for key, value in post_data.items()})
+                finally:
+                    connections.close_all()
+
+            def staff_member():
+                transport = make_transport(staff_session)
+                pages = [(f"staff {app}:reservations", reverse(f"{app}:reservations"), {"event_id": str(event.id)})
+                         for app, (event, _) in events.items()] + [("staff payments", reverse("payments"), {})]
+                start_line.wait()
+                try:
+                    while not clients_done.is_set():
+                        for label, path, data in pages:
+                            timed(transport, label, "GET", path, data)
+                finally:
+                    connections.close_all()
+
+            threads = [threading.Thread(target=client, args=(idx,)) for idx in range(options["clients"])]
+            staff_thread = threading.Thread(target=staff_member)
+            for thread in threads:
+                thread.start()
+            staff_thread.start()
+            started = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            clients_done.set()
+            staff_thread.join()
+            elapsed = time.perf_counter() - started
+
+        self.report(options, durations, statuses, exceptions, not_posted, elapsed)
+        problems = self.check_events([event for event, _ in events.values()])
+        if problems:
+            raise CommandError("; ".join(problems))
+
+    def report(self, options, durations, statuses, exceptions, not_posted, elapsed: float) -> None:
+        total = sum(len(values) for values in durations.values())
+        self.stdout.write(
+            f"{connection.vendor}, {'WSGI server' if options['server'] else 'test client'},"
+            f" {options['clients']} clients x {options['iterations']} reservations, {options['seats']} seats per event")
+        self.stdout.write(f"{total} requests in {elapsed:.2f}s: {total / elapsed if elapsed else 0.0:.1f} requests/s")
+        self.stdout.write(f"{'':34} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+        for label in sorted(durations):
+            quantiles = "".join(f" {value * 1000:8.1f}" for _, value in percentiles(durations[label]))
+            codes = ", ".join(f"{status}: {count}" for status, count in sorted(statuses[label].items()))
+            self.stdout.write(f"{label:34} {len(durations[label]):6}{quantiles}  {codes}")
+        for app in sorted({label.split()[0] for label in durations if " reservation_form" in label}):
+            posted = statuses[f"{app} POST reservation_form"]
+            self.stdout.write(f"{app}: {posted[302]} reservations accepted, {posted.total() - posted[302]} refused,"
+                              f" {not_posted[app]} not attempted (no form)")
+        self.stdout.write("Errors: " + (", ".join(f"{name} x {count}" for name, count in exceptions.most_common())
+                                        or "none"))
+
+    def check_events(self, events: list[BaseEvent]) -> list[str]:
+        "Compare the seats of each event to its reservations and look for duplicate bank ids"
+        problems = []
+        for event in events:
+            event.refresh_from_db(fields=["reserved_seats"])
+            places = event.reservation_set.aggregate(models.Sum("places", default=0))["places__sum"]
+            self.stdout.write(f"{event.name}: {places}/{event.max_seats} seats taken by the reservations,"
+                              f" {event.reserved_seats} reserved")
+            if places > event.max_seats:
+                problems.append(f"{event.name} oversold by {places - event.max_seats} seats")
+            if places != event.reserved_seats:
+                problems.append(f"{event.name}: {event.reserved_seats} seats reserved for {places} places")
+        if duplicates := (BaseReservation.objects.values("bank_id")
+                          .annotate(count=models.Count("id")).filter(count__gt=1).count()):
+            problems.append(f"{duplicates} duplicate bank ids")
+        return problems
@@ -0,0 +1,38 @@
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.banking import run_bank_statement_import
+from core.models import BankStatementImport
+from core.qrcodes import prune_qr_code_cache
+
+# Seconds between two cleanups of the QR code disk cache
+QR_CODE_CACHE_PRUNE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = "Import the bank statements uploaded through the payments page"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true",
+                            help="Process the queued imports, then exit instead of waiting for new ones")
+        parser.add_argument("--poll-interval", type=float, default=5.0,
+                            help="Seconds to wait between checks for new imports (default: %(default)s)")
+
+    def handle(self, *args, **options):
+        next_prune = 0.0
+        while True:
+            if time.monotonic() >= next_prune:
+                if removed := prune_qr_code_cache(timedelta(days=settings.QR_CODE_CACHE_MAX_AGE_DAYS)):
+                    self.stdout.write(f"{removed} cached QR code(s) removed")
+                next_prune = time.monotonic() + QR_CODE_CACHE_PRUNE_INTERVAL
+            while (job := BankStatementImport.claim_next()) is not None:
+                run_bank_statement_import(job)
+                self.stdout.write(
+                    f"{job.file_name}: {job.status}, {job.rows_processed}/{job.rows_total} rows, {job.rows_failed} failed"
+                    + (f" ({job.failure})" if job.failure else ""))
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from core.models import BaseEvent, BaseReservation
+
+
+class Command(BaseCommand):
+    help = ("Compare the received amount stored with each reservation to its linked payments and the reserved seats"
+            " stored with each event to the places of its reservations and fix the differences")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Only report the differences and fail if there are any, do not fix them")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = list(BaseReservation.objects
+                           .annotate(actual_received_in_cents=BaseReservation.received_in_cents_subquery())
+                           .exclude(received_in_cents=models.F("actual_received_in_cents"))
+                           .order_by("pk"))
+            for res in drifted:
+                self.stdout.write(
+                    f"{res.bank_id} {res}: {res.received_in_cents} stored, {res.actual_received_in_cents} received")
+            drifted_events = list(BaseEvent.objects
+                                  .annotate(actual_reserved_seats=BaseEvent.reserved_seats_subquery())
+                                  .exclude(reserved_seats=models.F("actual_reserved_seats"))
+                                  .order_by("pk"))
+            for event in drifted_events:
+                self.stdout.write(
+                    f"{event}: {event.reserved_seats} seats stored, {event.actual_reserved_seats} places reserved")
+            if options["check"]:
+                if drifted or drifted_events:
+                    raise CommandError(f"{len(drifted)} reservation(s) with a wrong received amount,"
+                                       f" {len(drifted_events)} event(s) with wrong reserved seats")
+                return
+            BaseReservation.objects.filter(pk__in=[res.pk for res in drifted]).update(
+                received_in_cents=BaseReservation.received_in_cents_subquery())
+            BaseEvent.objects.filter(pk__in=[event.pk for event in drifted_events]).update(
+                reserved_seats=BaseEvent.reserved_seats_subquery())
+        self.stdout.write(f"{len(drifted)} reservation(s) fixed")
+        self.stdout.write(f"{len(drifted_events)} event(s) fixed")
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_baseevent_extra_info'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatementImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(blank=True, max_length=255)),
+                ('content', models.BinaryField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('rows_total', models.IntegerField(default=0)),
+                ('rows_processed', models.IntegerField(default=0)),
+                ('rows_failed', models.IntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('failure', models.CharField(blank=True, max_length=1024)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created'], name='core_bankst_status_876a09_idx')],
+            },
+        ),
+    ]
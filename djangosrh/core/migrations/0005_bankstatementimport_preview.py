@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_bankstatementimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankstatementimport',
+            name='dry_run',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='bankstatementimport',
+            name='preview',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='bankstatementimport',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('previewed', 'Previewed')], default='queued', max_length=16),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:45
+
+import hashlib
+
+from django.db import migrations, models
+
+
+# Frozen copies of core.models.payment_row_digest and content_digest as they
+# were when this migration was written
+def payment_row_digest(*fields) -> str:
+    return hashlib.sha256("\x1f".join(str(field) for field in fields).encode("utf-8")).hexdigest()
+
+
+def content_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def fill_digests(apps, schema_editor):
+    Payment = apps.get_model("core", "Payment")
+    payments = list(Payment.objects.all())
+    for pmnt in payments:
+        pmnt.row_digest = payment_row_digest(pmnt.src_id, pmnt.date_received, pmnt.amount_in_cents, pmnt.other_account,
+                                             pmnt.other_name, pmnt.status, pmnt.comment, pmnt.bank_ref)
+    Payment.objects.bulk_update(payments, ["row_digest"], batch_size=500)
+
+    BankStatementImport = apps.get_model("core", "BankStatementImport")
+    jobs = list(BankStatementImport.objects.only("content"))
+    for job in jobs:
+        job.content_digest = content_digest(bytes(job.content))
+    BankStatementImport.objects.bulk_update(jobs, ["content_digest"], batch_size=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_bankstatementimport_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankstatementimport',
+            name='content_digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='row_digest',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['row_digest'], name='core_paymen_row_dig_b47e0c_idx'),
+        ),
+        migrations.RunPython(fill_digests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:48
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+def fill_received_in_cents(apps, schema_editor):
+    BaseReservation = apps.get_model("core", "BaseReservation")
+    ReservationPayment = apps.get_model("core", "ReservationPayment")
+    BaseReservation.objects.update(received_in_cents=models.functions.Coalesce(
+        models.Subquery(ReservationPayment.objects
+                        .filter(reservation=models.OuterRef("pk"))
+                        .values("reservation")
+                        .annotate(total=models.Sum("payment__amount_in_cents"))
+                        .values("total")),
+        0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_payment_row_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basereservation',
+            name='received_in_cents',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='basereservation',
+            name='remaining_due_in_cents',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('total_due_in_cents'), '-', models.F('received_in_cents')), output_field=models.IntegerField()),
+        ),
+        migrations.RunPython(fill_received_in_cents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_reservation_received_in_cents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseevent',
+            name='reserved_seats',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_baseevent_reserved_seats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.BigIntegerField()),
+            ],
+        ),
+    ]
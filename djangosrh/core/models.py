@@ -1,11 +1,27 @@
 from asyncio import base_events
-from datetime import date
+import collections
+import hashlib
+from datetime import date, timedelta
 import uuid
-from typing import Self
+from typing import Iterable, Self
 
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
-class BaseEvent(models.Model):
+class CounterFieldsMixin:
+    "The COUNTER_FIELDS are maintained with UPDATE ... SET x = x + n, save() never writes them"
+    COUNTER_FIELDS: tuple[str, ...] = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            # Do not overwrite the counters with possibly stale values
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and not field.generated and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
+
+class BaseEvent(CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=200)
     date = models.DateField()
     extra_info = models.CharField(max_length=1000, default="")
@@ -17,10 +33,45 @@ class BaseEvent(models.Model):
     full_payment_confirmation_template = models.CharField(max_length=1024, default='<p>Hi,</p><p>Thank you for your payment for <a class="link-primary" href="%reservation_url%">your reservation</a>.</p><p>Greetings,<br>--&nbsp;<br>Signature</p>')
     partial_payment_confirmation_template = models.CharField(max_length=1024, default='<p>Hi,</p><p>Thank you for your payment for <a class="link-primary" href="%reservation_url%">your reservation</a>.</p><p>You can wire the remaining %remaining_amount_in_euro% € to %organizer_name% (%bank_account%, %organizer_bic%) with the communication <pre>%formatted_bank_id%</pre>.</p><p>Greetings,<br>--&nbsp;<br>Signature</p>')
     max_seats = models.IntegerField()
+    # Seats taken by the reservations, see reserve_seats and release_seats
+    reserved_seats = models.IntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ("reserved_seats",)
 
     def __str__(self):
         return f"{self.name}@{self.date}"
 
+    def reserve_seats(self, count: int) -> bool:
+        """Take `count' seats if they are still available
+
+        The check and the increment are one conditional UPDATE, so that
+        simultaneous reservations can not overbook the event."""
+        if not BaseEvent.objects.filter(pk=self.pk, reserved_seats__lte=models.F("max_seats") - count).update(
+                reserved_seats=models.F("reserved_seats") + count):
+            return False
+        self.refresh_from_db(fields=["reserved_seats"])
+        return True
+
+    def take_seats(self, count: int) -> None:
+        "Take `count' seats (give them back if negative) even if that overbooks the event, e.g. in the admin"
+        BaseEvent.objects.filter(pk=self.pk).update(reserved_seats=models.F("reserved_seats") + count)
+
+    def release_seats(self, count: int) -> None:
+        BaseEvent.objects.filter(pk=self.pk).update(reserved_seats=models.F("reserved_seats") - count)
+
+    @classmethod
+    def reserved_seats_subquery(cls) -> models.Expression:
+        "Actual sum of the places of the reservations (see register_seated_reservation) of the event of the outer query"
+        return sum((models.functions.Coalesce(
+                        models.Subquery(model.objects
+                                        .filter(base_event=models.OuterRef("pk"))
+                                        .values("base_event")
+                                        .annotate(total=models.Sum(model.SEATS_FIELD))
+                                        .values("total")),
+                        0)
+                    for model in SEATED_RESERVATIONS),
+                   models.Value(0))
+
 
 class Payment(models.Model):
     date_received = models.DateField(null=False) # When payment was received by the bank
@@ -33,6 +84,7 @@ class Payment(models.Model):
     status = models.CharField(max_length=16, blank=False)
     active = models.BooleanField(db_default=True)
     srh_bank_id = models.CharField(max_length=12, blank=True, null=False)
+    row_digest = models.CharField(max_length=64, blank=True, editable=False) # see compute_row_digest
     created = models.DateTimeField(auto_now_add=True)
     last_modified = models.DateTimeField(auto_now=True)
 
@@ -40,13 +92,23 @@ class Payment(models.Model):
         indexes = [
             models.Index(fields=["src_id"]),
             models.Index(fields=["bank_ref"]),
-            models.Index(fields=["srh_bank_id"])
+            models.Index(fields=["srh_bank_id"]),
+            models.Index(fields=["row_digest"]),
         ]
         constraints = [models.UniqueConstraint(fields=["bank_ref"], name="%(app_label)s_%(class)s_unique_bank_ref")]
 
     def __str__(self):
         return f"{self.bank_ref}:{self.amount_in_cents}c€"
 
+    def save(self, *args, **kwargs):
+        self.row_digest = self.compute_row_digest()
+        super().save(*args, **kwargs)
+
+    def compute_row_digest(self) -> str:
+        "Fingerprint of the bank statement row, to recognize it when a statement is uploaded again"
+        return payment_row_digest(self.src_id, self.date_received, self.amount_in_cents, self.other_account,
+                                  self.other_name, self.status, self.comment, self.bank_ref)
+
     @classmethod
     def find_by_bank_ref(cls, bank_ref: str) -> Self | None:
         try:
@@ -55,6 +117,134 @@ class Payment(models.Model):
             return None
 
 
+def payment_row_digest(*fields) -> str:
+    return hashlib.sha256("\x1f".join(str(field) for field in fields).encode("utf-8")).hexdigest()
+
+
+def content_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class BankIdSequence(models.Model):
+    "Next structured communication number to hand out, leased in blocks by core.banking.BankIdAllocator"
+    next_value = models.BigIntegerField()
+
+
+class ImportStatus(models.TextChoices):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    PREVIEWED = "previewed"
+
+
+class ImportAction(models.TextChoices):
+    "What importing a row of a bank statement does (or would do) to the Payment table"
+    NEW = "new", "nouvelle transaction"
+    CORRECTION = "correction", "correction du n° de séquence"
+    DUPLICATE = "duplicate", "déjà importée"
+    UNCHANGED = "unchanged", "déjà importée à l'identique"
+    CONFLICT = "conflict", "conflit avec une autre transaction"
+    TOO_OLD = "too_old", "trop ancienne"
+
+
+# Imports still running after this long are assumed to have lost their
+# worker (killed or crashed), see BankStatementImport.fail_abandoned
+IMPORT_RUNNING_TIMEOUT = timedelta(hours=1)
+
+
+class BankStatementImport(models.Model):
+    "A bank statements CSV waiting to be (or being) imported by the `process_bank_statement_imports' worker"
+    file_name = models.CharField(max_length=255, blank=True)
+    content = models.BinaryField()
+    content_digest = models.CharField(max_length=64, blank=True, db_index=True) # see content_digest()
+    status = models.CharField(max_length=16, choices=ImportStatus, default=ImportStatus.QUEUED)
+    rows_total = models.IntegerField(default=0)
+    rows_processed = models.IntegerField(default=0)
+    rows_failed = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True) # one dict per failed row
+    dry_run = models.BooleanField(default=False) # only classify the rows and wait for confirmation
+    preview = models.JSONField(default=list, blank=True) # one dict per classified row of a dry run
+    failure = models.CharField(max_length=1024, blank=True) # why the whole import failed
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created"])]
+
+    def __str__(self):
+        return f"{self.file_name}@{self.created}:{self.status}"
+
+    def save(self, *args, **kwargs):
+        if not self.content_digest:
+            self.content_digest = content_digest(bytes(self.content))
+        super().save(*args, **kwargs)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (ImportStatus.DONE, ImportStatus.FAILED, ImportStatus.PREVIEWED)
+
+    def is_abandoned(self) -> bool:
+        return (self.status == ImportStatus.RUNNING
+                and self.started is not None
+                and self.started < timezone.now() - IMPORT_RUNNING_TIMEOUT)
+
+    @classmethod
+    def fail_abandoned(cls) -> int:
+        """Mark the imports running for more than IMPORT_RUNNING_TIMEOUT as failed
+
+        Their worker was killed or crashed: they would stay running forever.
+        Return the number of such imports."""
+        now = timezone.now()
+        return cls.objects.filter(status=ImportStatus.RUNNING, started__lt=now - IMPORT_RUNNING_TIMEOUT).update(
+            status=ImportStatus.FAILED, finished=now,
+            failure=f"Abandoned by its worker (still running after {IMPORT_RUNNING_TIMEOUT})")
+
+    @classmethod
+    def claim_next(cls) -> Self | None:
+        """Mark the oldest queued import as running and return it
+
+        The conditional UPDATE makes sure that only one worker gets a given
+        import, without needing row locks (which SQLite does not support).
+        Abandoned imports are failed first (see fail_abandoned)."""
+        cls.fail_abandoned()
+        for job_id in cls.objects.filter(status=ImportStatus.QUEUED).order_by("created", "id").values_list("id", flat=True)[:10]:
+            if cls.objects.filter(pk=job_id, status=ImportStatus.QUEUED).update(
+                    status=ImportStatus.RUNNING, started=timezone.now()):
+                return cls.objects.get(pk=job_id)
+        return None
+
+    def failed_rows(self) -> list[tuple[str, Payment]]:
+        "Failed rows as (error message, unsaved Payment) like the results of `import_bank_statements'"
+        return [(err["error"], Payment(
+            date_received=date.fromisoformat(err["date_received"]),
+            amount_in_cents=err["amount_in_cents"],
+            bank_ref=err["bank_ref"],
+            other_account=err["other_account"],
+            other_name=err["other_name"],
+        )) for err in self.errors]
+
+    def preview_rows(self) -> list[tuple[str, str | None, Payment, str | None]]:
+        "Rows of a dry run as (ImportAction label, error message, unsaved Payment, src_id before the correction or None)"
+        return [(ImportAction(row["action"]).label, row["error"], Payment(
+            date_received=date.fromisoformat(row["date_received"]),
+            amount_in_cents=row["amount_in_cents"],
+            comment=row["comment"],
+            src_id=row["src_id"],
+            bank_ref=row["bank_ref"],
+            other_account=row["other_account"],
+            other_name=row["other_name"],
+            srh_bank_id=row["srh_bank_id"],
+            status=row["status"],
+        ), row["previous_src_id"]) for row in self.preview]
+
+    def preview_summary(self) -> dict[str, int]:
+        "Number of rows of a dry run per ImportAction label"
+        counts = collections.Counter(row["action"] for row in self.preview)
+        return {action.label: counts[action] for action in ImportAction if counts[action]}
+
+
 class Civility(models.TextChoices):
     man = "Mr"
     woman = "Mme"
@@ -62,13 +252,20 @@ class Civility(models.TextChoices):
     __empty__ = ""
 
 
-class BaseReservation(models.Model):
+class BaseReservation(CounterFieldsMixin, models.Model):
     civility = models.CharField(max_length=20, choices=Civility, default=Civility.__empty__)
     last_name = models.CharField(max_length=200, blank=False)
     first_name = models.CharField(max_length=200, default="")
     email = models.CharField(max_length=200)
     accepts_rgpd_reuse = models.BooleanField()
     total_due_in_cents = models.IntegerField()
+    # Sum of the linked payments, maintained by core.signals (see also the
+    # recompute_reservation_balances command)
+    received_in_cents = models.IntegerField(default=0, editable=False)
+    remaining_due_in_cents = models.GeneratedField(
+        expression=models.F("total_due_in_cents") - models.F("received_in_cents"),
+        output_field=models.IntegerField(),
+        db_persist=True)
     extra_comment = models.CharField(default="", max_length=200, blank=True)
     uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     bank_id = models.CharField(unique=True, editable=False, max_length=16)
@@ -81,11 +278,38 @@ class BaseReservation(models.Model):
     def full_name(self) -> str:
         return " ".join(x for x in (self.civility, self.first_name, self.last_name) if x and x.strip())
 
+    COUNTER_FIELDS = ("received_in_cents",)
+    # Column with the number of seats taken, if registered with register_seated_reservation
+    SEATS_FIELD: str | None = None
+
     def __str__(self):
         return f"{self.full_name} ({self.email})"
 
     def remaining_amount_due_in_cents(self) -> int:
-        return self.total_due_in_cents - self.reservationpayment_set.aggregate(sum=models.Sum("payment__amount_in_cents", default=0))['sum']
+        return self.remaining_due_in_cents
+
+    @classmethod
+    def received_in_cents_subquery(cls) -> models.Func:
+        "Actual sum of the payments linked to the reservation of the outer query"
+        return models.functions.Coalesce(
+            models.Subquery(ReservationPayment.objects
+                            .filter(reservation=models.OuterRef("pk"))
+                            .values("reservation")
+                            .annotate(total=models.Sum("payment__amount_in_cents"))
+                            .values("total")),
+            0)
+
+
+# Reservation models taking seats of their event, see register_seated_reservation
+SEATED_RESERVATIONS: list[type[BaseReservation]] = []
+
+
+def register_seated_reservation(model: type[BaseReservation]) -> type[BaseReservation]:
+    """Class decorator counting the `SEATS_FIELD' of `model' in BaseEvent.reserved_seats_subquery"""
+    model._meta.get_field(model.SEATS_FIELD)  # fail early, not in every event query
+    if model not in SEATED_RESERVATIONS:
+        SEATED_RESERVATIONS.append(model)
+    return model
 
 
 class ReservationPayment(models.Model):
@@ -96,35 +320,51 @@ class ReservationPayment(models.Model):
     class Meta:
         constraints = [models.UniqueConstraint("payment", name="%(app_label)s_%(class)s_unique_payment")]
 
+    def save(self, *args, **kwargs):
+        # The received amount of the reservation is updated by a post_save
+        # signal handler: commit both together.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+def find_likely_payments(bank_ids: Iterable[str], min_date_received: date) -> dict[str, Payment]:
+    """Map each bank_id to its likely payment, with one query for all bank_ids
+
+    The likely payment of a bank_id is the accepted, active payment with that
+    structured communication received after `min_date_received' and not yet
+    linked to a reservation, with the lowest bank_ref."""
+    likely_payments: dict[str, Payment] = {}
+    if not (bank_ids := set(bank_ids)):
+        return likely_payments
+    for pmnt in (Payment.objects
+                 .filter(srh_bank_id__in=bank_ids,
+                         status="Accepté",
+                         active=True,
+                         date_received__gt=min_date_received,
+                         reservationpayment__isnull=True)
+                 .order_by("srh_bank_id", "bank_ref")):
+        likely_payments.setdefault(pmnt.srh_bank_id, pmnt)
+    return likely_payments
+
+
+def attach_likely_payments(reservations: Iterable["BaseReservation"], min_date_received: date) -> None:
+    """Set `likely_payment' (and its flattened `likely_payment_*' fields) on each reservation"""
+    reservations = list(reservations)
+    likely_payments = find_likely_payments((res.bank_id for res in reservations), min_date_received)
+    for res in reservations:
+        pmnt = likely_payments.get(res.bank_id)
+        res.likely_payment = pmnt
+        res.likely_payment_id = None if pmnt is None else pmnt.id
+        res.likely_payment_other_name = None if pmnt is None else pmnt.other_name
+        res.likely_payment_other_account = None if pmnt is None else pmnt.other_account
+        res.likely_payment_amount_in_cents = None if pmnt is None else pmnt.amount_in_cents
+        res.likely_payment_src_id = None if pmnt is None else pmnt.src_id
+
+
+def get_reservations_with_likely_payments(min_date_received: date, reservations: models.QuerySet) -> list["BaseReservation"]:
+    """The `reservations' with their likely payment attached (see `attach_likely_payments')
 
-def get_reservations_with_likely_payments(min_date_received: date, reservations: models.QuerySet):
-    # Subquery to get the payment with the lowest bank_ref that matches the constraints
-    matching_payment_subquery = (
-        Payment.objects.filter(
-            srh_bank_id=models.OuterRef("bank_id"),
-            status="Accepté",
-            active=True,
-            date_received__gt=min_date_received,
-        )
-        .exclude(
-            id__in=ReservationPayment.objects.values_list("payment_id", flat=True)
-        )
-        .order_by("bank_ref")  # Order by lowest bank_ref
-        [:1]
-    )
-
-    # Use a single subquery instance to avoid duplication
-    matching_payment = models.Subquery(matching_payment_subquery)
-
-    # Annotate the Reservation with the matching payment details
-    reservations_with_payment = (reservations
-        .annotate(
-            total_received_in_cents=models.Sum("reservationpayment__payment__amount_in_cents", default=0),
-            likely_payment_id=models.Subquery(matching_payment_subquery.values("id"), output_field=models.IntegerField()),
-            likely_payment_other_name=models.Subquery(matching_payment_subquery.values("other_name"), output_field=models.CharField()),
-            likely_payment_other_account=models.Subquery(matching_payment_subquery.values("other_account"), output_field=models.CharField()),
-            likely_payment_amount_in_cents=models.Subquery(matching_payment_subquery.values("amount_in_cents"), output_field=models.IntegerField()),
-            likely_payment_src_id=models.Subquery(matching_payment_subquery.values("src_id"), output_field=models.CharField()),
-    ))
-
-    return reservations_with_payment
+    All likely payments are fetched in one query after the reservations."""
+    reservations = list(reservations.all())
+    attach_likely_payments(reservations, min_date_received)
+    return reservations
@@ -0,0 +1,185 @@
+import collections
+from contextlib import ExitStack
+import contextvars
+import math
+import threading
+import time
+from typing import Callable, Iterable, NamedTuple
+
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.template.backends.django import DjangoTemplates
+
+# Requests kept per view to compute the percentiles
+PERFORMANCE_WINDOW = 1000
+PERFORMANCE_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RequestMeasure(NamedTuple):
+    queries: int
+    db_seconds: float
+    template_seconds: float
+    wall_seconds: float
+
+
+METRICS: dict[str, str] = {
+    "queries": "SQL queries per request",
+    "db_seconds": "Time spent in SQL queries per request",
+    "template_seconds": "Time spent rendering templates per request",
+    "wall_seconds": "Time spent handling the request",
+}
+
+
+def percentiles(values: Iterable[float], quantiles: Iterable[float] = PERFORMANCE_QUANTILES) -> list[tuple[float, float]]:
+    "Nearest-rank `quantiles' of `values' (nothing if there are no values)"
+    if not (ordered := sorted(values)):
+        return []
+    return [(q, ordered[max(0, math.ceil(q * len(ordered)) - 1)]) for q in quantiles]
+
+
+class ViewStats:
+    "Totals since startup and the last PERFORMANCE_WINDOW measures of one view"
+    def __init__(self, window: int = PERFORMANCE_WINDOW):
+        self.count = 0
+        self.totals = RequestMeasure(0, 0.0, 0.0, 0.0)
+        self.recent: collections.deque[RequestMeasure] = collections.deque(maxlen=window)
+
+    def add(self, measure: RequestMeasure) -> None:
+        self.count += 1
+        self.totals = RequestMeasure(*map(sum, zip(self.totals, measure)))
+        self.recent.append(measure)
+
+    def quantiles(self, metric: str) -> list[tuple[float, float]]:
+        "PERFORMANCE_QUANTILES of the recent values of `metric'"
+        return percentiles([getattr(measure, metric) for measure in self.recent])
+
+
+class PerformanceRecorder:
+    "Thread safe registry of ViewStats by URL name"
+    def __init__(self, window: int = PERFORMANCE_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._views: dict[str, ViewStats] = {}
+
+    def record(self, view_name: str, measure: RequestMeasure) -> None:
+        with self._lock:
+            if (stats := self._views.get(view_name)) is None:
+                stats = self._views[view_name] = ViewStats(self.window)
+            stats.add(measure)
+
+    def snapshot(self) -> list[tuple[str, ViewStats]]:
+        "Copies of the ViewStats, sorted by URL name"
+        with self._lock:
+            copies = []
+            for name, stats in sorted(self._views.items()):
+                copy = ViewStats(self.window)
+                copy.count, copy.totals, copy.recent = stats.count, stats.totals, collections.deque(stats.recent)
+                copies.append((name, copy))
+            return copies
+
+    def clear(self) -> None:
+        with self._lock:
+            self._views.clear()
+
+
+recorder = PerformanceRecorder()
+
+
+class _Timings:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        "Database execute wrapper"
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+_current: contextvars.ContextVar[_Timings | None] = contextvars.ContextVar("performance_timings", default=None)
+
+
+class _TimedTemplate:
+    "Template of TimedDjangoTemplates, adding its render time to the request being measured"
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        if (timings := _current.get()) is None:
+            return self._template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            timings.template_seconds += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing the renders for PerformanceMiddleware
+
+    Set it as the BACKEND of TEMPLATES.  Only the renders of the backend
+    (render(), TemplateResponse, render_to_string) are timed, {% include %}
+    and {% extends %} are part of them.  Outside of a request, rendering is
+    not affected."""
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+def _view_name(request: HttpRequest) -> str:
+    if (match := getattr(request, "resolver_match", None)) is None:
+        return "<unresolved>"
+    return match.view_name
+
+
+class PerformanceMiddleware:
+    """Record the SQL queries, database, template and wall time per URL name
+
+    The template time is only measured with the TimedDjangoTemplates
+    backend.  Streaming responses are only measured until their headers are
+    ready."""
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        timings = _Timings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                return self.get_response(request)
+        finally:
+            wall_seconds = time.perf_counter() - start
+            _current.reset(token)
+            recorder.record(_view_name(request), RequestMeasure(
+                timings.queries, timings.db_seconds, timings.template_seconds, wall_seconds))
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(snapshot: list[tuple[str, ViewStats]]) -> str:
+    "The statistics in the Prometheus text exposition format (one summary per metric)"
+    lines = []
+    for metric, help_text in METRICS.items():
+        name = f"djangosrh_request_{metric}"
+        lines += [f"# HELP {name} {help_text}.", f"# TYPE {name} summary"]
+        for view_name, stats in snapshot:
+            view = _label(view_name)
+            lines += [f'{name}{{view="{view}",quantile="{q}"}} {value}' for q, value in stats.quantiles(metric)]
+            lines += [f'{name}_sum{{view="{view}"}} {getattr(stats.totals, metric)}',
+                      f'{name}_count{{view="{view}"}} {stats.count}']
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,113 @@
+from datetime import UTC, datetime, timedelta
+import hashlib
+import io
+import os
+from pathlib import Path
+import tempfile
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+import qrcode
+from qrcode.image.svg import SvgPathFillImage
+
+from core.cache import LRUCache
+
+
+class QRCodeImage(NamedTuple):
+    content: bytes
+    content_type: str
+    etag: str  # strong, already quoted
+    last_modified: datetime
+
+
+QR_CODE_CONTENT_TYPES = {"svg": "image/svg+xml", "png": "image/png"}
+
+# The image only depends on the payload: no need to ever expire them
+_qr_codes: LRUCache[QRCodeImage] = LRUCache(maxsize=256, ttl=None)
+
+
+def _key(payload: str, fmt: str) -> str:
+    if fmt not in QR_CODE_CONTENT_TYPES:
+        raise ValueError(f"Unknown QR code format {fmt!r}")
+    return hashlib.sha256(f"{fmt}\n{payload}".encode("utf8")).hexdigest()[:32]
+
+
+def _encode(payload: str, fmt: str) -> bytes:
+    if fmt == "svg":
+        return qrcode.make(payload, image_factory=SvgPathFillImage).to_string()
+    buffer = io.BytesIO()
+    qrcode.make(payload).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _cache_file(key: str, fmt: str) -> Path | None:
+    if not (cache_dir := getattr(settings, "QR_CODE_CACHE_DIR", None)):
+        return None
+    return Path(cache_dir) / key[:2] / f"{key}.{fmt}"
+
+
+def _read_cache_file(path: Path) -> tuple[bytes, datetime] | None:
+    try:
+        return path.read_bytes(), datetime.fromtimestamp(path.stat().st_mtime, UTC)
+    except OSError:
+        return None
+
+
+def _write_cache_file(path: Path, content: bytes) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so that concurrent readers never see half a file
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+            tmp.write(content)
+        os.replace(tmp.name, path)
+    except OSError:
+        pass  # the disk cache is only an optimization
+
+
+def _build(payload: str, fmt: str, key: str) -> QRCodeImage:
+    path = _cache_file(key, fmt)
+    if path is None or (cached := _read_cache_file(path)) is None:
+        content, last_modified = _encode(payload, fmt), datetime.now(UTC)
+        if path is not None:
+            _write_cache_file(path, content)
+    else:
+        content, last_modified = cached
+    return QRCodeImage(content=content,
+                       content_type=QR_CODE_CONTENT_TYPES[fmt],
+                       etag=f'"{key}"',
+                       last_modified=last_modified.replace(microsecond=0))
+
+
+def render_qr_code(payload: str, fmt: str = "svg") -> QRCodeImage:
+    """QR code of `payload' as an SVG or PNG image
+
+    Rendered images are kept in a process-local LRU cache and, if
+    settings.QR_CODE_CACHE_DIR is set, on disk for the other processes."""
+    key = _key(payload, fmt)
+    return _qr_codes.get_or_build(key, lambda: _build(payload, fmt, key))
+
+
+def prune_qr_code_cache(max_age: timedelta) -> int:
+    """Remove the files of settings.QR_CODE_CACHE_DIR older than `max_age'
+
+    Each payload change (e.g. of the remaining amount) adds a file, while
+    most of them are never requested again: they are rendered again when
+    they are.  Return the number of files removed."""
+    if not (cache_dir := getattr(settings, "QR_CODE_CACHE_DIR", None)):
+        return 0
+    oldest = time.time() - max_age.total_seconds()
+    removed = 0
+    for path in Path(cache_dir).glob("*/*"):
+        try:
+            if path.stat().st_mtime < oldest:
+                path.unlink()
+                removed += 1
+        except OSError:
+            pass  # e.g. removed by another worker in the meantime
+    return removed
+
+
+def qr_code_etag(payload: str, fmt: str = "svg") -> str:
+    "ETag of render_qr_code(payload, fmt), without rendering it"
+    return f'"{_key(payload, fmt)}"'
@@ -0,0 +1,73 @@
+from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import BaseReservation, Payment, ReservationPayment
+
+
+def _payment_amount_in_cents(reservation_payment: ReservationPayment) -> int:
+    if ReservationPayment.payment.is_cached(reservation_payment):
+        return reservation_payment.payment.amount_in_cents
+    return Payment.objects.values_list("amount_in_cents", flat=True).get(pk=reservation_payment.payment_id)
+
+
+def _add_to_received_in_cents(reservation_payment: ReservationPayment, amount_in_cents: int) -> None:
+    BaseReservation.objects.filter(pk=reservation_payment.reservation_id).update(
+        received_in_cents=models.F("received_in_cents") + amount_in_cents)
+    if ReservationPayment.reservation.is_cached(reservation_payment):
+        # so that e.g. the payment confirmation mail shows the new balance
+        reservation_payment.reservation.refresh_from_db(fields=["received_in_cents", "remaining_due_in_cents"])
+
+
+def _may_change(update_fields, *field_names: str) -> bool:
+    return update_fields is None or any(name in update_fields for name in field_names)
+
+
+@receiver(pre_save, sender=ReservationPayment)
+def reservation_payment_saving(sender, instance: ReservationPayment, raw: bool = False, update_fields=None, **kwargs):
+    # Remember the link as it is in the DB to move the amount if it changes
+    instance._previous_link = None
+    if not instance._state.adding and not raw and _may_change(update_fields, "reservation", "payment"):
+        instance._previous_link = (ReservationPayment.objects
+                                   .filter(pk=instance.pk)
+                                   .values_list("reservation_id", "payment_id", "payment__amount_in_cents")
+                                   .first())
+
+
+@receiver(post_save, sender=ReservationPayment)
+def reservation_payment_saved(sender, instance: ReservationPayment, created: bool, raw: bool = False, **kwargs):
+    if raw:
+        return
+    if created:
+        _add_to_received_in_cents(instance, _payment_amount_in_cents(instance))
+    elif (previous_link := getattr(instance, "_previous_link", None)) is not None:
+        reservation_id, payment_id, amount_in_cents = previous_link
+        if (reservation_id, payment_id) != (instance.reservation_id, instance.payment_id):
+            BaseReservation.objects.filter(pk=reservation_id).update(
+                received_in_cents=models.F("received_in_cents") - amount_in_cents)
+            _add_to_received_in_cents(instance, _payment_amount_in_cents(instance))
+
+
+@receiver(post_delete, sender=ReservationPayment)
+def reservation_payment_deleted(sender, instance: ReservationPayment, **kwargs):
+    _add_to_received_in_cents(instance, -_payment_amount_in_cents(instance))
+
+
+@receiver(pre_save, sender=Payment)
+def payment_saving(sender, instance: Payment, raw: bool = False, update_fields=None, **kwargs):
+    # Remember the amount as it is in the DB to update the linked reservation if it changes
+    instance._previous_amount_in_cents = None
+    if not instance._state.adding and not raw and _may_change(update_fields, "amount_in_cents"):
+        instance._previous_amount_in_cents = (Payment.objects
+                                              .filter(pk=instance.pk)
+                                              .values_list("amount_in_cents", flat=True)
+                                              .first())
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance: Payment, created: bool, raw: bool = False, **kwargs):
+    previous_amount_in_cents = getattr(instance, "_previous_amount_in_cents", None)
+    if created or raw or previous_amount_in_cents is None or previous_amount_in_cents == instance.amount_in_cents:
+        return
+    BaseReservation.objects.filter(reservationpayment__payment_id=instance.pk).update(
+        received_in_cents=models.F("received_in_cents") + (instance.amount_in_cents - previous_amount_in_cents))
@@ -0,0 +1,32 @@
+"""A bank statement (CSV export) shared by the tests of the imports
+
+The src_ids and dates are in the current year so that the rows are not
+rejected as too old."""
+import time
+
+YEAR_PREFIX = time.strftime("%Y")
+
+BANK_STATEMENTS_CSV = [
+    "Nº de séquence;Date d'exécution;Date valeur;Montant;Devise du compte;Numéro de compte;Type de transaction;Contrepartie;Nom de la contrepartie;Communication;Détails;Statut;Motif du refus",
+    f"{YEAR_PREFIX}-00127;28/03/{YEAR_PREFIX};28/03/{YEAR_PREFIX};18;EUR;BE00010001000101;Virement en euros;BE00020002000202;ccccc-ccccccccc;Reprise marchandises (viande hachee) souper italien;VIREMENT EN EUROS DU COMPTE BE00020002000202 BIC GABBBEBB CCCCC-CCCCCCCCC AV DE LA GARE 76 9999 WAGADOUGOU COMMUNICATION : REPRISE MARCHANDISES (VIANDE HACHEE) SOUPER ITALIEN REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032412002 DATE VALEUR : 28/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00126;28/03/{YEAR_PREFIX};28/03/{YEAR_PREFIX};50;EUR;BE00010001000101;Virement en euros;BE00030003000303;HHHHHHH SSSSSSSS;Cotisation;VIREMENT EN EUROS DU COMPTE BE00030003000303 BIC GABBBEBB HHHHHHH SSSSSSSS CHEMIN DE LA GARE 123 9999 WAGADOUGOU COMMUNICATION : COTISATION REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032409003 DATE VALEUR : 28/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00125;28/03/{YEAR_PREFIX};28/03/{YEAR_PREFIX};54;EUR;BE00010001000101;Virement en euros;BE00040004000404;Mme RRRRRRRRRR GGGGG;Souper italien du 25/03 : 2 x 27;VIREMENT EN EUROS DU COMPTE BE00 0400 0400 0404 BIC GABBBEBB MME RRRRRRRRRR GGGGG RUE DE LA GARE,3 3333 ZANZIBAR COMMUNICATION : SOUPER ITALIEN DU 25/03 : 2 X 27 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032406004 DATE VALEUR : 28/03/{YEAR_PREFIX};Accepté",
+    f"{YEAR_PREFIX}-00124;27/03/{YEAR_PREFIX};27/03/{YEAR_PREFIX};-54;EUR;BE00010001000101;Virement en euros;BE00050005000505;Aaa Bbbbbbbb;Remboursement repas italien Harmonie ( pas venu);VIREMENT EN EUROS AU COMPTE BE00 0500 0500 0505 BIC GABBBEBB VIA MOBILE BANKING AAA BBBBBBBB COMMUNICATION : REMBOURSEMENT REPAS ITALIEN HARMONIE ( PAS VENU) BISES ANDRE REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032430005 DATE VALEUR : 27/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00123;27/03/{YEAR_PREFIX};27/03/{YEAR_PREFIX};15;EUR;BE00010001000101;Paiement par carte;BE060006000606;BANKSYS;068962070000270121363927012136391010271908660328072700000620700000000088000000000000000P2P MOBILE 000;PAIEMENT MOBILE COMPTE DU DONNEUR D'ORDRE : BE06 0006 0006 06 BIC GABBBEBB BANCONTACT REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032427006 DATE VALEUR : 27/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00122;27/03/{YEAR_PREFIX};27/03/{YEAR_PREFIX};57;EUR;BE00010001000101;Virement en euros;BE070007000707;OOOOO QQQQQ;;VIREMENT EN EUROS DU COMPTE BE07 0007 0007 07 BIC GABBBEBB OOOOO QQQQQ CHAUSSEE DE LA GARE 5 1440 6666 PORT-AU-BOUC PAS DE COMMUNICATION REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032424007 DATE VALEUR : 27/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00121;27/03/{YEAR_PREFIX};27/03/{YEAR_PREFIX};60;EUR;BE00010001000101;Virement instantané en euros;BE080008000808;EEEEEEE JJJJJJ;Cotisation Eeeeeee - Jjjjjj;VIREMENT INSTANTANE EN EUROS BE08 0008 0008 08 BIC GABBBEBBXXX EEEEEEE JJJJJJ RUE DE LA MARIEE 50 7777 NEW YORK COMMUNICATION : COTISATION EEEEEEE - JJJJJJ REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032448008 DATE VALEUR : 27/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00120;26/03/{YEAR_PREFIX};26/03/{YEAR_PREFIX};25;EUR;BE00010001000101;Virement instantané en euros;BE090009000909;DDDDDDD VVVVVVVVVVVVVVVVV;Llll Aaaa cotisation;VIREMENT INSTANTANE EN EUROS BE09 0009 0009 09 BIC GABBBEBBXXX DDDDDDD VVVVVVVVVVVVVVVVV RUE DES MIETTES 32 6666 HYDERABAD COMMUNICATION : LLLL AAAA COTISATION REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032445009 DATE VALEUR : 26/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00119;25/03/{YEAR_PREFIX};24/03/{YEAR_PREFIX};27;EUR;BE00010001000101;Virement instantané en euros;BE100010001010;SSSSSS GGGGGGGG;+++671/4235/58049+++;VIREMENT INSTANTANE EN EUROS BE10 0010 0010 10 BIC GABBBEBBXXX SSSSSS GGGGGGGG RUE MARIGNON 43/5 8888 BANDARLOG COMMUNICATION : 671423558049 EXECUTE LE 24/03 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032442010 DATE VALEUR : 24/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00118;24/03/{YEAR_PREFIX};23/03/{YEAR_PREFIX};16;EUR;BE00010001000101;Virement en euros;BE110011001111;WWWWWWW XXXXXXXX;+++402/9754/33613+++;VIREMENT EN EUROS DU COMPTE BE11 0011 0011 11 BIC GABBBEBB WWWWWWW XXXXXXXX CLOS DE LA GARE 30 8888 BANDARLOG COMMUNICATION : 402975433613 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032439011 DATE VALEUR : 23/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00117;24/03/{YEAR_PREFIX};24/03/{YEAR_PREFIX};81;EUR;BE00010001000101;Virement en euros;BE202020202020;JAJAJA-BLBLBLBL;+++483/5138/12577+++;VIREMENT EN EUROS DU COMPTE BE20 0013 0492 7256 BIC GABBBEBB JAJAJA-BLBLBLBL AV. DE L'EGLISE 41 8888 BANDARLOG COMMUNICATION : 483513812577 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032463012 DATE VALEUR : 24/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00116;23/03/{YEAR_PREFIX};23/03/{YEAR_PREFIX};-33.6;EUR;BE00010001000101;Paiement par carte;;;;PAIEMENT AVEC LA CARTE DE DEBIT NUMERO 4871 09XX XXXX 7079 GROENDEKOR BVBA SINT-PIET 23/03/2023 BANCONTACT REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032460013 DATE VALEUR : 23/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00115;23/03/{YEAR_PREFIX};22/03/{YEAR_PREFIX};16;EUR;BE00010001000101;Virement en euros;BE110011001111;WWWWWWW XXXXXXXX;+++476/7706/09825+++;VIREMENT EN EUROS DU COMPTE BE11 0011 0011 11 BIC GABBBEBB WWWWWWW XXXXXXXX CLOS DE LA GARE 30 8888 BANDARLOG COMMUNICATION : 476770609825 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032457014 DATE VALEUR : 22/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00114;23/03/{YEAR_PREFIX};23/03/{YEAR_PREFIX};54;EUR;BE00010001000101;Virement en euros;BE120012001212;Ggggggggggg Gggggg;852598350718;VIREMENT EN EUROS DU COMPTE BE12 0012 0012 12 BIC GABBBEBB GGGGGGGGGGG GGGGGG PLACE DE LA GARE 12 8888 BANDARLOG COMMUNICATION : 852598350718 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032454015 DATE VALEUR : 23/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00113;22/03/{YEAR_PREFIX};22/03/{YEAR_PREFIX};-100.87;EUR;BE00010001000101;Virement en euros;BE89375104780085;Unisono;+++323/0086/13607+++;VIREMENT EN EUROS AU COMPTE BE89 3751 0478 0085 BIC GABBBEBB VIA MOBILE BANKING UNISONO COMMUNICATION : 323008613607 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032478016 DATE VALEUR : 22/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00112;22/03/{YEAR_PREFIX};21/03/{YEAR_PREFIX};25;EUR;BE00010001000101;Virement en euros;BE130013001313;DEDEDEDE DEDED;Cotisation SRH;VIREMENT EN EUROS DU COMPTE BE13 0013 0013 13 BIC GABBBEBB DEDEDEDE DEDED RUE DE L'EGLISE 33 6666 PORT-AU-BOUC COMMUNICATION : COTISATION SRH REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032475017 DATE VALEUR : 21/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00111;22/03/{YEAR_PREFIX};22/03/{YEAR_PREFIX};27;EUR;BE00010001000101;Virement en euros;BE140014001414;SOSOSOS OSOSOS;+++409/5503/55816+++;VIREMENT EN EUROS DU COMPTE BE14 0014 0014 14 BIC GABBBEBB SOSOSOS OSOSOS RUE DES APACHES 42 5555 ZOLLIKON COMMUNICATION : 409550355816 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032472018 DATE VALEUR : 22/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-00110;22/03/{YEAR_PREFIX};22/03/{YEAR_PREFIX};54;EUR;BE00010001000101;Virement en euros;BE150015001515;Iaiaiaiaia Iaia;483421245780;VIREMENT EN EUROS DU COMPTE BE15 0015 0015 15 BIC GABBBEBB IAIAIAIAIA IAIA BOULEVARD DE LA GARE 67 4444 MODANE COMMUNICATION : 483421245780 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032496019 DATE VALEUR : 22/03/{YEAR_PREFIX};Accepté;",
+    f";21/03/{YEAR_PREFIX};21/03/{YEAR_PREFIX};81;EUR;BE00010001000101;Virement en euros;BE160016001616;SCSCSCSC-XSXSXSXS;+++409/6346/26382+++;VIREMENT EN EUROS DU COMPTE BE16 0016 0016 16 BIC GABBBEBB SCSCSCSC-XSXSXSXS RUE DU PORT 23 8888 BANDARLOG COMMUNICATION : 409634626382 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032493020 DATE VALEUR : 21/03/{YEAR_PREFIX};Accepté;",
+    f";21/03/{YEAR_PREFIX};21/03/{YEAR_PREFIX};108;EUR;BE00010001000101;Virement en euros;BE170017001717;BOBOBO BOBOBO;+++389/5147/28354+++;VIREMENT EN EUROS DU COMPTE BE17 0017 0017 17 BIC GABBBEBB BOBOBO BOBOBO CLOS DE LA COLLINE 13 8888 BANDARLOG COMMUNICATION : 389514728354 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032490021 DATE VALEUR : 21/03/{YEAR_PREFIX};Accepté;",
+    f"{YEAR_PREFIX}-;21/03/{YEAR_PREFIX};21/03/{YEAR_PREFIX};108;EUR;BE00010001000101;Virement en euros;BE180018001818;BABABA BABABA;147018018095;VIREMENT EN EUROS DU COMPTE BE18 0018 0018 18 BIC GABBBEBB BABABA BABABA SQUARE DE LA VALLEE 18 8888 BANDARLOG COMMUNICATION : 147018018095 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032490180 DATE VALEUR : 21/03/{YEAR_PREFIX};Accepté;",
+]
@@ -0,0 +1,55 @@
+"""Query budgets of the views
+
+The budgets are checked against databases with hundreds of reservations
+(see the fill_large_db functions of the test_query_budgets modules) so that
+a query run once per reservation, item or payment is bound to exceed them."""
+from collections import Counter
+from datetime import date, timedelta
+import re
+from typing import Callable
+
+from django.db import connection
+from django.http import HttpResponseBase
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Payment
+
+# Literals are replaced to group the queries that only differ by their parameters
+_SQL_LITERALS_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def fill_payments(bank_ids: list[str], amount_in_cents: int, first_date: date) -> list[Payment]:
+    "One payment per bank id, on consecutive days"
+    payments = [Payment(date_received=first_date + timedelta(days=idx % 60),
+                        amount_in_cents=amount_in_cents,
+                        comment=bank_id,
+                        src_id=f"{first_date.year}-{idx:05}",
+                        bank_ref=f"{first_date:%Y%m%d}{idx:010}",
+                        other_account="BE00 1234 1234 1234 2134",
+                        other_name=f"Client {idx}",
+                        status="Accepté",
+                        srh_bank_id=bank_id)
+                for idx, bank_id in enumerate(bank_ids)]
+    for payment in payments:
+        payment.row_digest = payment.compute_row_digest()  # bulk_create does not call save()
+    return Payment.objects.bulk_create(payments)
+
+
+class QueryBudgetTestCase(TestCase):
+    def assertQueryBudget(self, budget: int, request: Callable[[], HttpResponseBase],
+                          status_code: int = 200) -> HttpResponseBase:
+        """Fail if `request' (e.g. a Client.get) runs more than `budget' queries
+
+        Streaming responses are consumed because their rows are read while
+        they are sent.  The failure message shows the repeated queries."""
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, status_code)
+        if len(queries) > budget:
+            repeated = Counter(_SQL_LITERALS_RE.sub("?", query["sql"]) for query in queries.captured_queries)
+            self.fail(f"{len(queries)} queries for a budget of {budget}, most repeated:\n"
+                      + "\n".join(f"{count:5} x {sql}" for sql, count in repeated.most_common(5)))
+        return response
@@ -1,24 +1,44 @@
 # -*- coding: utf-8 -*-
 from datetime import date
-import time
+import io
 from typing import Any
 import unittest
 
 import django
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 
 from core.banking import (
+    BANK_ID_SEQUENCE_START,
+    IMPORT_CHUNK_SIZE,
+    BankIdAllocator,
+    BankStatementFormat,
+    STATEMENT_FORMATS,
     cents_to_euros,
+    decode_bank_statement,
+    detect_statement_format,
     extract_bank_ref,
+    extract_bank_refs,
+    add_check_digits,
     format_bank_id,
+    generate_bank_id,
     generate_payment_QR_code_content,
     import_bank_statements,
     make_payment_builder,
+    make_payments_builder,
     normalize_bank_id,
+    normalize_bank_ids,
+    parse_amount_in_cents,
     parse_date_received,
+    preview_bank_statements,
+    register_statement_format,
+    run_bank_statement_import,
+    unregister_statement_format,
 )
-from core.models import Payment
-
-YEAR_PREFIX = time.strftime("%Y")
+from core.management.commands.benchmark_bank_statement_parsing import synthetic_statement
+from core.models import BankIdSequence, BankStatementImport, ImportAction, ImportStatus, Payment
+from core.tests.bank_statements import BANK_STATEMENTS_CSV, YEAR_PREFIX
 
 
 class FormatBankId(unittest.TestCase):
@@ -40,6 +60,13 @@ class NormalizeBankId(unittest.TestCase):
         self.assertEqual(normalize_bank_id('invalid'), '')
         self.assertEqual(normalize_bank_id('12341234123412341234'), '')
         self.assertEqual(normalize_bank_id(''), '')
+        self.assertEqual(normalize_bank_id('+++123/1234/12345++'), '')
+        self.assertEqual(normalize_bank_id('+++123/1234/1234a+++'), '')
+
+    def test_batch_is_same_as_row_by_row(self):
+        comments = ['123456789012', '+++123/1234/12345+++', '+++123-1234-12345+++', 'invalid', '',
+                    '12345678901', '+++123/1234/12345+++ ', format_bank_id('123456654321')]
+        self.assertEqual(normalize_bank_ids(comments), [normalize_bank_id(c) for c in comments])
 
 
 
@@ -79,6 +106,16 @@ class ExtractBankRef(unittest.TestCase):
     def test_raises_when_no_right_marker(self):
         self.assertRaises(ValueError, extract_bank_ref, 'DATE VALEUR : 28/03/2023 SOUPER ITALIEN REFERENCE BANQUE : 23032412000 Trululu')
 
+    def test_batch_is_same_as_row_by_row(self):
+        _, rows = synthetic_statement(50)
+        details = [row[10] for row in rows] + ['REFERENCE BANQUE :  x DATE VALEUR', 'REFERENCE BANQUE :DATE VALEUR']
+        self.assertEqual(extract_bank_refs(details), [extract_bank_ref(d) for d in details])
+
+    def test_batch_raises_like_row_by_row(self):
+        for invalid in ('Tralala', 'DATE VALEUR : 28/03/2023 SOUPER ITALIEN REFERENCE BANQUE : 23032412000 Trululu'):
+            with self.subTest(invalid=invalid):
+                self.assertRaises(ValueError, extract_bank_refs, ['REFERENCE BANQUE : 1 DATE VALEUR', invalid])
+
 
 
 class ParseDateReceived(unittest.TestCase):
@@ -88,6 +125,25 @@ class ParseDateReceived(unittest.TestCase):
         self.assertEqual(parse_date_received('2025-02-12'), date(2025, 2, 12))
 
 
+class ParseAmountInCents(unittest.TestCase):
+    def test_examples(self):
+        for (amount, expected) in [("18", 1800), ("-50.34", -5034), ("-33.6", -3360), ("0,07", 7), ("+1234,5", 123450),
+                                   (" 100.87 ", 10087), (".5", 50), ("12.", 1200), ("0.29", 29), ("-0.01", -1)]:
+            with self.subTest(amount=amount):
+                self.assertEqual(parse_amount_in_cents(amount), expected)
+
+    def test_more_than_2_decimals_are_rounded_to_cents(self):
+        for (amount, expected) in [("12.500", 1250), ("12,504", 1250), ("12.506", 1251), ("-12.5099", -1251),
+                                   ("0.125", 12), ("0.135", 14), ("0.1250001", 13), ("9.995", 1000)]:
+            with self.subTest(amount=amount):
+                self.assertEqual(parse_amount_in_cents(amount), expected)
+
+    def test_invalid_amounts(self):
+        for amount in ["", "-", ".", "1.234,56", "12a", "1e3"]:
+            with self.subTest(amount=amount):
+                self.assertRaises(ValueError, parse_amount_in_cents, amount)
+
+
 class MakePaymentBuilder(unittest.TestCase):
     EXAMPLE_DATA = [
         ['Nº de séquence', "Date d'exécution", 'Date valeur', 'Montant', 'Devise du compte', 'Numéro de compte', 'Type de transaction', 'Contrepartie', 'Nom de la contrepartie', 'Communication', 'Détails', 'Statut', 'Motif du refus'],
@@ -151,31 +207,116 @@ class MakePaymentBuilder(unittest.TestCase):
             'active': True})
 
 
+    def test_builder_is_compiled_once_per_header(self):
+        header = self.EXAMPLE_DATA[0]
+        builder = make_payment_builder(header)
+        self.assertIs(make_payment_builder(list(header)), builder)
+        self.assertIs(make_payment_builder(['\ufeff' + header[0]] + [f" {col} " for col in header[1:]]), builder)
+        self.assertIsNot(make_payment_builder(header[::-1]), builder)
+
+    def test_unknown_header(self):
+        self.assertRaises(RuntimeError, make_payment_builder, ["Date", "Amount"])
+
+    def test_payments_builder_is_same_as_payment_builder(self):
+        header, rows = synthetic_statement(30)
+        rows.extend(self.EXAMPLE_DATA[1:])
+        payment_builder = make_payment_builder(header)
+        fields = [f.attname for f in Payment._meta.concrete_fields]
+        self.assertEqual(
+            [[getattr(pmnt, field) for field in fields] for pmnt in make_payments_builder(header)(rows)],
+            [[getattr(payment_builder(row), field) for field in fields] for row in rows])
+        self.assertEqual(make_payments_builder(header)([]), [])
+
+
+def has_valid_check_digits(bank_id: str) -> bool:
+    return len(bank_id) == 12 and (int(bank_id[:10]) % 97 or 97) == int(bank_id[10:])
+
+
+class GenerateBankId(unittest.TestCase):
+    def test_check_digits(self):
+        self.assertEqual(add_check_digits(123456789), '012345678939')
+        self.assertEqual(add_check_digits(97), '000000009797')
+        for args in ((1_700_000_000.0, 0), (1_700_000_000.5, 511), (1_712_345_678.9, 17)):
+            with self.subTest(args=args):
+                self.assertTrue(has_valid_check_digits(generate_bank_id(*args)))
+
+    def test_legacy_bank_ids_are_below_sequence_start(self):
+        self.assertLess(int(generate_bank_id(2**31, 2**20)[:10]), BANK_ID_SEQUENCE_START)
+
+
+class BankIdAllocation(django.test.TestCase):
+    def test_ids_are_unique_and_valid(self):
+        allocators = [BankIdAllocator(block_size=3), BankIdAllocator(block_size=5)]
+        bank_ids = [allocators[idx % 2]() for idx in range(40)]
+        self.assertEqual(len(set(bank_ids)), len(bank_ids))
+        for bank_id in bank_ids:
+            self.assertTrue(has_valid_check_digits(bank_id), bank_id)
+            self.assertGreaterEqual(int(bank_id[:10]), BANK_ID_SEQUENCE_START)
+        self.assertEqual(normalize_bank_ids(bank_ids), bank_ids)
+
+    def test_one_lease_per_block(self):
+        allocate = BankIdAllocator(block_size=10)
+        with CaptureQueriesContext(connection) as ctx:
+            bank_ids = [allocate() for _ in range(25)]
+        leases = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(leases), 3)
+        self.assertFalse([q for q in ctx.captured_queries if "COUNT(" in q["sql"]])
+        self.assertEqual(BankIdSequence.objects.get().next_value, int(bank_ids[0][:10]) + 30)
+
+
+class BenchmarkBankStatementParsing(unittest.TestCase):
+    def test_reports_all_benchmarks(self):
+        out = io.StringIO()
+        call_command("benchmark_bank_statement_parsing", rows=20, repeat=1, stdout=out)
+        self.assertRegex(out.getvalue(), r"^20 rows, best of 1\n")
+        for name in ("bank_ref", "srh_bank_id", "Payment"):
+            self.assertIn(f"\n{name} ", out.getvalue())
+
+
+class StatementFormatRegistry(django.test.TestCase):
+    TEST_FORMAT = BankStatementFormat(
+        name="test",
+        headers={"Ref": "src_id", "Booked": "timestamp", "Amount": "amount_in_cents", "IBAN": "other_account",
+                 "Name": "other_name", "State": "status", "Bank ref": "details", "Message": "comment"},
+        delimiter=",",
+        encoding="latin-1",
+        date_format="%Y%m%d",
+        extract_bank_ref=lambda details: details.removeprefix("REF-"),
+    )
+    CSV = ("Ref,Booked,Amount,IBAN,Name,Message,Bank ref,State\n"
+           f"{YEAR_PREFIX}-1,{YEAR_PREFIX}0328,\"1234,5\",BE00,Gérard,+++671/4235/58049+++,REF-abc1,Accepté\n")
+
+    def setUp(self):
+        register_statement_format(self.TEST_FORMAT)
+        self.addCleanup(unregister_statement_format, self.TEST_FORMAT.name)
+
+    def test_detection(self):
+        self.assertIs(detect_statement_format(self.CSV.splitlines()[0])[0], self.TEST_FORMAT)
+        self.assertIs(detect_statement_format(";".join(MakePaymentBuilder.EXAMPLE_DATA[0]))[0], STATEMENT_FORMATS["fr"])
+        self.assertIs(detect_statement_format("\ufeff" + ";".join(MakePaymentBuilder.EXAMPLE_DATA[0][:-1]))[0],
+                      STATEMENT_FORMATS["fr"])
+        self.assertRaises(RuntimeError, detect_statement_format, "Ref;Booked;Amount")
+
+    def test_unregister(self):
+        unregister_statement_format(self.TEST_FORMAT.name)
+        self.assertRaises(RuntimeError, detect_statement_format, self.CSV.splitlines()[0])
+
+    def test_incomplete_format_is_rejected(self):
+        self.assertRaises(ValueError, register_statement_format, self.TEST_FORMAT._replace(name="bad", headers={"Ref": "src_id"}))
+
+    def test_decode_and_import(self):
+        text = decode_bank_statement(self.CSV.encode("latin-1"))
+        self.assertEqual(text, self.CSV)
+        [(exc, pmnt)] = import_bank_statements(text.splitlines())
+        self.assertIsNone(exc)
+        self.assertEqual(
+            (pmnt.date_received, pmnt.amount_in_cents, pmnt.bank_ref, pmnt.other_name, pmnt.srh_bank_id),
+            (date(int(YEAR_PREFIX), 3, 28), 123450, "abc1", "Gérard", "671423558049"))
+        self.assertEqual(Payment.objects.get().bank_ref, "abc1")
+
+
 class ImportBankStatements(django.test.TransactionTestCase):
-    bank_statements_csv = [
-        "Nº de séquence;Date d'exécution;Date valeur;Montant;Devise du compte;Numéro de compte;Type de transaction;Contrepartie;Nom de la contrepartie;Communication;Détails;Statut;Motif du refus",
-        f"{YEAR_PREFIX}-00127;28/03/{YEAR_PREFIX};28/03/{YEAR_PREFIX};18;EUR;BE00010001000101;Virement en euros;BE00020002000202;ccccc-ccccccccc;Reprise marchandises (viande hachee) souper italien;VIREMENT EN EUROS DU COMPTE BE00020002000202 BIC GABBBEBB CCCCC-CCCCCCCCC AV DE LA GARE 76 9999 WAGADOUGOU COMMUNICATION : REPRISE MARCHANDISES (VIANDE HACHEE) SOUPER ITALIEN REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032412002 DATE VALEUR : 28/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00126;28/03/{YEAR_PREFIX};28/03/{YEAR_PREFIX};50;EUR;BE00010001000101;Virement en euros;BE00030003000303;HHHHHHH SSSSSSSS;Cotisation;VIREMENT EN EUROS DU COMPTE BE00030003000303 BIC GABBBEBB HHHHHHH SSSSSSSS CHEMIN DE LA GARE 123 9999 WAGADOUGOU COMMUNICATION : COTISATION REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032409003 DATE VALEUR : 28/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00125;28/03/{YEAR_PREFIX};28/03/{YEAR_PREFIX};54;EUR;BE00010001000101;Virement en euros;BE00040004000404;Mme RRRRRRRRRR GGGGG;Souper italien du 25/03 : 2 x 27;VIREMENT EN EUROS DU COMPTE BE00 0400 0400 0404 BIC GABBBEBB MME RRRRRRRRRR GGGGG RUE DE LA GARE,3 3333 ZANZIBAR COMMUNICATION : SOUPER ITALIEN DU 25/03 : 2 X 27 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032406004 DATE VALEUR : 28/03/{YEAR_PREFIX};Accepté",
-        f"{YEAR_PREFIX}-00124;27/03/{YEAR_PREFIX};27/03/{YEAR_PREFIX};-54;EUR;BE00010001000101;Virement en euros;BE00050005000505;Aaa Bbbbbbbb;Remboursement repas italien Harmonie ( pas venu);VIREMENT EN EUROS AU COMPTE BE00 0500 0500 0505 BIC GABBBEBB VIA MOBILE BANKING AAA BBBBBBBB COMMUNICATION : REMBOURSEMENT REPAS ITALIEN HARMONIE ( PAS VENU) BISES ANDRE REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032430005 DATE VALEUR : 27/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00123;27/03/{YEAR_PREFIX};27/03/{YEAR_PREFIX};15;EUR;BE00010001000101;Paiement par carte;BE060006000606;BANKSYS;068962070000270121363927012136391010271908660328072700000620700000000088000000000000000P2P MOBILE 000;PAIEMENT MOBILE COMPTE DU DONNEUR D'ORDRE : BE06 0006 0006 06 BIC GABBBEBB BANCONTACT REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032427006 DATE VALEUR : 27/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00122;27/03/{YEAR_PREFIX};27/03/{YEAR_PREFIX};57;EUR;BE00010001000101;Virement en euros;BE070007000707;OOOOO QQQQQ;;VIREMENT EN EUROS DU COMPTE BE07 0007 0007 07 BIC GABBBEBB OOOOO QQQQQ CHAUSSEE DE LA GARE 5 1440 6666 PORT-AU-BOUC PAS DE COMMUNICATION REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032424007 DATE VALEUR : 27/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00121;27/03/{YEAR_PREFIX};27/03/{YEAR_PREFIX};60;EUR;BE00010001000101;Virement instantané en euros;BE080008000808;EEEEEEE JJJJJJ;Cotisation Eeeeeee - Jjjjjj;VIREMENT INSTANTANE EN EUROS BE08 0008 0008 08 BIC GABBBEBBXXX EEEEEEE JJJJJJ RUE DE LA MARIEE 50 7777 NEW YORK COMMUNICATION : COTISATION EEEEEEE - JJJJJJ REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032448008 DATE VALEUR : 27/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00120;26/03/{YEAR_PREFIX};26/03/{YEAR_PREFIX};25;EUR;BE00010001000101;Virement instantané en euros;BE090009000909;DDDDDDD VVVVVVVVVVVVVVVVV;Llll Aaaa cotisation;VIREMENT INSTANTANE EN EUROS BE09 0009 0009 09 BIC GABBBEBBXXX DDDDDDD VVVVVVVVVVVVVVVVV RUE DES MIETTES 32 6666 HYDERABAD COMMUNICATION : LLLL AAAA COTISATION REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032445009 DATE VALEUR : 26/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00119;25/03/{YEAR_PREFIX};24/03/{YEAR_PREFIX};27;EUR;BE00010001000101;Virement instantané en euros;BE100010001010;SSSSSS GGGGGGGG;+++671/4235/58049+++;VIREMENT INSTANTANE EN EUROS BE10 0010 0010 10 BIC GABBBEBBXXX SSSSSS GGGGGGGG RUE MARIGNON 43/5 8888 BANDARLOG COMMUNICATION : 671423558049 EXECUTE LE 24/03 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032442010 DATE VALEUR : 24/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00118;24/03/{YEAR_PREFIX};23/03/{YEAR_PREFIX};16;EUR;BE00010001000101;Virement en euros;BE110011001111;WWWWWWW XXXXXXXX;+++402/9754/33613+++;VIREMENT EN EUROS DU COMPTE BE11 0011 0011 11 BIC GABBBEBB WWWWWWW XXXXXXXX CLOS DE LA GARE 30 8888 BANDARLOG COMMUNICATION : 402975433613 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032439011 DATE VALEUR : 23/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00117;24/03/{YEAR_PREFIX};24/03/{YEAR_PREFIX};81;EUR;BE00010001000101;Virement en euros;BE202020202020;JAJAJA-BLBLBLBL;+++483/5138/12577+++;VIREMENT EN EUROS DU COMPTE BE20 0013 0492 7256 BIC GABBBEBB JAJAJA-BLBLBLBL AV. DE L'EGLISE 41 8888 BANDARLOG COMMUNICATION : 483513812577 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032463012 DATE VALEUR : 24/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00116;23/03/{YEAR_PREFIX};23/03/{YEAR_PREFIX};-33.6;EUR;BE00010001000101;Paiement par carte;;;;PAIEMENT AVEC LA CARTE DE DEBIT NUMERO 4871 09XX XXXX 7079 GROENDEKOR BVBA SINT-PIET 23/03/2023 BANCONTACT REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032460013 DATE VALEUR : 23/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00115;23/03/{YEAR_PREFIX};22/03/{YEAR_PREFIX};16;EUR;BE00010001000101;Virement en euros;BE110011001111;WWWWWWW XXXXXXXX;+++476/7706/09825+++;VIREMENT EN EUROS DU COMPTE BE11 0011 0011 11 BIC GABBBEBB WWWWWWW XXXXXXXX CLOS DE LA GARE 30 8888 BANDARLOG COMMUNICATION : 476770609825 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032457014 DATE VALEUR : 22/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00114;23/03/{YEAR_PREFIX};23/03/{YEAR_PREFIX};54;EUR;BE00010001000101;Virement en euros;BE120012001212;Ggggggggggg Gggggg;852598350718;VIREMENT EN EUROS DU COMPTE BE12 0012 0012 12 BIC GABBBEBB GGGGGGGGGGG GGGGGG PLACE DE LA GARE 12 8888 BANDARLOG COMMUNICATION : 852598350718 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032454015 DATE VALEUR : 23/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00113;22/03/{YEAR_PREFIX};22/03/{YEAR_PREFIX};-100.87;EUR;BE00010001000101;Virement en euros;BE89375104780085;Unisono;+++323/0086/13607+++;VIREMENT EN EUROS AU COMPTE BE89 3751 0478 0085 BIC GABBBEBB VIA MOBILE BANKING UNISONO COMMUNICATION : 323008613607 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032478016 DATE VALEUR : 22/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00112;22/03/{YEAR_PREFIX};21/03/{YEAR_PREFIX};25;EUR;BE00010001000101;Virement en euros;BE130013001313;DEDEDEDE DEDED;Cotisation SRH;VIREMENT EN EUROS DU COMPTE BE13 0013 0013 13 BIC GABBBEBB DEDEDEDE DEDED RUE DE L'EGLISE 33 6666 PORT-AU-BOUC COMMUNICATION : COTISATION SRH REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032475017 DATE VALEUR : 21/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00111;22/03/{YEAR_PREFIX};22/03/{YEAR_PREFIX};27;EUR;BE00010001000101;Virement en euros;BE140014001414;SOSOSOS OSOSOS;+++409/5503/55816+++;VIREMENT EN EUROS DU COMPTE BE14 0014 0014 14 BIC GABBBEBB SOSOSOS OSOSOS RUE DES APACHES 42 5555 ZOLLIKON COMMUNICATION : 409550355816 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032472018 DATE VALEUR : 22/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-00110;22/03/{YEAR_PREFIX};22/03/{YEAR_PREFIX};54;EUR;BE00010001000101;Virement en euros;BE150015001515;Iaiaiaiaia Iaia;483421245780;VIREMENT EN EUROS DU COMPTE BE15 0015 0015 15 BIC GABBBEBB IAIAIAIAIA IAIA BOULEVARD DE LA GARE 67 4444 MODANE COMMUNICATION : 483421245780 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032496019 DATE VALEUR : 22/03/{YEAR_PREFIX};Accepté;",
-        f";21/03/{YEAR_PREFIX};21/03/{YEAR_PREFIX};81;EUR;BE00010001000101;Virement en euros;BE160016001616;SCSCSCSC-XSXSXSXS;+++409/6346/26382+++;VIREMENT EN EUROS DU COMPTE BE16 0016 0016 16 BIC GABBBEBB SCSCSCSC-XSXSXSXS RUE DU PORT 23 8888 BANDARLOG COMMUNICATION : 409634626382 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032493020 DATE VALEUR : 21/03/{YEAR_PREFIX};Accepté;",
-        f";21/03/{YEAR_PREFIX};21/03/{YEAR_PREFIX};108;EUR;BE00010001000101;Virement en euros;BE170017001717;BOBOBO BOBOBO;+++389/5147/28354+++;VIREMENT EN EUROS DU COMPTE BE17 0017 0017 17 BIC GABBBEBB BOBOBO BOBOBO CLOS DE LA COLLINE 13 8888 BANDARLOG COMMUNICATION : 389514728354 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032490021 DATE VALEUR : 21/03/{YEAR_PREFIX};Accepté;",
-        f"{YEAR_PREFIX}-;21/03/{YEAR_PREFIX};21/03/{YEAR_PREFIX};108;EUR;BE00010001000101;Virement en euros;BE180018001818;BABABA BABABA;147018018095;VIREMENT EN EUROS DU COMPTE BE18 0018 0018 18 BIC GABBBEBB BABABA BABABA SQUARE DE LA VALLEE 18 8888 BANDARLOG COMMUNICATION : 147018018095 REFERENCE BANQUE : {YEAR_PREFIX[2:4]}032490180 DATE VALEUR : 21/03/{YEAR_PREFIX};Accepté;",
-    ]
+    bank_statements_csv = BANK_STATEMENTS_CSV
 
     def test_non_overlapping_uploads(self):
         initial_count = Payment.objects.count()
@@ -233,6 +374,147 @@ class ImportBankStatements(django.test.TransactionTestCase):
         import_bank_statements(second_batch)
         self.assertEqual(Payment.objects.count() - initial_count, len(self.bank_statements_csv) - 1)
 
+    def test_number_of_queries_does_not_depend_on_number_of_rows(self):
+        def data_queries(ctx: CaptureQueriesContext) -> list[str]:
+            return [q["sql"].split(None, 1)[0] for q in ctx.captured_queries
+                    if not q["sql"].startswith(("BEGIN", "COMMIT", "SAVEPOINT", "RELEASE SAVEPOINT"))]
+
+        with CaptureQueriesContext(connection) as ctx:
+            first_import = import_bank_statements(self.bank_statements_csv[:6] + self.bank_statements_csv[-1:])
+        self.assertTrue(all(exc is None for exc, _ in first_import))
+        self.assertEqual(data_queries(ctx), ["SELECT", "INSERT"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            second_import = import_bank_statements(
+                [self.bank_statements_csv[0]]
+                + self.bank_statements_csv[4:-1]
+                + [f"{YEAR_PREFIX}-00998" + self.bank_statements_csv[-1][len(f"{YEAR_PREFIX}-"):]])
+        self.assertEqual(data_queries(ctx), ["SELECT", "INSERT", "UPDATE"])
+        # the first 2 rows were already imported identically: skipped without error
+        self.assertEqual([exc is None for exc, _ in second_import],
+                         [True, True] + [True] * (len(self.bank_statements_csv) - 7) + [True])
+        self.assertEqual(Payment.find_by_bank_ref(second_import[-1][-1].bank_ref).src_id, f"{YEAR_PREFIX}-00998")
+        self.assertEqual(Payment.objects.count(), len(self.bank_statements_csv) - 1)
+
+    def test_preview_classifies_without_writing_and_confirmation_applies_it(self):
+        import_bank_statements(self.bank_statements_csv[:6] + self.bank_statements_csv[-1:])
+        corrected_row = f"{YEAR_PREFIX}-00998" + self.bank_statements_csv[-1][len(f"{YEAR_PREFIX}-"):]
+        csv_lines = [self.bank_statements_csv[0]] + self.bank_statements_csv[4:-1] + [corrected_row]
+
+        with CaptureQueriesContext(connection) as ctx:
+            preview = preview_bank_statements(csv_lines)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual([row.action for row in preview],
+                         [ImportAction.UNCHANGED] * 2
+                         + [ImportAction.NEW] * (len(self.bank_statements_csv) - 7)
+                         + [ImportAction.CORRECTION])
+        self.assertEqual(Payment.objects.count(), 6)
+        self.assertEqual(Payment.find_by_bank_ref(preview[-1].payment.bank_ref).src_id, f"{YEAR_PREFIX}-")
+
+        job = BankStatementImport.objects.create(
+            file_name="preview.csv", content="\n".join(csv_lines).encode("utf-8"), dry_run=True)
+        run_bank_statement_import(job)
+        self.assertEqual((job.status, job.rows_total, job.rows_failed), (ImportStatus.PREVIEWED, len(csv_lines) - 1, 0))
+        self.assertEqual(job.preview_rows()[-1][3], f"{YEAR_PREFIX}-")
+        self.assertEqual(Payment.objects.count(), 6)
+
+        # Confirmation: the CSV is not parsed again
+        job.content = b""
+        job.dry_run = False
+        with CaptureQueriesContext(connection) as ctx:
+            run_bank_statement_import(job)
+        self.assertFalse(any(q["sql"].startswith("SELECT") and "core_payment" in q["sql"] for q in ctx.captured_queries))
+        self.assertEqual((job.status, job.rows_processed, job.rows_failed), (ImportStatus.DONE, len(csv_lines) - 1, 0))
+        self.assertEqual(Payment.objects.count(), len(self.bank_statements_csv) - 1)
+        self.assertEqual(Payment.find_by_bank_ref(preview[-1].payment.bank_ref).src_id, f"{YEAR_PREFIX}-00998")
+
+    def test_confirmation_does_not_overwrite_payments_changed_since_the_preview(self):
+        import_bank_statements(self.bank_statements_csv[:1] + self.bank_statements_csv[-1:])
+        corrected_row = f"{YEAR_PREFIX}-00998" + self.bank_statements_csv[-1][len(f"{YEAR_PREFIX}-"):]
+        job = BankStatementImport.objects.create(
+            file_name="preview.csv", content="\n".join([self.bank_statements_csv[0], corrected_row]).encode("utf-8"),
+            dry_run=True)
+        run_bank_statement_import(job)
+        self.assertEqual([row["action"] for row in job.preview], [ImportAction.CORRECTION])
+
+        # Someone fixes the src_id by hand before the preview is confirmed
+        pmnt = Payment.objects.get()
+        pmnt.src_id = f"{YEAR_PREFIX}-00997"
+        pmnt.save()
+        job.dry_run = False
+        run_bank_statement_import(job)
+        self.assertEqual((job.status, job.rows_processed, job.rows_failed), (ImportStatus.DONE, 1, 1))
+        self.assertTrue(job.errors[0]["error"].startswith("Conflict:"))
+        pmnt.refresh_from_db()
+        self.assertEqual(pmnt.src_id, f"{YEAR_PREFIX}-00997")
+        self.assertEqual(pmnt.row_digest, pmnt.compute_row_digest())
+
+    def test_reimported_rows_are_skipped_without_errors(self):
+        first_import = import_bank_statements(self.bank_statements_csv[:6])
+        self.assertTrue(all(exc is None for exc, _ in first_import))
+        # Same rows, one of them with a different src_id
+        changed_row = f"{YEAR_PREFIX}-00999" + self.bank_statements_csv[5][len(f"{YEAR_PREFIX}-00123"):]
+        second_import = import_bank_statements(self.bank_statements_csv[:5] + [changed_row])
+        self.assertEqual([exc is None for exc, _ in second_import], [True] * 4 + [False])
+        exc, pmnt = second_import[-1]
+        self.assertIsInstance(exc, IntegrityError)
+        self.assertEqual(str(exc), f"Duplicate bank_ref {pmnt.bank_ref!r}")
+        self.assertEqual(Payment.objects.count(), 5)
+        self.assertEqual(Payment.find_by_bank_ref(second_import[-1][1].bank_ref).src_id, f"{YEAR_PREFIX}-00123")
+
+    def test_row_digest_follows_src_id_correction(self):
+        import_bank_statements(self.bank_statements_csv[:1] + self.bank_statements_csv[-1:])
+        corrected_row = f"{YEAR_PREFIX}-00998" + self.bank_statements_csv[-1][len(f"{YEAR_PREFIX}-"):]
+        import_bank_statements([self.bank_statements_csv[0], corrected_row])
+        pmnt = Payment.objects.get()
+        self.assertEqual(pmnt.src_id, f"{YEAR_PREFIX}-00998")
+        self.assertEqual(pmnt.row_digest, pmnt.compute_row_digest())
+        self.assertEqual([exc for exc, _ in import_bank_statements([self.bank_statements_csv[0], corrected_row])], [None])
+
+    def test_uploading_the_same_file_again_is_skipped_in_one_query(self):
+        content = "\n".join(self.bank_statements_csv[:6]).encode("utf-8")
+        first = BankStatementImport.objects.create(file_name="first.csv", content=content)
+        run_bank_statement_import(first)
+        self.assertEqual((first.status, first.rows_processed, first.rows_failed), (ImportStatus.DONE, 5, 0))
+
+        second = BankStatementImport.objects.create(file_name="second.csv", content=content)
+        self.assertEqual(second.content_digest, first.content_digest)
+        with CaptureQueriesContext(connection) as ctx:
+            run_bank_statement_import(second)
+        self.assertEqual(len([q for q in ctx.captured_queries if "core_payment" in q["sql"]]), 1)
+        self.assertIn("row_digest", [q["sql"] for q in ctx.captured_queries if "core_payment" in q["sql"]][0])
+        self.assertEqual((second.status, second.rows_processed, second.rows_failed), (ImportStatus.DONE, 5, 0))
+        self.assertEqual(Payment.objects.count(), 5)
+
+        # Falls back to the normal import if some of the payments are gone
+        Payment.objects.filter(pk=Payment.objects.order_by("pk")[0].pk).delete()
+        third = BankStatementImport.objects.create(file_name="third.csv", content=content)
+        run_bank_statement_import(third)
+        self.assertEqual((third.status, third.rows_processed, third.rows_failed), (ImportStatus.DONE, 5, 0))
+        self.assertEqual(Payment.objects.count(), 5)
+
+    def test_only_the_chunks_imported_before_are_skipped(self):
+        header, rows = synthetic_statement(IMPORT_CHUNK_SIZE + 10)
+        for row in rows:
+            row[0] = f"{YEAR_PREFIX}{row[0][4:]}"
+        fmt = STATEMENT_FORMATS["fr"]
+        content = "\n".join(fmt.delimiter.join(row) for row in [header] + rows).encode("utf-8")
+        first = BankStatementImport.objects.create(file_name="first.csv", content=content)
+        run_bank_statement_import(first)
+        self.assertEqual((first.status, first.rows_processed, first.rows_failed),
+                         (ImportStatus.DONE, len(rows), 0))
+
+        Payment.objects.filter(src_id=rows[-1][0]).delete()
+        second = BankStatementImport.objects.create(file_name="second.csv", content=content)
+        with CaptureQueriesContext(connection) as ctx:
+            run_bank_statement_import(second)
+        self.assertEqual((second.status, second.rows_processed, second.rows_failed),
+                         (ImportStatus.DONE, len(rows), 0))
+        # one row_digest lookup per chunk, only the last chunk is imported again
+        self.assertEqual([q["sql"].split(None, 1)[0] for q in ctx.captured_queries if "core_payment" in q["sql"]],
+                         ["SELECT", "SELECT", "SELECT", "INSERT"])
+        self.assertEqual(Payment.objects.count(), len(rows))
+
 # Local Variables:
 # compile-command: "uv run python ../../manage.py test core"
 # End:
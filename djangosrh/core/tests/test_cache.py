@@ -0,0 +1,55 @@
+import unittest
+
+from core.cache import LRUCache
+
+
+class LRUCacheTests(unittest.TestCase):
+    def test_builds_once(self):
+        cache: LRUCache[int] = LRUCache()
+        builds = []
+        def build() -> int:
+            builds.append(1)
+            return len(builds)
+        self.assertEqual(cache.get_or_build("k", build), 1)
+        self.assertEqual(cache.get_or_build("k", build), 1)
+        self.assertEqual(len(builds), 1)
+
+    def test_evicts_least_recently_used(self):
+        cache: LRUCache[str] = LRUCache(maxsize=2)
+        cache.get_or_build("a", lambda: "a")
+        cache.get_or_build("b", lambda: "b")
+        cache.get_or_build("a", lambda: "not rebuilt")
+        cache.get_or_build("c", lambda: "c")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_or_build("a", lambda: "rebuilt"), "a")
+        self.assertEqual(cache.get_or_build("b", lambda: "rebuilt"), "rebuilt")
+
+    def test_expires(self):
+        now = [0.0]
+        cache: LRUCache[str] = LRUCache(ttl=10, clock=lambda: now[0])
+        cache.get_or_build("k", lambda: "old")
+        now[0] = 9.9
+        self.assertEqual(cache.get_or_build("k", lambda: "new"), "old")
+        now[0] = 10.0
+        self.assertEqual(cache.get_or_build("k", lambda: "new"), "new")
+
+    def test_invalidate(self):
+        cache: LRUCache[str] = LRUCache()
+        cache.get_or_build("k", lambda: "old")
+        cache.get_or_build("other", lambda: "other")
+        cache.invalidate("k")
+        self.assertEqual(cache.get_or_build("k", lambda: "new"), "new")
+        cache.clear()
+        self.assertEqual(cache.get_or_build("other", lambda: "new"), "new")
+
+    def test_value_built_during_invalidation_is_not_kept(self):
+        cache: LRUCache[str] = LRUCache()
+        def build_and_invalidate() -> str:
+            cache.invalidate("k")
+            return "stale"
+        self.assertEqual(cache.get_or_build("k", build_and_invalidate), "stale")
+        self.assertEqual(cache.get_or_build("k", lambda: "fresh"), "fresh")
+
+# Local Variables:
+# compile-command: "uv run python ../../manage.py test core"
+# End:
@@ -0,0 +1,75 @@
+import io
+import json
+import unittest
+import xml.etree.ElementTree as ET
+import zipfile
+
+from core.exports import (
+    EXPORT_FORMATS,
+    ExportColumn,
+    TabularExport,
+    pyarrow,
+    write_csv,
+    write_jsonl,
+    write_xlsx,
+)
+
+COLUMNS = [ExportColumn("Nom", "text"), ExportColumn("Places", "int"), ExportColumn("Valeur", "cents")]
+BATCHES = [[["Mr Dupont", "Lara <Croft> & co"], [2, 1], [7900, 2850]],
+           [["Priv\x01 Ate"], [3], [0]]]
+SPREADSHEET_NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def make_table() -> TabularExport:
+    return TabularExport(COLUMNS, iter(BATCHES))
+
+
+class WriteExport(unittest.TestCase):
+    def test_csv(self):
+        self.assertEqual("".join(write_csv(make_table())),
+                         'Nom,Places,Valeur\r\n'
+                         'Mr Dupont,2,79.00€\r\n'
+                         'Lara <Croft> & co,1,28.50€\r\n'
+                         'Priv\x01 Ate,3,0.00€\r\n')
+
+    def test_csv_without_rows(self):
+        self.assertEqual("".join(write_csv(TabularExport(COLUMNS, []))), 'Nom,Places,Valeur\r\n')
+
+    def test_jsonl(self):
+        self.assertEqual([json.loads(line) for line in "".join(write_jsonl(make_table())).splitlines()],
+                         [{"Nom": "Mr Dupont", "Places": 2, "Valeur": 79.0},
+                          {"Nom": "Lara <Croft> & co", "Places": 1, "Valeur": 28.5},
+                          {"Nom": "Priv\x01 Ate", "Places": 3, "Valeur": 0.0}])
+
+    def test_xlsx(self):
+        chunks = list(write_xlsx(make_table()))
+        self.assertGreater(len(chunks), len(BATCHES))
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = ET.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+        rows = [[cell.findtext("s:v", namespaces=SPREADSHEET_NS) or cell.findtext("s:is/s:t", namespaces=SPREADSHEET_NS)
+                 for cell in row]
+                for row in sheet.iterfind("s:sheetData/s:row", SPREADSHEET_NS)]
+        self.assertEqual(rows, [["Nom", "Places", "Valeur"],
+                                ["Mr Dupont", "2", "79.0"],
+                                ["Lara <Croft> & co", "1", "28.5"],
+                                ["Priv Ate", "3", "0.0"]])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow_and_parquet(self):
+        for name, read in (("arrow", lambda data: pyarrow.ipc.open_stream(data).read_all()),
+                           ("parquet", lambda data: pyarrow.parquet.read_table(pyarrow.BufferReader(data)))):
+            with self.subTest(name=name):
+                table = read(b"".join(EXPORT_FORMATS[name].write(make_table())))
+                self.assertEqual(table.to_pydict(),
+                                 {"Nom": ["Mr Dupont", "Lara <Croft> & co", "Priv\x01 Ate"],
+                                  "Places": [2, 1, 3],
+                                  "Valeur": [79.0, 28.5, 0.0]})
+
+    def test_formats(self):
+        self.assertLessEqual({"csv", "xlsx", "jsonl"}, set(EXPORT_FORMATS))
+        self.assertEqual("arrow" in EXPORT_FORMATS, pyarrow is not None)
+
+# Local Variables:
+# compile-command: "uv run python ../../manage.py test core"
+# End:
@@ -0,0 +1,100 @@
+from datetime import date
+import threading
+import time
+from unittest import mock
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import OperationalError, close_old_connections, connection, models
+from django.test import TransactionTestCase
+
+from core.banking import BankIdAllocator
+from core.models import SEATED_RESERVATIONS, BaseEvent, BaseReservation, register_seated_reservation
+from concert.forms import ReservationForm
+from concert.models import Event, ReservationChoiceCount, Reservation as ConcertReservation
+from ital.models import Reservation as ItalReservation
+from concert.tests.test_models import fill_db as fill_concert_db
+
+# Attempts of one booking before giving up, each failing with "database
+# table is locked" with SQLite
+MAX_ATTEMPTS = 500
+
+
+class ReserveSeats(TransactionTestCase):
+    def test_simultaneous_reservations_never_overbook(self):
+        event, choices, _ = fill_concert_db()
+        Event.objects.filter(pk=event.pk).update(max_seats=models.F("reserved_seats") + 25)
+        event.refresh_from_db()
+        adults = next(inpt.name for inpt in ReservationForm(event).choices if inpt.choice.pk == choices[0].pk)
+        initial_reservations = set(event.reservation_set.values_list("pk", flat=True))
+        threads_count, seats_per_reservation, bookings_per_thread = 8, 2, 3
+        barrier = threading.Barrier(threads_count)
+        granted: list[int] = []
+        refused: list[int] = []
+        errors: list[Exception] = []
+
+        def book(idx: int):
+            try:
+                barrier.wait()
+                for booking in range(bookings_per_thread):
+                    for _ in range(MAX_ATTEMPTS):
+                        try:
+                            form = ReservationForm(event, {
+                                adults: str(seats_per_reservation),
+                                "last_name": f"Client {idx}.{booking}",
+                                "accepts_rgpd_reuse": "yes",
+                                "email": f"client{idx}@yopmail.fr"})
+                            (refused if form.save() is None else granted).append(seats_per_reservation)
+                            break
+                        except OperationalError:
+                            time.sleep(0.001)
+                    else:
+                        raise AssertionError(f"Booking {idx}.{booking} still failing after {MAX_ATTEMPTS} attempts")
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        # Small blocks of bank ids: the threads also compete for their leases
+        with mock.patch("concert.forms.allocate_bank_id", BankIdAllocator(block_size=2)):
+            threads = [threading.Thread(target=book, args=(idx,)) for idx in range(threads_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(granted) + len(refused), threads_count * bookings_per_thread)
+        self.assertEqual(sum(granted), 24)
+        reservations = event.reservation_set.exclude(pk__in=initial_reservations)
+        self.assertEqual(reservations.count(), len(granted))
+        self.assertEqual(len(set(reservations.values_list("bank_id", flat=True))), len(granted))
+        self.assertEqual(reservations.aggregate(places=models.Sum("places"))["places"], sum(granted))
+        self.assertEqual(ReservationChoiceCount.objects.filter(reservation__in=reservations)
+                         .aggregate(count=models.Sum("count"))["count"], sum(granted))
+        event.refresh_from_db()
+        self.assertEqual(event.max_seats - event.reserved_seats, 1)
+        self.assertFalse(event.reserve_seats(2))
+        self.assertTrue(event.reserve_seats(1))
+
+    def test_save_does_not_overwrite_the_counter(self):
+        event = BaseEvent.objects.create(name="Gala", date=date(2025, 11, 9), contact_email="dont-spam@me.com", max_seats=10)
+        stale = BaseEvent.objects.get(pk=event.pk)
+        self.assertTrue(event.reserve_seats(3))
+        stale.name = "Gala!"
+        stale.save()
+        event.refresh_from_db()
+        self.assertEqual((event.name, event.reserved_seats), ("Gala!", 3))
+        event.release_seats(3)
+        event.refresh_from_db()
+        self.assertEqual(event.reserved_seats, 0)
+
+    def test_only_registered_reservations_take_seats(self):
+        self.assertEqual(set(SEATED_RESERVATIONS), {ConcertReservation, ItalReservation})
+        # A reservation model without seats column can not be registered
+        self.assertRaises(FieldDoesNotExist, register_seated_reservation, BaseReservation)
+        self.assertNotIn(BaseReservation, SEATED_RESERVATIONS)
+
+# Local Variables:
+# compile-command: "uv run python ../../manage.py test core"
+# End:
@@ -0,0 +1,132 @@
+import io
+import unittest
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.performance import (
+    PerformanceRecorder,
+    RequestMeasure,
+    TimedDjangoTemplates,
+    ViewStats,
+    percentiles,
+    prometheus_text,
+    recorder,
+)
+from concert.tests.test_models import fill_db as fill_concert_db
+
+
+class ViewStatsTests(unittest.TestCase):
+    def test_quantiles(self):
+        stats = ViewStats()
+        for idx in range(1, 101):
+            stats.add(RequestMeasure(idx, 0.0, 0.0, idx / 1000))
+        self.assertEqual(stats.count, 100)
+        self.assertEqual(stats.totals.queries, 5050)
+        self.assertEqual(stats.quantiles("queries"), [(0.5, 50), (0.95, 95), (0.99, 99)])
+
+    def test_quantiles_of_recent_requests_only(self):
+        stats = ViewStats(window=2)
+        for queries in (100, 1, 2):
+            stats.add(RequestMeasure(queries, 0.0, 0.0, 0.0))
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.quantiles("queries"), [(0.5, 1), (0.95, 2), (0.99, 2)])
+        self.assertEqual(ViewStats().quantiles("queries"), [])
+
+    def test_percentiles(self):
+        self.assertEqual(percentiles([3, 1, 2], (0.0, 0.5, 1.0)), [(0.0, 1), (0.5, 2), (1.0, 3)])
+        self.assertEqual(percentiles([]), [])
+
+    def test_prometheus_text(self):
+        registry = PerformanceRecorder()
+        registry.record('app:"view"', RequestMeasure(3, 0.5, 0.25, 1.0))
+        text = prometheus_text(registry.snapshot())
+        self.assertIn("# TYPE djangosrh_request_queries summary\n", text)
+        self.assertIn('djangosrh_request_queries{view="app:\\"view\\"",quantile="0.95"} 3\n', text)
+        self.assertIn('djangosrh_request_wall_seconds_sum{view="app:\\"view\\""} 1.0\n', text)
+        self.assertIn('djangosrh_request_db_seconds_count{view="app:\\"view\\""} 1\n', text)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("john", "lennon@thebeatles.com", "johnpassword")
+        cls.staff = User.objects.create_user("paul", "mccartney@thebeatles.com", "paulpassword", is_staff=True)
+        cls.event, _, _ = fill_concert_db()
+
+    def setUp(self):
+        recorder.clear()
+
+    def test_records_view(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("concert:reservations"), {"event_id": self.event.id})
+        self.client.get(reverse("concert:reservations"), {"event_id": self.event.id})
+        self.client.get("/no/such/page")
+        stats = dict(recorder.snapshot())
+        self.assertEqual(set(stats), {"concert:reservations", "<unresolved>"})
+        view_stats = stats["concert:reservations"]
+        self.assertEqual(view_stats.count, 2)
+        self.assertGreater(view_stats.totals.queries, 0)
+        self.assertGreater(view_stats.totals.db_seconds, 0)
+        self.assertGreater(view_stats.totals.template_seconds, 0)
+        self.assertGreaterEqual(view_stats.totals.wall_seconds,
+                                view_stats.totals.db_seconds + view_stats.totals.template_seconds)
+
+    def test_template_time_is_measured_by_the_template_backend(self):
+        self.assertIsInstance(engines.all()[0], TimedDjangoTemplates)
+        self.assertEqual(render_to_string("core/performance_stats.html", {"views": []}).count("<table"), 1)
+        self.client.force_login(self.user)
+        with override_settings(TEMPLATES=[{**settings.TEMPLATES[0],
+                                           "BACKEND": "django.template.backends.django.DjangoTemplates"}]):
+            self.client.get(reverse("concert:reservations"), {"event_id": self.event.id})
+        view_stats = dict(recorder.snapshot())["concert:reservations"]
+        self.assertGreater(view_stats.totals.queries, 0)
+        self.assertEqual(view_stats.totals.template_seconds, 0.0)
+
+    def test_stats_page_staff_only(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("concert:reservations"), {"event_id": self.event.id})
+        self.assertEqual(self.client.get(reverse("performance_stats")).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("performance_stats"))
+        self.assertContains(response, "concert:reservations")
+
+    def test_metrics(self):
+        url = reverse("performance_metrics")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+        # The 2 refused requests were measured before this one
+        self.assertIn('djangosrh_request_queries_count{view="performance_metrics"} 2', response.content.decode())
+
+    def test_metrics_token(self):
+        url = reverse("performance_metrics")
+        with override_settings(PERFORMANCE_METRICS_TOKEN="s3cr3t"):
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer s3cr3t"}).status_code, 200)
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer wrong"}).status_code, 401)
+        self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer "}).status_code, 401)
+
+
+class LoadtestOpeningDay(TransactionTestCase):
+    def test_reports_and_does_not_oversell(self):
+        out = io.StringIO()
+        call_command("loadtest_opening_day", clients=4, iterations=3, seats=10, test_database=False, stdout=out)
+        report = out.getvalue()
+        self.assertRegex(report, r"^sqlite, test client, 4 clients x 3 reservations, 10 seats per event\n"
+                                 r"\d+ requests in [0-9.]+s: [0-9.]+ requests/s\n")
+        for label in ("ital GET reservation_form", "concert POST reservation_form", "staff payments"):
+            self.assertRegex(report, rf"\n{label} +\d+ +[0-9.]+ +[0-9.]+ +[0-9.]+  ")
+        self.assertRegex(report, r"\nital: \d+ reservations accepted, \d+ refused, \d+ not attempted")
+        self.assertRegex(report, r"\nSouper italien \(test de charge\): (10|[0-9])/10 seats taken by the reservations")
+
+# Local Variables:
+# compile-command: "uv run python ../../manage.py test core"
+# End:
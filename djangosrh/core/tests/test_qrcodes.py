@@ -0,0 +1,67 @@
+from datetime import timedelta
+import os
+from pathlib import Path
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from core import qrcodes
+from core.qrcodes import prune_qr_code_cache, render_qr_code
+
+
+class RenderQRCode(SimpleTestCase):
+    def setUp(self):
+        qrcodes._qr_codes.clear()
+
+    def test_formats(self):
+        svg = render_qr_code("https://example.com/svg")
+        self.assertEqual(svg.content_type, "image/svg+xml")
+        self.assertIn(b"<svg", svg.content)
+        png = render_qr_code("https://example.com/svg", "png")
+        self.assertEqual(png.content_type, "image/png")
+        self.assertTrue(png.content.startswith(b"\x89PNG"))
+        self.assertNotEqual(svg.etag, png.etag)
+        with self.assertRaises(ValueError):
+            render_qr_code("https://example.com/svg", "gif")
+
+    def test_encodes_each_payload_once(self):
+        with mock.patch("core.qrcodes._encode", wraps=qrcodes._encode) as encode:
+            first = render_qr_code("BCD\n001\n1\nSCT")
+            self.assertIs(render_qr_code("BCD\n001\n1\nSCT"), first)
+            other = render_qr_code("BCD\n001\n1\nSCT\nother")
+        self.assertEqual(encode.call_count, 2)
+        self.assertNotEqual(first.etag, other.etag)
+        self.assertRegex(first.etag, r'^"[0-9a-f]+"$')
+
+    def test_disk_cache_is_shared(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(QR_CODE_CACHE_DIR=cache_dir):
+            first = render_qr_code("https://example.com/disk")
+            qrcodes._qr_codes.clear()  # as if in another process
+            with mock.patch("core.qrcodes._encode") as encode:
+                second = render_qr_code("https://example.com/disk")
+            encode.assert_not_called()
+            self.assertEqual((second.content, second.etag), (first.content, first.etag))
+
+    def test_prune_removes_old_files_only(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(QR_CODE_CACHE_DIR=cache_dir):
+            render_qr_code("https://example.com/old")
+            render_qr_code("https://example.com/recent", "png")
+            old, recent = sorted(Path(cache_dir).glob("*/*"), key=lambda path: path.suffix != ".svg")
+            a_week_ago = time.time() - timedelta(days=7).total_seconds()
+            os.utime(old, (a_week_ago, a_week_ago))
+            self.assertEqual(prune_qr_code_cache(timedelta(days=6)), 1)
+            self.assertEqual(list(Path(cache_dir).glob("*/*")), [recent])
+            # Rendered again when needed
+            qrcodes._qr_codes.clear()
+            self.assertIn(b"<svg", render_qr_code("https://example.com/old").content)
+        self.assertEqual(prune_qr_code_cache(timedelta(0)), 0)
+
+    def test_unusable_disk_cache_is_ignored(self):
+        with tempfile.NamedTemporaryFile() as not_a_directory, override_settings(QR_CODE_CACHE_DIR=not_a_directory.name):
+            self.assertIn(b"<svg", render_qr_code("https://example.com/nodisk").content)
+
+# Local Variables:
+# compile-command: "uv run python ../../manage.py test core"
+# End:
@@ -0,0 +1,71 @@
+from datetime import date
+import itertools
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from core.models import BankStatementImport, ImportAction, ImportStatus, ReservationPayment
+from core.performance import RequestMeasure, recorder
+from core.tests.query_budget import QueryBudgetTestCase, fill_payments
+from concert.tests.test_query_budgets import fill_large_db as fill_large_concert_db
+
+
+class ViewQueryBudgets(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("john", "lennon@thebeatles.com", "johnpassword", is_staff=True)
+        _, _, reservations = fill_large_concert_db()
+        # Besides the payments of the reservations, some unrelated ones and
+        # some of the reservations have already been confirmed
+        cls.payments = fill_payments([f"{idx:012}" for idx in range(700)], 1000, date(2026, 9, 1))
+        for reservation_payment in ReservationPayment.objects.filter(
+                reservation__in=reservations[::10]).select_related("payment"):
+            reservation_payment.confirmation_sent_timestamp = reservation_payment.payment.created
+            reservation_payment.save()
+        preview = [{"action": action, "error": None, "date_received": "2026-09-14", "amount_in_cents": 1500,
+                    "comment": "", "src_id": f"2026-{idx:05}", "bank_ref": f"2026091400{idx:08}",
+                    "other_account": "", "other_name": f"Client {idx}", "srh_bank_id": "", "status": "Accepté",
+                    "previous_src_id": None}
+                   for idx, action in zip(range(250), itertools.cycle(ImportAction.values))]
+        cls.job = BankStatementImport(
+            file_name="statement.csv", content=b"", dry_run=True, status=ImportStatus.PREVIEWED,
+            rows_total=len(preview), preview=preview,
+            errors=[{"error": "Invalid", **row} for row in preview[:50]])
+        cls.job.save()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_payments(self):
+        url = reverse("payments")
+        for order_by in ("bank_ref", "-date_received", "confirmation_date"):
+            with self.subTest(order_by=order_by):
+                self.assertQueryBudget(4, lambda: self.client.get(url, {"order_by": order_by, "paginate_by": 50}))
+        self.assertQueryBudget(4, lambda: self.client.get(url, {"only_active": "False", "page": 20}))
+
+    def test_toggle_payment_active_status(self):
+        self.assertQueryBudget(4, lambda: self.client.post(
+            reverse("toggle_payment_active_status"), {"bank_ref": self.payments[0].bank_ref, "new_active": "False"}),
+            status_code=302)
+
+    def test_upload_payment_csv(self):
+        self.assertQueryBudget(3, lambda: self.client.post(
+            reverse("upload_payment_csv"), {"formFile": SimpleUploadedFile("statement.csv", b"a;b\n1;2\n")}),
+            status_code=302)
+
+    def test_payment_import(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse("payment_import", args=[self.job.id])))
+        self.assertQueryBudget(3, lambda: self.client.post(reverse("confirm_payment_import", args=[self.job.id])),
+                               status_code=302)
+
+    def test_performance(self):
+        recorder.clear()
+        for idx in range(50):
+            recorder.record(f"view_{idx}", RequestMeasure(idx, 0.001, 0.002, 0.005))
+        self.assertQueryBudget(2, lambda: self.client.get(reverse("performance_stats")))
+        self.assertQueryBudget(2, lambda: self.client.get(reverse("performance_metrics")))
+
+# Local Variables:
+# compile-command: "uv run python ../../manage.py test core"
+# End:
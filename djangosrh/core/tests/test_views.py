@@ -1,14 +1,24 @@
-from datetime import date
+from datetime import date, timedelta
+import io
+import os
+from pathlib import Path
+import tempfile
+import time
 from uuid import uuid4
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import mail
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from core.models import Payment, ReservationPayment
+from core.models import IMPORT_RUNNING_TIMEOUT, BankStatementImport, ImportStatus, Payment, ReservationPayment
 from core.models import get_reservations_with_likely_payments
 
+from core.tests.bank_statements import BANK_STATEMENTS_CSV
 from concert.tests.test_models import fill_db as fill_concert_db
 from ital.tests.test_models import fill_db as fill_ital_db
 
@@ -40,3 +50,152 @@ class PaymentList(TestCase):
         response = self.client.get(self.test_url, follow=False)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "core/payments.html")
+
+
+class UploadPaymentCsv(TestCase):
+    test_url: str
+    client: Client
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user("john", "lennon@thebeatles.com", "johnpassword")
+        cls.test_url = reverse("upload_payment_csv")
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def make_csv_file(*rows: str) -> SimpleUploadedFile:
+        return SimpleUploadedFile(
+            "statement.csv",
+            "\n".join([BANK_STATEMENTS_CSV[0], *rows]).encode("utf-8"),
+            content_type="text/csv")
+
+    def test_no_login__redirects(self):
+        self.client.logout()
+        response = self.client.post(self.test_url, {"formFile": self.make_csv_file()})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith("/login"))
+
+    def test_upload__queues_import_and_redirects_to_its_status(self):
+        response = self.client.post(
+            self.test_url, {"formFile": self.make_csv_file(*BANK_STATEMENTS_CSV[1:4])})
+        job = BankStatementImport.objects.get()
+        self.assertRedirects(response, reverse("payment_import", kwargs={"job_id": job.id}), fetch_redirect_response=False)
+        self.assertEqual(job.status, ImportStatus.QUEUED)
+        self.assertEqual(job.file_name, "statement.csv")
+        self.assertEqual(Payment.objects.count(), 0)
+
+        response = self.client.get(response.url)
+        self.assertContains(response, "en attente")
+        self.assertContains(response, 'http-equiv="refresh"')
+
+    def test_status_page_after_import_with_errors(self):
+        row = BANK_STATEMENTS_CSV[1]
+        conflicting_row = row.replace("-00127;", "-00999;", 1)
+        self.client.post(self.test_url, {"formFile": self.make_csv_file(row, conflicting_row)})
+        call_command("process_bank_statement_imports", "--once", stdout=io.StringIO())
+        job = BankStatementImport.objects.get()
+        self.assertEqual((job.status, job.rows_total, job.rows_processed, job.rows_failed),
+                         (ImportStatus.DONE, 2, 2, 1))
+        self.assertEqual(Payment.objects.count(), 1)
+
+        response = self.client.get(reverse("payment_import", kwargs={"job_id": job.id}))
+        self.assertContains(response, "il y avait 2 transactions en tout dont 1 erreur")
+        self.assertContains(response, '<li class="text-danger">', count=1)
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+
+    def test_preview_then_confirm(self):
+        rows = BANK_STATEMENTS_CSV[1:4]
+        self.client.post(self.test_url, {"formFile": self.make_csv_file(rows[0], *rows), "dry_run": "yes"})
+        call_command("process_bank_statement_imports", "--once", stdout=io.StringIO())
+        job = BankStatementImport.objects.get()
+        self.assertEqual((job.status, job.rows_total, job.rows_failed), (ImportStatus.PREVIEWED, 4, 0))
+        self.assertEqual(Payment.objects.count(), 0)
+
+        status_url = reverse("payment_import", kwargs={"job_id": job.id})
+        confirm_url = reverse("confirm_payment_import", kwargs={"job_id": job.id})
+        response = self.client.get(status_url)
+        self.assertContains(response, "prévisualisation de 4 transactions")
+        self.assertContains(response, "<li>nouvelle transaction: 3</li>")
+        self.assertContains(response, "<li>déjà importée à l&#x27;identique: 1</li>")
+        self.assertContains(response, f'action="{confirm_url}"')
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+        response = self.client.post(confirm_url)
+        self.assertRedirects(response, status_url, fetch_redirect_response=False)
+        self.assertEqual(BankStatementImport.objects.get().status, ImportStatus.QUEUED)
+        call_command("process_bank_statement_imports", "--once", stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed, job.rows_failed), (ImportStatus.DONE, 4, 0))
+        self.assertEqual(Payment.objects.count(), 3)
+
+        # Confirming again does not import again
+        response = self.client.post(confirm_url, follow=True)
+        self.assertContains(response, "Cet import n'attend pas de confirmation")
+        self.assertEqual(BankStatementImport.objects.get().status, ImportStatus.DONE)
+
+
+class ProcessBankStatementImports(TestCase):
+    def test_claims_each_job_once_and_reports_unknown_format(self):
+        ok = BankStatementImport.objects.create(
+            file_name="ok.csv", content="\n".join(BANK_STATEMENTS_CSV[:3]).encode("utf-8"))
+        bad = BankStatementImport.objects.create(file_name="bad.csv", content=b"a;b;c\n1;2;3\n")
+
+        self.assertEqual(BankStatementImport.claim_next(), ok)
+        self.assertEqual(BankStatementImport.claim_next(), bad)
+        self.assertIsNone(BankStatementImport.claim_next())
+
+        BankStatementImport.objects.update(status=ImportStatus.QUEUED)
+        out = io.StringIO()
+        call_command("process_bank_statement_imports", "--once", stdout=out)
+        ok.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual((ok.status, ok.rows_processed, ok.rows_failed), (ImportStatus.DONE, 2, 0))
+        self.assertEqual(bad.status, ImportStatus.FAILED)
+        self.assertIn("Unable to map header row", bad.failure)
+        self.assertIsNotNone(bad.finished)
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertIn("bad.csv: failed", out.getvalue())
+
+    def test_removes_old_qr_codes(self):
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(QR_CODE_CACHE_DIR=cache_dir):
+            old = Path(cache_dir) / "ab" / "abcdef.svg"
+            old.parent.mkdir()
+            old.write_bytes(b"<svg/>")
+            long_ago = time.time() - timedelta(days=settings.QR_CODE_CACHE_MAX_AGE_DAYS + 1).total_seconds()
+            os.utime(old, (long_ago, long_ago))
+            out = io.StringIO()
+            call_command("process_bank_statement_imports", "--once", stdout=out)
+            self.assertFalse(old.exists())
+        self.assertIn("1 cached QR code(s) removed", out.getvalue())
+
+    def test_abandoned_running_jobs_are_failed(self):
+        content = "\n".join(BANK_STATEMENTS_CSV[:3]).encode("utf-8")
+        abandoned = BankStatementImport.objects.create(
+            file_name="abandoned.csv", content=content, status=ImportStatus.RUNNING,
+            started=timezone.now() - IMPORT_RUNNING_TIMEOUT - timedelta(minutes=1))
+        running = BankStatementImport.objects.create(
+            file_name="running.csv", content=content, status=ImportStatus.RUNNING, started=timezone.now())
+
+        self.assertIsNone(BankStatementImport.claim_next())
+        abandoned.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual(abandoned.status, ImportStatus.FAILED)
+        self.assertIn("Abandoned by its worker", abandoned.failure)
+        self.assertIsNotNone(abandoned.finished)
+        self.assertEqual(running.status, ImportStatus.RUNNING)
+
+    def test_status_page_of_an_abandoned_job_stops_refreshing(self):
+        self.client.force_login(User.objects.create_user("john", "lennon@thebeatles.com", "johnpassword"))
+        job = BankStatementImport.objects.create(
+            file_name="abandoned.csv", content=b"", status=ImportStatus.RUNNING,
+            started=timezone.now() - IMPORT_RUNNING_TIMEOUT - timedelta(minutes=1))
+        response = self.client.get(reverse("payment_import", kwargs={"job_id": job.id}))
+        self.assertContains(response, "Abandoned by its worker")
+        self.assertNotContains(response, 'http-equiv="refresh"')
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportStatus.FAILED)
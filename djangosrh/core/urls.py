@@ -6,4 +6,8 @@ urlpatterns = [
     path("payments", view=views.PaymentListView.as_view(), name="payments"),
     path("toggle_payment_active_status", view=views.toggle_payment_active_status, name="toggle_payment_active_status"),
     path("upload_payment_csv", view=views.upload_payment_csv, name="upload_payment_csv"),
+    path("payment_imports/<int:job_id>", view=views.payment_import, name="payment_import"),
+    path("payment_imports/<int:job_id>/confirm", view=views.confirm_payment_import, name="confirm_payment_import"),
+    path("performance", view=views.performance_stats, name="performance_stats"),
+    path("metrics", view=views.performance_metrics, name="performance_metrics"),
 ]
@@ -1,10 +1,12 @@
-import io
 from collections import defaultdict
 from datetime import datetime, UTC
 from typing import Mapping
 
+import hmac
+
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import login_required
 from django.core.mail import EmailMultiAlternatives
@@ -13,11 +15,15 @@ from django.http import HttpResponse, Http404, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import html
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.generic import ListView
 
-from .banking import cents_to_euros, format_bank_id, generate_payment_QR_code_content, import_bank_statements
+from .banking import cents_to_euros, format_bank_id, generate_payment_QR_code_content
+from .performance import METRICS, prometheus_text, recorder
+from .qrcodes import QR_CODE_CONTENT_TYPES, qr_code_etag, render_qr_code
 
-from .models import BaseReservation, Payment, ReservationPayment
+from .models import BankStatementImport, BaseReservation, ImportStatus, Payment, ReservationPayment
 
 class PaymentListView(LoginRequiredMixin, ListView):
     template_name = "core/payments.html"
@@ -63,7 +69,7 @@ def toggle_payment_active_status(request):
 
     payment = get_object_or_404(Payment, bank_ref=bank_ref)
     payment.active = new_active
-    payment.save()
+    payment.save(update_fields=["active"])
 
     return redirect(request.POST.get('next', default_next))
 
@@ -74,13 +80,37 @@ def upload_payment_csv(request):
     if not (file := request.FILES.get('formFile')):
         return redirect(default_next)
 
-    result = import_bank_statements(io.TextIOWrapper(file, errors='replace', encoding='utf-8'))
+    job = BankStatementImport(file_name=file.name, content=file.read(), dry_run=request.POST.get('dry_run') == "yes")
+    job.save()
+    return redirect(reverse('payment_import', kwargs={"job_id": job.id}))
+
+
+@login_required
+def payment_import(request, job_id: int):
+    job = get_object_or_404(BankStatementImport, pk=job_id)
+    if job.is_abandoned():
+        # Do not wait for a worker that is gone
+        BankStatementImport.fail_abandoned()
+        job.refresh_from_db()
+    return render(request, "core/payment_import.html", context={
+        "job": job,
+        "result": job.failed_rows(),
+        "preview": job.preview_rows() if job.status == ImportStatus.PREVIEWED else [],
+        "next": reverse('payments')})
 
-    if all(exc is None for exc, _ in result):
-        return redirect(request.POST.get('next', default_next))
-    else:
-        return render(request, "core/payment_upload_csv_result.html", context={"result": result})
 
+@login_required
+def confirm_payment_import(request, job_id: int):
+    """Queue the import of the rows classified by a dry run
+
+    The worker applies the stored classification, the CSV is not parsed again."""
+    if request.method != "POST":
+        return redirect(reverse('payment_import', kwargs={"job_id": job_id}))
+    # Conditional update so that confirming twice does not import twice
+    if not BankStatementImport.objects.filter(pk=job_id, status=ImportStatus.PREVIEWED).update(
+            status=ImportStatus.QUEUED, dry_run=False, started=None, finished=None):
+        messages.add_message(request, messages.ERROR, "Cet import n'attend pas de confirmation")
+    return redirect(reverse('payment_import', kwargs={"job_id": job_id}))
 
 
 def aux_send_payment_reception_confirmation(request, event_class: type, redirect_view: str, show_reservation_view: str) -> HttpResponseRedirect:
@@ -125,7 +155,77 @@ def aux_send_payment_reception_confirmation(request, event_class: type, redirect
         messages.add_message(request, messages.ERROR, f"Unable to send confirmation mail to {reservation.email}: {e}. {template}")
     else:
         reservation_payment.confirmation_sent_timestamp = datetime.now(tz=UTC)
-        reservation_payment.save()
+        reservation_payment.save(update_fields=["confirmation_sent_timestamp"])
         messages.add_message(request, messages.INFO, f"Confirmation mail sent to {reservation.email}.")
 
         return HttpResponseRedirect(reverse(redirect_view, query={"event_id": event.id}))
+
+
+def _qr_code_response(request, payload: str, fmt: str, **cache_control) -> HttpResponse:
+    if fmt not in QR_CODE_CONTENT_TYPES:
+        raise Http404(f"Unknown QR code format {fmt!r}.")
+    etag = qr_code_etag(payload, fmt)
+    if (response := get_conditional_response(request, etag=etag)) is None:
+        image = render_qr_code(payload, fmt)
+        response = HttpResponse(image.content, content_type=image.content_type)
+        response["Last-Modified"] = http_date(image.last_modified.timestamp())
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, **cache_control)
+    return response
+
+
+def aux_payment_qrcode(request, uuid: str, fmt: str) -> HttpResponse:
+    """QR code to pay the remaining amount due of a reservation
+
+    Its ETag changes with the payment details (amount, bank_id, account)."""
+    reservation = get_object_or_404(BaseReservation.objects.select_related("base_event"), uuid=uuid)
+    return _qr_code_response(
+        request,
+        generate_payment_QR_code_content(
+            reservation.remaining_due_in_cents,
+            bank_id=reservation.bank_id,
+            bank_account=reservation.base_event.bank_account,
+            organizer_bic=reservation.base_event.organizer_bic,
+            organizer_name=reservation.base_event.organizer_name),
+        fmt,
+        # Revalidated each time: the amount changes when payments come in
+        no_cache=True)
+
+
+def aux_page_qrcode(request, uuid: str, fmt: str, show_reservation_view: str) -> HttpResponse:
+    "QR code of the URL of the reservation page"
+    get_object_or_404(BaseReservation.objects.only("pk"), uuid=uuid)
+    return _qr_code_response(
+        request,
+        request.build_absolute_uri(reverse(show_reservation_view, kwargs={"uuid": uuid})),
+        fmt,
+        max_age=7 * 24 * 3600)
+
+
+@staff_member_required
+def performance_stats(request):
+    "Percentiles of the recent requests of each view, see core.performance.PerformanceMiddleware"
+    views = [{"name": name,
+              "count": stats.count,
+              # Times in milliseconds
+              "metrics": [{"name": metric.removesuffix("_seconds"),
+                           "quantiles": [value if metric == "queries" else round(value * 1000, 1)
+                                         for _, value in stats.quantiles(metric)]}
+                          for metric in METRICS]}
+             for name, stats in recorder.snapshot()]
+    return render(request, "core/performance_stats.html", {"views": views, "window": recorder.window})
+
+
+def performance_metrics(request):
+    """The statistics for Prometheus
+
+    Scrapers authenticate with `Authorization: Bearer <settings.PERFORMANCE_METRICS_TOKEN>',
+    staff members with their session."""
+    token = getattr(settings, "PERFORMANCE_METRICS_TOKEN", None)
+    authorization = request.headers.get("Authorization", "")
+    if not ((request.user.is_active and request.user.is_staff)
+            or (token and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()))):
+        return HttpResponse("Unauthorized", status=401, content_type="text/plain")
+    response = HttpResponse(prometheus_text(recorder.snapshot()), content_type="text/plain; version=0.0.4")
+    patch_cache_control(response, no_store=True)
+    return response
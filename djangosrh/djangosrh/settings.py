@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.performance.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,7 +60,8 @@ ROOT_URLCONF = 'djangosrh.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates timing the renders for core.performance.PerformanceMiddleware
+        'BACKEND': 'core.performance.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -139,6 +141,14 @@ STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Where rendered QR codes are kept for all worker processes (optional)
+QR_CODE_CACHE_DIR = getenv('QR_CODE_CACHE_DIR', '') or None
+# Days after which the process_bank_statement_imports worker removes them
+QR_CODE_CACHE_MAX_AGE_DAYS = int(getenv('QR_CODE_CACHE_MAX_AGE_DAYS', 30))
+
+# Bearer token of the Prometheus scraper for /core/metrics (staff members can always read it)
+PERFORMANCE_METRICS_TOKEN = getenv('PERFORMANCE_METRICS_TOKEN', '') or None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
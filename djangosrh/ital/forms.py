@@ -4,13 +4,57 @@ import functools
 import itertools
 import operator
 import re
-import time
 from typing import Any, Callable, Iterator, Mapping
 
-from core.banking import generate_bank_id
+from django.db import models, transaction
+
+from core.banking import allocate_bank_id
+from core.cache import LRUCache
 from .templatetags.currency_filter import plural
 
-from .models import Civility, Event, Item, Reservation, ReservationItemCount
+from .models import Choice, Civility, Event, Item, Reservation, ReservationItemCount
+
+
+MenuItem = namedtuple("MenuItem", ("key", "item"))
+MenuChoice = namedtuple("MenuChoice", (
+    "choice",
+    "items",  # tuple[MenuItem, ...]
+))
+MenuCatalog = namedtuple("MenuCatalog", (
+    "choices",  # tuple[MenuChoice, ...]
+    "all_dishes",  # tuple[str, ...], sorted
+))
+
+_menu_catalogs: LRUCache[MenuCatalog] = LRUCache()
+
+
+def _build_menu_catalog(event_id: int) -> MenuCatalog:
+    choices = tuple(
+        MenuChoice(choice=choice,
+                   items=tuple(MenuItem(key=f"counter{idx}_ch_{choice.id}_it_{item.id}", item=item)
+                               for idx, item in enumerate(choice.item_set.all())))
+        for choice in Choice.objects
+        .filter(available_in_id=event_id)
+        .order_by("id")
+        .prefetch_related(models.Prefetch("item_set", queryset=Item.objects.order_by("id"))))
+    return MenuCatalog(
+        choices=choices,
+        all_dishes=tuple(sorted({menu_item.item.dish for menu_choice in choices for menu_item in menu_choice.items})))
+
+
+def get_menu_catalog(event_id: int) -> MenuCatalog:
+    """Choices and items of an event, with their form input keys
+
+    Shared between requests: the model instances in it must not be modified."""
+    return _menu_catalogs.get_or_build(event_id, lambda: _build_menu_catalog(event_id))
+
+
+def invalidate_menu_catalog(event_id: int | None = None) -> None:
+    "Forget the menu catalog of an event (or of all events)"
+    if event_id is None:
+        _menu_catalogs.clear()
+    else:
+        _menu_catalogs.invalidate(event_id)
 
 
 class ReservationForm:
@@ -108,15 +152,13 @@ class ReservationForm:
 
     def validate_sum_groups(self):
         total_due_in_cents = 0
-        idx = 0
-        all_dishes: set[str] = set()
-        for choice in self.event.choice_set.all():
+        catalog = get_menu_catalog(self.event.id)
+        for choice, menu_items in catalog.choices:
             vals: defaultdict[str, list[ReservationForm.Input]] = defaultdict(list)
             sums: defaultdict[str, int] = defaultdict(int)
             item: Item
-            for idx, item in enumerate(choice.item_set.all()):
+            for key, item in menu_items:
                 errors: list[str] = []
-                key = f"counter{idx}_ch_{choice.id}_it_{item.id}"
                 try:
                     val = int(self.data[key])
                 except ValueError:
@@ -129,7 +171,6 @@ class ReservationForm:
                         errors.append("Must not be negative")
                     elif val > 20:
                         errors.append("Too large")
-                all_dishes.add(item.dish)
                 vals[item.dish].append(self.Input(
                     id=key, name=key, value=val, errors=errors if self.was_validated else [], choice=choice, item=item))
                 sums[item.dish] += val
@@ -139,7 +180,7 @@ class ReservationForm:
                 self.single_items[input_.item.dish].append(input_)
             else:
                 sums_array = []
-                for dish in all_dishes:
+                for dish in catalog.all_dishes:
                     if vals[dish]:
                         sums_array.append(sums[dish])
                 total_due_in_cents += choice.price_in_cents * sums_array[0]
@@ -150,13 +191,16 @@ class ReservationForm:
                     errors=["Sum mismatch"] if sums_array and any(sums_array[0] != x for x in sums_array) else [],
                 ))
         self.total_due_in_cents = total_due_in_cents
-        self.all_dishes = list(all_dishes)
+        self.all_dishes = list(catalog.all_dishes)
         self.single_items = dict(self.single_items) # django templating gets confused by defaultdict
-        self.all_dishes.sort()
 
     def save(self) -> Reservation | None:
-        if self.is_valid():
-            if self.places.value + self.event.occupied_seats() > self.event.max_seats:
+        if not self.is_valid():
+            return None
+        # Outside of the transaction: see BankIdAllocator
+        bank_id = allocate_bank_id()
+        with transaction.atomic():
+            if not self.event.reserve_seats(self.places.value):
                 self.errors.append(f"Il n'y a plus assez de places.  Contactez nous: {self.event.contact_email}")
                 return None
             reservation = Reservation(
@@ -169,21 +213,15 @@ class ReservationForm:
                 total_due_in_cents=self.total_due_in_cents,
                 places=self.places.value,
                 extra_comment=self.extra_comment.value,
-                bank_id=generate_bank_id(time.time(), Reservation.objects.count()),
+                bank_id=bank_id,
             )
-            reservation.save()
-            for inpt in itertools.chain(
-                    *self.single_items.values(),
-                    *itertools.chain(*(pack.items.values() for pack in self.packs))):
-                if inpt.value < 1:
-                    continue
-                reservation_item_count = ReservationItemCount(
-                    reservation=reservation,
-                    choice=inpt.choice,
-                    item=inpt.item,
-                    count=inpt.value)
-                reservation_item_count.save()
-                reservation.reservationitemcount_set.add(reservation_item_count)
+            reservation.save(seats_reserved=True)
+            ReservationItemCount.objects.bulk_create(
+                ReservationItemCount(reservation=reservation, choice=inpt.choice, item=inpt.item, count=inpt.value)
+                for inpt in itertools.chain(
+                        *self.single_items.values(),
+                        *itertools.chain(*(pack.items.values() for pack in self.packs)))
+                if inpt.value > 0)
             return reservation
 
 
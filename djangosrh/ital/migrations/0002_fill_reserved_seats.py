@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+def fill_reserved_seats(apps, schema_editor):
+    BaseEvent = apps.get_model("core", "BaseEvent")
+    Reservation = apps.get_model("ital", "Reservation")
+    for event_id, places in (Reservation.objects
+                             .values_list("event_id")
+                             .annotate(places=models.Sum("places"))):
+        BaseEvent.objects.filter(pk=event_id).update(reserved_seats=places)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_baseevent_reserved_seats'),
+        ('ital', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_reserved_seats, migrations.RunPython.noop),
+    ]
@@ -2,9 +2,9 @@ from collections import namedtuple
 from collections.abc import Iterator
 import uuid
 
-from django.db import models
+from django.db import models, transaction
 
-from core.models import BaseEvent, BaseReservation, Civility, Payment
+from core.models import BaseEvent, BaseReservation, Civility, Payment, register_seated_reservation
 
 
 class DishType(models.TextChoices):
@@ -88,6 +88,7 @@ class ReservationItemCount(models.Model):
         return f"<ReservationItemCount {self.id}, {self.count}*{self.item} from {self.choice}>"
 
 
+@register_seated_reservation
 class Reservation(BaseReservation):
     base_reservation_ptr = models.OneToOneField(BaseReservation,
                                                 on_delete=models.CASCADE,
@@ -101,11 +102,31 @@ class Reservation(BaseReservation):
                               related_query_name="%(app_label)s_%(class)ss")
     places = models.PositiveIntegerField()
 
+    SEATS_FIELD = "places"
+
     def count_items(self, item: Item|int) -> int:
         item_id = item.id if isinstance(item, Item) else item
         return sum(it.count for it in self.reservationitemcount_set.filter(item_id=item_id))
 
-    def save(self, **kwargs):
+    def save(self, *, seats_reserved: bool = False, **kwargs):
+        """Save the reservation, taking its places from the event
+
+        When it is created, `seats_reserved' tells that they were already
+        taken with BaseEvent.reserve_seats (see ReservationForm.save).  When
+        its places are changed (e.g. in the admin), the difference is taken
+        or given back."""
         if not hasattr(self, 'base_event') or self.base_event is None:
             self.base_event = self.event.base_event_ptr
-        super().save(**kwargs)
+        if self._state.adding:
+            super().save(**kwargs)
+            if not seats_reserved:
+                self.event.take_seats(self.places)
+        elif "places" not in (kwargs.get("update_fields") or ("places",)):
+            super().save(**kwargs)
+        else:
+            with transaction.atomic():
+                previous_places = (Reservation.objects.select_for_update()
+                                   .filter(pk=self.pk).values_list("places", flat=True).first()) or 0
+                super().save(**kwargs)
+                if self.places != previous_places:
+                    self.event.take_seats(self.places - previous_places)
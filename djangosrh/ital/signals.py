@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.models import BaseEvent
+from .forms import invalidate_menu_catalog
+from .models import Choice, Item, Reservation
+
+
+@receiver(pre_delete, sender=Reservation)
+def reservation_deleted(sender, instance: Reservation, **kwargs):
+    # The places as they are in the DB: `instance' may have been loaded
+    # before they were changed (see Reservation.save)
+    with transaction.atomic():
+        if (current := (Reservation.objects.select_for_update()
+                        .filter(pk=instance.pk).values_list("places", "event_id").first())) is not None:
+            places, event_id = current
+            BaseEvent(pk=event_id).release_seats(places)
+
+
+def _invalidate_menu_catalog(event_id: int | None) -> None:
+    invalidate_menu_catalog(event_id)
+    # again once committed: a concurrent request might have cached the
+    # menu as it was before this transaction in the meantime
+    transaction.on_commit(lambda: invalidate_menu_catalog(event_id))
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def choice_changed(sender, instance: Choice, **kwargs):
+    _invalidate_menu_catalog(instance.available_in_id)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(m2m_changed, sender=Item.choices.through)
+def item_changed(sender, **kwargs):
+    # An item can be part of choices of several events
+    _invalidate_menu_catalog(None)
@@ -1,7 +1,13 @@
 from datetime import datetime, timezone
+import itertools
 from typing import Mapping
+from unittest import mock
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.banking import BankIdAllocator
 
 from ..models import (
     Choice,
@@ -238,6 +244,54 @@ class IntegrationTestCases(TestCase):
         self.assertEqual(data.count_items(self.items[5]), 2 + 2)
         self.assertEqual(data.count_items(self.items[6]), 1)
 
+    def test_ReservationForm__save_inserts_all_items_at_once(self):
+        blank_reservation = ReservationForm(self.event)
+        pack = self.get_pack(blank_reservation, "<c>Anything goes menu<c>")
+        data = {inpt.name: "1" for inpt in itertools.chain(
+            *blank_reservation.single_items.values(), *pack.items.values())}
+        places = len(pack.items["dt1main"])
+        for inputs in pack.items.values():
+            data[inputs[0].name] = str(places - len(inputs) + 1)
+        data.update({
+            blank_reservation.last_name.name: "Last Name (everything)",
+            blank_reservation.places.name: str(places),
+            blank_reservation.email.name: "every@thi.ng",
+            blank_reservation.accepts_rgpd_reuse.name: "yes",
+        })
+        reservation = ReservationForm(self.event, data)
+        self.assertTrue(reservation.is_valid())
+        allocate_bank_id = BankIdAllocator(block_size=2)
+        allocate_bank_id()  # lease outside of the measurement
+        with mock.patch("ital.forms.allocate_bank_id", allocate_bank_id), \
+             CaptureQueriesContext(connection) as ctx:
+            saved = reservation.save()
+        self.assertIsNotNone(saved)
+        self.assertEqual(ReservationItemCount.objects.filter(reservation=saved).count(), len(data) - 4)
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        # BaseReservation, Reservation and one for all the ReservationItemCounts
+        self.assertEqual(len(inserts), 3)
+        # SAVEPOINT, reserve seats (UPDATE + SELECT), 3 INSERTs, RELEASE SAVEPOINT
+        self.assertEqual(len(ctx.captured_queries), 7)
+
+    def test_ReservationForm__menu_is_cached(self):
+        ReservationForm(self.event)
+        with self.assertNumQueries(0):
+            blank_reservation = ReservationForm(self.event)
+            pack = self.get_pack(blank_reservation, "<c>Bolo menu<c>")
+            bolo = self.get_input(pack, "dt1main", "<>Bolo<>")
+            ReservationForm(self.event, {bolo.name: "1", "last_name": "Cached"}).is_valid()
+
+        choice = pack.choice
+        choice = Choice.objects.get(pk=choice.pk)
+        choice.price_in_cents += 100
+        choice.save()
+        try:
+            pack = self.get_pack(ReservationForm(self.event), "<c>Bolo menu<c>")
+            self.assertEqual(pack.choice.price_in_cents, choice.price_in_cents)
+        finally:
+            choice.price_in_cents -= 100
+            choice.save()
+
 # Local Variables:
 # compile-command: "uv run python ../../manage.py test ital"
 # End:
@@ -233,6 +233,39 @@ class IntegrationTestCases(TestCase):
         self.assertEqual(self.reservations[1].remaining_amount_due_in_cents(), 2800)
         self.assertEqual(self.reservations[2].remaining_amount_due_in_cents(), 2200)
 
+    def test_changing_places_changes_reserved_seats(self):
+        reserved_seats = Event.objects.get(pk=self.event.pk).reserved_seats
+        reservation = Reservation.objects.get(pk=self.reservations[1].pk)
+        stale = Reservation.objects.get(pk=self.reservations[1].pk)
+        reservation.places += 2
+        reservation.save()
+        self.assertEqual(Event.objects.get(pk=self.event.pk).reserved_seats, reserved_seats + 2)
+        stale.places -= 1
+        stale.save()
+        self.assertEqual(Event.objects.get(pk=self.event.pk).reserved_seats, reserved_seats - 1)
+        reservation.extra_comment = "Changed"
+        reservation.save(update_fields=["extra_comment"])
+        self.assertEqual(Event.objects.get(pk=self.event.pk).reserved_seats, reserved_seats - 1)
+
+    def test_reservations_created_outside_the_form_take_their_places(self):
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertEqual(event.reserved_seats, 6)
+        ReservationPayment.objects.all().delete()
+        for rsrvtn in Reservation.objects.filter(event=event):
+            rsrvtn.delete()
+        event.refresh_from_db()
+        self.assertEqual(event.reserved_seats, 0)
+
+    def test_deleting_a_stale_reservation_releases_its_current_places(self):
+        reserved_seats = Event.objects.get(pk=self.event.pk).reserved_seats
+        ReservationPayment.objects.all().delete()
+        reservation = Reservation.objects.filter(event=self.event).order_by("pk").first()
+        stale = Reservation.objects.get(pk=reservation.pk)
+        reservation.places += 3
+        reservation.save()
+        stale.delete()
+        self.assertEqual(Event.objects.get(pk=self.event.pk).reserved_seats, reserved_seats - stale.places)
+
 
 # Local Variables:
 # compile-command: "uv run python ../../manage.py test ital"
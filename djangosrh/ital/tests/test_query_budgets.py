@@ -0,0 +1,142 @@
+from datetime import date, datetime, timezone
+import itertools
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from core.banking import add_check_digits
+from core.models import Civility, ReservationPayment
+from core.tests.query_budget import QueryBudgetTestCase, fill_payments
+from ..forms import ReservationForm, invalidate_menu_catalog
+from ..models import (
+    Choice,
+    DishType,
+    Event,
+    Item,
+    Reservation,
+    ReservationItemCount,
+)
+
+
+def fill_large_db(reservations: int = 300, items_per_dish: int = 8) -> tuple[Event, list[Item], list[Choice], list[Reservation]]:
+    """An event with `items_per_dish' items of each dish, a single choice per
+    item, menus and `reservations' reservations, most of them paid."""
+    event = Event(
+        name="Grand souper italien",
+        date=datetime(2026, 3, 28, 18, 0, 0, tzinfo=timezone.utc),
+        contact_email="dont-spam@me.com",
+        max_seats=10 * reservations)
+    event.save()
+    items = Item.objects.bulk_create(
+        Item(display_text=f"{dish.label} {idx}", display_text_plural=f"{dish.label}s {idx}",
+             column_header=f"{dish.label[:4]}{idx}", short_text=f"{dish.label[0]}{idx}", dish=dish)
+        for dish in (DishType.DT0STARTER, DishType.DT1MAIN, DishType.DT2DESSERT)
+        for idx in range(items_per_dish))
+    by_dish = [items[dish * items_per_dish:(dish + 1) * items_per_dish] for dish in range(3)]
+    singles = Choice.objects.bulk_create(
+        Choice(display_text=item.display_text, price_in_cents=800 + 100 * (idx % 5), available_in=event)
+        for idx, item in enumerate(items))
+    menus = Choice.objects.bulk_create(
+        Choice(display_text=f"Menu {idx}", price_in_cents=2500, available_in=event)
+        for idx in range(items_per_dish // 2))
+    Item.choices.through.objects.bulk_create(
+        [Item.choices.through(item_id=item.id, choice_id=single.id) for item, single in zip(items, singles)]
+        + [Item.choices.through(item_id=item.id, choice_id=menu.id)
+           for idx, menu in enumerate(menus)
+           for item in (by_dish[0][idx], by_dish[0][idx + 1], by_dish[1][idx], by_dish[2][idx])])
+    invalidate_menu_catalog(event.id)  # bulk_create sends no signals
+
+    rsrvtns = []
+    for idx in range(reservations):
+        rsrvtns.append(rsrvtn := Reservation(
+            civility=(Civility.man, Civility.woman, Civility.__empty__)[idx % 3],
+            first_name=f"Prénom {idx}",
+            last_name=f"Nom {idx % 97:02}",
+            email=f"client{idx}@yopmail.fr",
+            accepts_rgpd_reuse=idx % 2 == 0,
+            total_due_in_cents=2500 + 800 * (idx % 4),
+            places=1 + idx % 4,
+            event=event,
+            bank_id=add_check_digits(4_200_000_000 + idx),
+            extra_comment="" if idx % 10 else f"Commentaire {idx}"))
+        rsrvtn.save()
+    ReservationItemCount.objects.bulk_create(itertools.chain(*(
+        (ReservationItemCount(reservation=rsrvtn, choice=menus[idx % len(menus)], item=by_dish[0][idx % len(menus)], count=1),
+         ReservationItemCount(reservation=rsrvtn, choice=menus[idx % len(menus)], item=by_dish[1][idx % len(menus)], count=1),
+         ReservationItemCount(reservation=rsrvtn, choice=menus[idx % len(menus)], item=by_dish[2][idx % len(menus)], count=1),
+         ReservationItemCount(reservation=rsrvtn, choice=singles[idx % len(singles)], item=items[idx % len(items)], count=idx % 3))
+        for idx, rsrvtn in enumerate(rsrvtns))))
+    # Everybody paid, half of the payments are already linked
+    payments = fill_payments([rsrvtn.bank_id for rsrvtn in rsrvtns], 2500, date(2026, 1, 10))
+    for rsrvtn, payment in itertools.islice(zip(rsrvtns, payments), 0, None, 2):
+        ReservationPayment(reservation=rsrvtn, payment=payment, confirmation_sent_timestamp=None).save()
+    return event, items, singles + menus, rsrvtns
+
+
+class ViewQueryBudgets(QueryBudgetTestCase):
+    event: Event
+    items: list[Item]
+    choices: list[Choice]
+    reservations: list[Reservation]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("john", "lennon@thebeatles.com", "johnpassword")
+        cls.event, cls.items, cls.choices, cls.reservations = fill_large_db()
+
+    def test_index(self):
+        self.assertQueryBudget(0, lambda: self.client.get(reverse("ital:index")))
+
+    def test_show_reservation(self):
+        uuid = self.reservations[-1].uuid
+        self.assertQueryBudget(3, lambda: self.client.get(reverse("ital:show_reservation", args=[uuid])))
+        for view in ("ital:payment_qrcode", "ital:page_qrcode"):
+            with self.subTest(view=view):
+                self.assertQueryBudget(1, lambda: self.client.get(reverse(view, args=[uuid, "svg"])))
+
+    def test_reservations(self):
+        self.client.force_login(self.user)
+        url = reverse("ital:reservations")
+        for page in (1, 15):
+            with self.subTest(page=page):
+                self.assertQueryBudget(9, lambda: self.client.get(url, {"event_id": self.event.id, "page": page}))
+
+    def test_reservation_form(self):
+        url = reverse("ital:reservation_form", args=[self.event.id])
+        self.assertQueryBudget(3, lambda: self.client.get(url))
+        form = ReservationForm(self.event)
+        self.assertQueryBudget(19, lambda: self.client.post(url, {
+            "civility": "Mr",
+            "last_name": "Doe",
+            "email": "john.doe@example.com",
+            "places": "2",
+            form.single_items[DishType.DT1MAIN][0].name: "2",
+        }), status_code=302)
+
+    def test_send_payment_reception_confirmation(self):
+        self.client.force_login(self.user)
+        reservation = self.reservations[1]
+        payment = fill_payments([reservation.bank_id], 1000, date(2026, 3, 1))[0]
+        self.assertQueryBudget(14, lambda: self.client.post(
+            reverse("ital:send_payment_reception_confirmation"),
+            {"payment_id": payment.id, "reservation_id": reservation.id, "event_id": self.event.id}),
+            status_code=302)
+
+    def test_item_tickets(self):
+        self.client.force_login(self.user)
+        url = reverse("ital:item_tickets", args=[self.event.id])
+        self.assertQueryBudget(4, lambda: self.client.get(url))
+        response = self.assertQueryBudget(8, lambda: self.client.post(url, {
+            f"itm_gen_{item.id}": str(item.total_count + 5) for item in self.event.reservation_items()}))
+        self.assertContains(response, "Tickets de réserve")
+
+    def test_export(self):
+        self.client.force_login(self.user)
+        url = reverse("ital:export_csv", args=[self.event.id])
+        for fmt in ("csv", "xlsx", "jsonl"):
+            with self.subTest(format=fmt):
+                self.assertQueryBudget(5, lambda: self.client.get(url, {"format": fmt}))
+
+# Local Variables:
+# compile-command: "uv run python ../../manage.py test ital"
+# End:
@@ -1,9 +1,14 @@
 from datetime import date, datetime, timezone
+import io
+import json
 from typing import Mapping
 from uuid import uuid4
+import zipfile
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from core.models import Payment, ReservationPayment
@@ -15,6 +20,7 @@ from ..models import (
     Event,
     Item,
     Reservation,
+    ReservationItemCount,
 )
 
 from .test_models import fill_db
@@ -133,14 +139,15 @@ class GetReservationsWithLikelyPayments003000300003_after_1st_payment_linked(
 
 
 class GetExportCsvWithExampleList(TestCase):
+    event: Event
     user: User
     test_url: str
 
     def setUp(self):
         super().setUp()
-        event, *_ = fill_db()
+        self.event, *_ = fill_db()
         self.user = User.objects.create_user("john", "lennon@thebeatles.com", "johnpassword")
-        self.test_url = reverse('ital:export_csv', kwargs={'event_id': event.id})
+        self.test_url = reverse('ital:export_csv', kwargs={'event_id': self.event.id})
 
     def test_no_login__redirects(self):
         c = Client()
@@ -154,12 +161,44 @@ class GetExportCsvWithExampleList(TestCase):
         c = Client()
         c.force_login(self.user)
         response = c.get(self.test_url, follow=False)
-        self.assertEqual(response.content.decode('utf8'),
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.getvalue().decode('utf8'),
                          'Nom,Places,Valeur,Déjà payé,Restant dû,Tomate Mozza,Croquettes,Bolo,Scampis,Vegetarian,Tiramisu,Glace,Commentaire\r\n'
                          'Priv Ate,1,22.00€,0.00€,22.00€,0,1,1,0,0,1,0,th¡rd\r\n'
                          'Mme Lara Croft,3,28.00€,0.00€,28.00€,0,1,1,0,0,2,0,\r\n'
                          'Mr Dupont,2,79.00€,1.00€,78.00€,2,1,0,1,1,1,1,First reservation\r\n')
 
+    def test_after_login__other_formats(self):
+        c = Client()
+        c.force_login(self.user)
+        response = c.get(self.test_url + "?format=jsonl", follow=False)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="reservations.jsonl"')
+        first = json.loads(response.getvalue().decode('utf8').splitlines()[0])
+        self.assertEqual((first["Nom"], first["Places"], first["Valeur"], first["Croquettes"], first["Commentaire"]),
+                         ("Priv Ate", 1, 22.0, 1, "th¡rd"))
+        response = c.get(self.test_url + "?format=xlsx", follow=False)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="reservations.xlsx"')
+        with zipfile.ZipFile(io.BytesIO(response.getvalue())) as archive:
+            self.assertIn("Mme Lara Croft", archive.read("xl/worksheets/sheet1.xml").decode('utf8'))
+        self.assertEqual(c.get(self.test_url + "?format=doc", follow=False).status_code, 404)
+
+    def test_after_login__query_count_does_not_depend_on_reservation_count(self):
+        c = Client()
+        c.force_login(self.user)
+        with CaptureQueriesContext(connection) as before:
+            c.get(self.test_url, follow=False).getvalue()
+        choice = self.event.choice_set.first()
+        for idx in range(10):
+            reservation = Reservation(last_name=f"Doe {idx}", email="doe@yopmail.fr", accepts_rgpd_reuse=False,
+                                      total_due_in_cents=1500, places=1, event=self.event, bank_id=f"0990{idx:08}")
+            reservation.save()
+            for item in choice.item_set.all():
+                ReservationItemCount(reservation=reservation, choice=choice, item=item, count=1).save()
+        with CaptureQueriesContext(connection) as after:
+            content = c.get(self.test_url, follow=False).getvalue()
+        self.assertEqual(content.decode('utf8').count('\r\n'), 1 + 3 + 10)
+        self.assertEqual(len(after.captured_queries), len(before.captured_queries))
+
 
 class ReservationFormViewTests(TestCase):
     event: Event
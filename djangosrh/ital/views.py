@@ -1,4 +1,4 @@
-import csv
+from collections import defaultdict
 from datetime import UTC, date, datetime, timedelta
 import itertools
 import time
@@ -11,20 +11,20 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import login_required
 from django.core.mail import EmailMultiAlternatives
 from django.db.models import Exists, OuterRef, Prefetch, QuerySet, Subquery, Sum, IntegerField, CharField
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.utils import html
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import conditional_page
 from django.views.generic import ListView
 
-import qrcode
-from qrcode.image.svg import SvgPathFillImage
 
-from core.banking import cents_to_euros, format_bank_id, generate_payment_QR_code_content
+from core.banking import format_bank_id
+from core.exports import EXPORT_FORMATS, reservation_table, streaming_export_response
 
-from core.models import Payment, ReservationPayment, get_reservations_with_likely_payments
-from core.views import aux_send_payment_reception_confirmation
+from core.models import Payment, ReservationPayment, attach_likely_payments
+from core.views import aux_page_qrcode, aux_payment_qrcode, aux_send_payment_reception_confirmation
 from .forms import ItemTicketsGenerationForm, ReservationForm
 from .models import Choice, DishType, Event, Item, Reservation, ReservationItemCount
 from .templatetags.currency_filter import plural
@@ -33,6 +33,7 @@ def index(request):
     return render(request, "ital/index.html")
 
 
+@conditional_page
 def show_reservation(request, uuid: str) -> HttpResponse:
     reservation = get_object_or_404(Reservation, uuid=uuid)
     items: list[dict[str, str|int]] = [
@@ -43,26 +44,19 @@ def show_reservation(request, uuid: str) -> HttpResponse:
         .values("item__dish", "item__display_text", "item__display_text_plural")
         .annotate(total_count=Sum("count", default=0))
     ]
-    remaining_due = (
-        reservation.total_due_in_cents -
-        reservation.reservationpayment_set.aggregate(
-            Sum("payment__amount_in_cents", default=0))['payment__amount_in_cents__sum'])
+    remaining_due = reservation.remaining_due_in_cents
     return render(request, "ital/show_reservation.html", {
         "reservation": reservation,
         "remaining_amount_due_in_cents": remaining_due,
-        "items": items,
-        "payment_qrcode": qrcode.make(
-            generate_payment_QR_code_content(
-                remaining_due,
-                bank_id=reservation.bank_id,
-                bank_account=reservation.event.bank_account,
-                organizer_bic=reservation.event.organizer_bic,
-                organizer_name=reservation.event.organizer_name),
-            image_factory=SvgPathFillImage
-        ).to_string().decode('utf8'),
-        "page_qrcode": qrcode.make(
-            request.build_absolute_uri(), image_factory=SvgPathFillImage
-        ).to_string().decode('utf8')})
+        "items": items})
+
+
+def payment_qrcode(request, uuid: str, fmt: str) -> HttpResponse:
+    return aux_payment_qrcode(request, uuid, fmt)
+
+
+def page_qrcode(request, uuid: str, fmt: str) -> HttpResponse:
+    return aux_page_qrcode(request, uuid, fmt, "ital:show_reservation")
 
 
 class ReservationListView(LoginRequiredMixin, ListView):
@@ -81,14 +75,16 @@ class ReservationListView(LoginRequiredMixin, ListView):
         self.event_id = None if self.event is None else self.event.id
 
     def get_queryset(self):
-        return get_reservations_with_likely_payments(
-            date(2025, 2, 12)
-            if self.event is None else
-            (self.event.date - timedelta(days=90)),
-            Reservation.objects.filter(event_id=self.event_id).order_by("id"))
+        return Reservation.objects.filter(event_id=self.event_id).order_by("id")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # One lookup of the likely payments of the whole page
+        attach_likely_payments(
+            context["object_list"],
+            date(2025, 2, 12)
+            if self.event is None else
+            (self.event.date - timedelta(days=90)))
         if self.event is not None:
             context["event"] = self.event
             context["total_count"] = self.event.occupied_seats()
@@ -118,7 +114,7 @@ def reservation_form(request, event_id: int) -> HttpResponse:
         pass
 
     event = get_object_or_404(Event, pk=event_id)
-    if event.disabled or event.occupied_seats() >= event.max_seats:
+    if event.disabled or event.reserved_seats >= event.max_seats:
         return render(request, "ital/event_disabled.html", context={"event": event})
 
     if request.method == "POST":
@@ -173,9 +169,28 @@ def render_generated_tickets(request, form: ItemTicketsGenerationForm) -> HttpRe
 
 
 def create_full_ticket_list(form: ItemTicketsGenerationForm) -> Iterator[Any]:
+    """Tickets of each reservation of the event then the remaining tickets
+
+    Reads the item counts of all reservations at once rather than once per
+    reservation."""
     dish_names = {DishType.DT0STARTER: "Entrée", DishType.DT1MAIN: "Plat", DishType.DT2DESSERT: "Dessert"}
+    items_by_reservation: defaultdict[int, list[dict[str, Any]]] = defaultdict(list)
+    for itm in (ReservationItemCount.objects
+                .filter(reservation__event_id=form.event.id)
+                .order_by("reservation_id", "item__dish", "item_id")
+                .values(
+                    "reservation_id",
+                    "item_id",
+                    "item__short_text",
+                    "item__display_text",
+                    "item__display_text_plural",
+                    "item__image",
+                    "item__dish",
+                )
+                .annotate(total_count=Sum("count"))):
+        items_by_reservation[itm.pop("reservation_id")].append(itm)
     for r in form.event.reservation_set.order_by("last_name", "first_name"):
-        if not (tickets := create_tickets_for_one_reservation(r)):
+        if not (tickets := create_tickets(items_by_reservation[r.id])):
             continue
         for itm in tickets["items"]:
             form.decrease_item_count(itm["item_id"], itm["total_count"])
@@ -185,6 +200,7 @@ def create_full_ticket_list(form: ItemTicketsGenerationForm) -> Iterator[Any]:
         yield tickets
     if all(cnt <= 0 for cnt in form.data.values()):
         return
+    items = Item.objects.in_bulk([val.id for key, val in form.reference_data.items() if form.data[key] > 0])
     yield {
         "reservation": {
             "no_amount_due": True,
@@ -198,28 +214,17 @@ def create_full_ticket_list(form: ItemTicketsGenerationForm) -> Iterator[Any]:
         "items": list(itertools.chain(*(itertools.repeat(
             {
             "item_id": val.id,
-            "item__short_text": (itm := Item.objects.get(pk=val.id)).short_text,
+            "item__short_text": (itm := items[val.id]).short_text,
             "item__display_text": itm.display_text,
             "item__display_text_plural": itm.display_text_plural,
             "item__image": itm.image,
             "item__dish": dish_names[itm.dish],
-            }, form.data[key]) for key, val in form.reference_data.items()))),
+            }, form.data[key]) for key, val in form.reference_data.items() if form.data[key] > 0))),
     }
 
 
-def create_tickets_for_one_reservation(r: Reservation) -> dict[str, int | str | list[dict[str, int | str]]]:
-    items = list(
-        r.reservationitemcount_set.order_by('item__dish', 'item_id')
-        .values(
-            "item_id",
-            "item__short_text",
-            "item__display_text",
-            "item__display_text_plural",
-            "item__image",
-            "item__dish",
-        )
-        .annotate(total_count=Sum("count"))
-    )
+def create_tickets(items: list[dict[str, Any]]) -> dict[str, int | str | list[dict[str, int | str]]]:
+    "Tickets of one reservation, given its item counts"
     return {
         'total_tickets': total_tickets,
         'ticket_details': ', '.join(
@@ -230,28 +235,15 @@ def create_tickets_for_one_reservation(r: Reservation) -> dict[str, int | str |
 
 
 @login_required
-def export_csv(request, event_id: int) -> HttpResponse:
+def export_csv(request, event_id: int) -> HttpResponse | StreamingHttpResponse:
+    "Export the reservations, as CSV unless another of the EXPORT_FORMATS is requested with ?format="
+    if (fmt := EXPORT_FORMATS.get(request.GET.get("format", "csv"))) is None:
+        raise Http404(f"Unknown export format {request.GET['format']!r}.")
     event = get_object_or_404(Event, pk=event_id)
     if event.disabled:
         return render(request, "ital/event_disabled.html", context={"event": event})
-    reservation_items = event.reservation_items()
-    response = HttpResponse(
-        content_type="text/csv",
-        headers={"Content-Disposition": 'attachment; filename="reservations.csv"'},
-    )
-    writer = csv.writer(response)
-    writer.writerow(["Nom", "Places", "Valeur", "Déjà payé", "Restant dû", *(
-        itm.column_header for itm in reservation_items), "Commentaire"])
-    # N+1 queries, so what... I won't have that many reservations anyway.
-    for res in event.reservation_set.order_by('last_name', 'first_name'):
-        total_due = res.total_due_in_cents
-        remaining = res.remaining_amount_due_in_cents()
-        writer.writerow([
-            res.full_name,
-            str(res.places),
-            cents_to_euros(total_due),
-            cents_to_euros(total_due - remaining),
-            cents_to_euros(remaining),
-            *(res.count_items(item) for item in reservation_items),
-            res.extra_comment.strip()])
-    return response
+    return streaming_export_response(
+        reservation_table(event.reservation_set.order_by('last_name', 'first_name'),
+                          "reservationitemcount", "item", event.reservation_items(), str.strip),
+        fmt,
+        "reservations")